@@ -0,0 +1,361 @@
+"""
+Agregações pré-calculadas sobre o modelo estrela (dataset.CarbonDataset).
+
+São construídas uma vez, na carga dos dados, para que as seções do painel
+leiam resultados prontos em vez de varrer a tabela fato a cada interação.
+"""
+import numpy as np
+import pandas as pd
+
+
+class YearTypeCube:
+    """
+    Cubo de agregados por (implementation_year, project_type). Os créditos
+    de projetos sem ano de implementação (sem data de emissão) ficam fora.
+
+    `cells` tem uma linha por combinação ano/tipo com: número de créditos,
+    projetos distintos, soma, média, mediana (exata), mínimo e máximo do preço
+    e a soma de co2_reduced. `rows` guarda, por ano, as posições dos créditos
+    daquele ano na tabela fato, para as poucas visões que ainda precisam das
+    linhas brutas (ex.: o gráfico de dispersão).
+    """
+
+    def __init__(self, cells, rows):
+        self.cells = cells
+        self.rows = rows
+
+    @property
+    def years(self):
+        """Anos disponíveis, do mais recente para o mais antigo."""
+        return sorted(self.cells.index.get_level_values("implementation_year").unique(), reverse=True)
+
+    def merge(self, other):
+        """
+        Substitui as células (e as posições, se houver) dos anos presentes em
+        `other`, um cubo recalculado só para esses anos depois de um acréscimo
+        de créditos. Os atributos são trocados de uma vez, sem alterar os
+        objetos que outras sessões possam estar lendo.
+        """
+        years = other.cells.index.get_level_values("implementation_year").unique()
+        keep = ~self.cells.index.get_level_values("implementation_year").isin(years)
+        self.cells = pd.concat([self.cells[keep], other.cells]).sort_index()
+        if self.rows is not None and other.rows is not None:
+            self.rows = {**self.rows, **other.rows}
+        return self
+
+    def year_cells(self, year):
+        """Linhas do cubo de um ano, indexadas por project_type."""
+        return self.cells.xs(year, level="implementation_year")
+
+    def year_summary(self, year):
+        """Métricas do ano inteiro, combinadas a partir das células do cubo."""
+        cells = self.year_cells(year)
+        credit_count = int(cells["credit_count"].sum())
+        return {
+            "credit_count": credit_count,
+            # Cada projeto tem um único tipo, então os distintos somam sem repetição
+            "project_count": int(cells["project_count"].sum()),
+            "price_mean": cells["price_sum"].sum() / credit_count if credit_count else float("nan"),
+            "co2_sum": int(cells["co2_sum"].sum()),
+        }
+
+
+def build_year_type_cube(carbon_data, years=None, project_mask=None):
+    """
+    Constrói o YearTypeCube a partir da tabela fato e da dimensão de projetos.
+    Com `years`, só os créditos desses anos entram (ver YearTypeCube.merge);
+    com `project_mask` (máscara booleana sobre project_key), só os créditos
+    dos projetos selecionados.
+    """
+    projects = carbon_data.projects
+    credits = carbon_data.credits
+    keys = credits["project_key"].to_numpy()
+    price = credits["price"].to_numpy()
+    known_year = projects["implementation_year"].notna().to_numpy()
+    # O 0 dos anos nulos nunca é lido: esses créditos saem pela seleção abaixo
+    project_years = projects["implementation_year"].to_numpy(dtype="int16", na_value=0)
+    positions = None
+    if years is not None or project_mask is not None or not known_year.all():
+        selected = known_year[keys]
+        if years is not None:
+            selected &= np.isin(project_years[keys], list(years))
+        if project_mask is not None:
+            selected &= np.asarray(project_mask)[keys]
+        positions = np.flatnonzero(selected)
+        keys, price = keys[positions], price[positions]
+
+    rows = pd.DataFrame({
+        "implementation_year": project_years[keys],
+        "project_type": projects["project_type"].to_numpy()[keys],
+        "project_key": keys,
+        "price": price,
+        "co2_reduced": projects["co2_reduced"].to_numpy()[keys],
+    })
+
+    grouped = rows.groupby(["implementation_year", "project_type"], sort=True)
+    cells = grouped["price"].agg(["count", "sum", "mean", "median", "min", "max"]).rename(columns={
+        "count": "credit_count", "sum": "price_sum", "mean": "price_mean",
+        "median": "price_median", "min": "price_min", "max": "price_max",
+    })
+    cells["project_count"] = grouped["project_key"].nunique()
+    cells["co2_sum"] = grouped["co2_reduced"].sum()
+
+    # Posições dos créditos de cada ano na tabela fato (ordenação estável)
+    order = np.argsort(rows["implementation_year"].to_numpy(), kind="stable")
+    years_sorted = rows["implementation_year"].to_numpy()[order]
+    boundaries = np.flatnonzero(np.diff(years_sorted)) + 1
+    year_rows = {
+        int(group[0]): year_order if positions is None else positions[year_order]
+        for group, year_order in zip(np.split(years_sorted, boundaries), np.split(order, boundaries))
+        if len(group)
+    }
+    return YearTypeCube(cells, year_rows)
+
+
+class TimeSeriesStore:
+    """
+    Séries temporais pré-agregadas das transações de crédito.
+
+    Mantém dois rollups, diário e mensal, por (período, project_type, country,
+    registry) com: volume total, soma dos preços, valor (preço × volume, para o
+    preço médio ponderado por volume) e número de transações. Novas linhas de
+    crédito entram por `append`, que agrega só as linhas novas e as soma aos
+    rollups existentes, sem reprocessar o histórico.
+    """
+
+    DIMENSIONS = ["project_type", "country", "registry"]
+    MEASURES = ["volume", "price_sum", "value", "trades"]
+
+    def __init__(self, daily, monthly):
+        self.daily = daily
+        self.monthly = monthly
+
+    @classmethod
+    def empty(cls):
+        columns = ["transaction_date", *cls.DIMENSIONS, *cls.MEASURES]
+        return cls(pd.DataFrame(columns=columns), pd.DataFrame(columns=columns))
+
+    @classmethod
+    def from_daily(cls, daily):
+        """Monta o store a partir de um rollup diário já agregado (ex.: pelo query_engine)."""
+        monthly = daily.assign(transaction_date=(daily["transaction_date"] + pd.offsets.MonthEnd(0)).dt.floor("D"))
+        return cls(daily, cls._combine(monthly))
+
+    @classmethod
+    def _rollup(cls, rows, freq):
+        """Agrega linhas de crédito (já com as dimensões) por período."""
+        dates = rows["transaction_date"]
+        if freq == "D":
+            period = dates.dt.floor("D")
+        else:
+            # Mesmo rótulo do resample("M"): último dia do mês
+            period = dates + pd.offsets.MonthEnd(0)
+            period = period.dt.floor("D")
+        frame = pd.DataFrame({
+            "transaction_date": period,
+            **{dim: rows[dim] for dim in cls.DIMENSIONS},
+            "volume": rows["volume"].astype("int64"),
+            "price_sum": rows["price"].astype("float64"),
+            "value": rows["price"].astype("float64") * rows["volume"],
+            "trades": 1,
+        })
+        return cls._combine(frame)
+
+    @classmethod
+    def _combine(cls, frame):
+        keys = ["transaction_date", *cls.DIMENSIONS]
+        return frame.groupby(keys, sort=True, observed=True, dropna=True)[cls.MEASURES].sum().reset_index()
+
+    def append(self, rows):
+        """
+        Incorpora novas linhas de crédito. `rows` precisa das colunas
+        transaction_date, volume, price e das dimensões (ver credit_rows).
+        Só as linhas novas são agregadas; os períodos já existentes recebem a
+        soma das medidas novas.
+        """
+        for name in ("daily", "monthly"):
+            new = self._rollup(rows, "D" if name == "daily" else "M")
+            current = getattr(self, name)
+            combined = new if current.empty else self._combine(pd.concat([current, new], ignore_index=True))
+            setattr(self, name, combined)
+        return self
+
+    def series(self, freq="M", start=None, end=None, **filters):
+        """
+        Série contínua (todos os períodos entre o primeiro e o último) com
+        volume, preço médio, preço médio ponderado por volume (vwap) e número
+        de transações, opcionalmente filtrada por intervalo de datas e pelas
+        dimensões (ex.: country="Brazil" ou project_type=[...]).
+        """
+        store = self.daily if freq == "D" else self.monthly
+        if store.empty:
+            return pd.DataFrame(columns=["transaction_date", "volume", "price", "vwap", "trades"])
+
+        mask = np.ones(len(store), dtype=bool)
+        for dim, value in filters.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= store[dim].isin(values).to_numpy()
+        totals = store[mask].groupby("transaction_date")[self.MEASURES].sum()
+
+        periods = pd.date_range(store["transaction_date"].min(), store["transaction_date"].max(),
+                                freq="D" if freq == "D" else "ME")
+        totals = totals.reindex(periods, fill_value=0)
+        totals.index.name = "transaction_date"
+
+        series = pd.DataFrame({
+            "volume": totals["volume"],
+            "price": totals["price_sum"] / totals["trades"].replace(0, np.nan),
+            "vwap": totals["value"] / totals["volume"].replace(0, np.nan),
+            "trades": totals["trades"],
+        }).reset_index()
+
+        if start is not None:
+            series = series[series["transaction_date"].dt.date >= start]
+        if end is not None:
+            series = series[series["transaction_date"].dt.date <= end]
+        return series
+
+
+def credit_rows(carbon_data, rows=None):
+    """Linhas de crédito com as colunas e dimensões usadas pelo TimeSeriesStore."""
+    return carbon_data.credit_view(["transaction_date", "volume", "price", *TimeSeriesStore.DIMENSIONS], rows=rows)
+
+
+def build_time_series(carbon_data, project_mask=None):
+    """
+    Constrói o TimeSeriesStore (só dos créditos dos projetos em
+    `project_mask`, se dada), ou None se os créditos não tiverem datas.
+    """
+    if "transaction_date" not in carbon_data.credits.columns:
+        return None
+    rows = carbon_data.credit_mask(project_mask) if project_mask is not None else None
+    return TimeSeriesStore.empty().append(credit_rows(carbon_data, rows=rows))
+
+
+class ProjectMetrics:
+    """
+    Métricas da atividade de crédito de cada projeto, indexadas por
+    project_key: número de transações, volume (total, emitido e aposentado),
+    soma e soma dos quadrados dos preços e as datas da primeira e da última
+    transação.
+
+    São somas, mínimos e máximos por projeto: créditos novos entram por
+    `merge`, com as métricas só das linhas novas. `table()` deriva o preço
+    médio e a taxa de aposentadoria.
+    """
+
+    SUMS = ["transaction_count", "volume", "issued_volume", "retired_volume", "price_sum", "price_sq_sum"]
+    DATES = ["first_transaction", "last_transaction"]
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __len__(self):
+        return len(self.stats)
+
+    @classmethod
+    def from_stats(cls, stats):
+        """
+        Normaliza somas e datas já agregadas (ex.: pelo DuckDB), indexadas
+        por project_key. Colunas ausentes (créditos sem tipo ou sem data)
+        ficam nulas.
+        """
+        stats = stats.copy()
+        for column in cls.SUMS:
+            if column not in stats.columns:
+                stats[column] = np.nan
+        for column in cls.DATES:
+            stats[column] = stats[column] if column in stats.columns else pd.NaT
+            stats[column] = stats[column].astype("datetime64[ns, UTC]")
+        stats["transaction_count"] = stats["transaction_count"].astype("int64")
+        return cls(stats[cls.SUMS + cls.DATES])
+
+    @classmethod
+    def from_credits(cls, credits, size):
+        """Métricas das linhas de `credits` para os projetos 0..size-1, agregadas sem laço por projeto."""
+        keys = credits["project_key"].to_numpy()
+        volume = credits["volume"].fillna(0).to_numpy(dtype="float64")
+        prices = credits["price"].fillna(0).to_numpy(dtype="float64")
+        stats = pd.DataFrame({
+            "transaction_count": np.bincount(keys, minlength=size),
+            "volume": np.bincount(keys, weights=volume, minlength=size),
+            "price_sum": np.bincount(keys, weights=prices, minlength=size),
+            "price_sq_sum": np.bincount(keys, weights=prices ** 2, minlength=size),
+        }, index=pd.RangeIndex(size, name="project_key"))
+        if "transaction_type" in credits.columns:
+            for column, label in (("issued_volume", "issuance"), ("retired_volume", "retirement")):
+                selected = (credits["transaction_type"] == label).to_numpy(dtype=bool)
+                stats[column] = np.bincount(keys, weights=volume * selected, minlength=size)
+        if "transaction_date" in credits.columns:
+            for column in cls.DATES:
+                stats[column] = pd.Series(pd.NaT, index=stats.index, dtype="datetime64[ns, UTC]")
+            if len(credits):
+                dates = credits["transaction_date"].groupby(keys).agg(["min", "max"])
+                stats.loc[dates.index, "first_transaction"] = dates["min"].to_numpy()
+                stats.loc[dates.index, "last_transaction"] = dates["max"].to_numpy()
+        return cls.from_stats(stats)
+
+    def merge(self, other):
+        """
+        Soma as métricas de `other` (das linhas novas) às atuais; projetos
+        novos entram no fim. A tabela é trocada de uma vez, sem alterar o
+        objeto que outras sessões possam estar lendo.
+        """
+        index = max(self.stats.index, other.stats.index, key=len)
+        current, new = self.stats.reindex(index), other.stats.reindex(index)
+        stats = current[self.SUMS].add(new[self.SUMS], fill_value=0)
+        stats["first_transaction"] = pd.concat([current["first_transaction"], new["first_transaction"]], axis=1).min(axis=1)
+        stats["last_transaction"] = pd.concat([current["last_transaction"], new["last_transaction"]], axis=1).max(axis=1)
+        self.stats = self.from_stats(stats).stats
+        return self
+
+    def table(self):
+        """
+        Tabela por project_key: transaction_count, volume, issued_volume,
+        retired_volume, first_transaction, last_transaction, price_mean
+        (média dos preços das transações) e retirement_ratio (volume
+        aposentado sobre o emitido; nulo sem emissão).
+        """
+        stats = self.stats
+        return stats.drop(columns=["price_sum", "price_sq_sum"]).assign(
+            price_mean=stats["price_sum"] / stats["transaction_count"].where(stats["transaction_count"] > 0),
+            retirement_ratio=stats["retired_volume"] / stats["issued_volume"].where(stats["issued_volume"] > 0),
+        )
+
+    def price_stats(self):
+        """(transações, soma dos preços, soma dos quadrados) por project_key, para o pricing_model."""
+        return tuple(self.stats[column].to_numpy(dtype="float64")
+                     for column in ("transaction_count", "price_sum", "price_sq_sum"))
+
+    def overview(self, projects, project_mask=None):
+        """Projetos com créditos, CO₂ somado uma vez por transação, volume transacionado e países envolvidos."""
+        counts = self.stats["transaction_count"].to_numpy()
+        traded = counts > 0
+        if project_mask is not None:
+            traded = traded & project_mask
+        return {
+            "project_count": int(traded.sum()),
+            "co2_sum": int((projects["co2_reduced"].to_numpy() * counts)[traded].sum()),
+            "volume": int(self.stats["volume"].to_numpy()[traded].sum()),
+            "country_count": projects.loc[traded, "country"].nunique(),
+        }
+
+
+def build_project_metrics(carbon_data):
+    """ProjectMetrics de todos os créditos do dataset."""
+    return ProjectMetrics.from_credits(carbon_data.credits, len(carbon_data.projects))
+
+
+def project_features(projects, metrics):
+    """
+    Dimensão de projetos com as colunas de `metrics` (ProjectMetrics.table()),
+    pelo project_key. Onde falta alguma das datas do projeto, a
+    project_duration vem das transações: da emissão (ou da primeira
+    transação) até a primeira aposentadoria (ou a última transação).
+    """
+    features = projects.join(metrics.reindex(projects["project_key"].to_numpy()).set_axis(projects.index))
+    start = features["first_issuance_at"].fillna(features["first_transaction"])
+    end = features["first_retirement_at"].fillna(features["last_transaction"])
+    observed = np.trunc((end - start).dt.days / 365.25).clip(lower=0).astype("Int16")
+    features["project_duration"] = features["project_duration"].fillna(observed)
+    return features
@@ -1,19 +1,29 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from sklearn.cluster import KMeans
+import numpy as np
 from streamlit_option_menu import option_menu
 
-import json
-import folium
-from streamlit_folium import st_folium
-import copy
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
+import figure_cache
+import filters
+import profiling
+import resources
+import warmup
+
+# Copy-on-Write do pandas em todo o processo do painel: seleções e cópias
+# rasas das tabelas compartilhadas (dataset.CarbonDataset) só copiam os dados
+# se forem modificadas, e a modificação nunca chega à tabela original
+pd.set_option("mode.copy_on_write", True)
+
+# Bibliotecas pesadas (plotly, folium, scikit-learn, scipy) são importadas
+# só na seção que as usa; depois da primeira renderização, o warmup.py as
+# importa em segundo plano e pré-calcula os recursos de todas as seções.
 
 # --- Configuração da Página --- #
 st.set_page_config(layout="wide")
 
+# Instrumentação opcional (PAINEL_PROFILING=1 ou seção de administração em ?admin=1)
+profiling.begin_run()
+
 st.markdown("""
 <style>
 /* Aumenta o tamanho da fonte de todo o aplicativo */
@@ -26,116 +36,129 @@ html, body, [class*="st-"], .st-emotion-cache-1jicfl2 {
 import streamlit as st
 import pandas as pd
 
-# Esta função deve estar no seu arquivo app.py
-@st.cache_data
+@profiling.cache_resource()
 def load_data():
     """
-    Carrega, processa, padroniza, traduz e une os dados de projetos e créditos.
-    Esta função é cacheada, então todo este processamento pesado
-    ocorre apenas uma vez.
+    Carrega, processa, padroniza e traduz os dados de projetos e créditos e
+    abre o motor de consultas sobre eles (query_engine: DuckDB sobre Parquet,
+    ou o modelo estrela em memória com o pandas). As seções pedem ao motor
+    resultados já filtrados e agregados, em vez de varrer as tabelas.
+    Esta função é cacheada como recurso: todas as sessões recebem o mesmo
+    objeto, sem cópias a cada rerun, e o processamento pesado ocorre apenas
+    uma vez por processo; entre reinícios do servidor o data_loader
+    reaproveita as tabelas gravadas em disco.
     """
     try:
-        # Carrega os dados brutos
-        projects_df = pd.read_csv("projects.csv")
-        credits_df = pd.read_csv("credits.csv")
+        return resources.engine()
     except FileNotFoundError:
         st.error("Erro: Verifique se os arquivos 'projects.csv' e 'credits.csv' estão no diretório correto.")
         st.stop()
 
-    # --- 1. Padronização dos Nomes dos Países (para o Folium) ---
-    names_to_review = {
-        'United States': 'United States of America',
-        'Congo, The Democratic Republic of the': 'Democratic Republic of the Congo',
-        'Tanzania, United Republic of': 'United Republic of Tanzania',
-        "Lao People's Democratic Republic": 'Laos',
-        'Viet Nam': 'Vietnam',
-        'Korea, Republic of': 'South Korea'
-    }
-    projects_df['country'] = projects_df['country'].replace(names_to_review)
-    
-    # --- 2. Processamento de projects_df ---
-    # Correção de fuso horário: Padroniza para UTC
-    projects_df["first_issuance_at"] = pd.to_datetime(projects_df["first_issuance_at"], errors="coerce", utc=True)
-    projects_df["first_retirement_at"] = pd.to_datetime(projects_df["first_retirement_at"], errors="coerce", utc=True)
-    projects_df["first_issuance_at"] = projects_df["first_issuance_at"].fillna(pd.Timestamp("1900-01-01", tz='UTC'))
-    projects_df["first_retirement_at"] = projects_df["first_retirement_at"].fillna(pd.Timestamp.now(tz='UTC'))
-
-    # Criação de colunas calculadas
-    projects_df["implementation_year"] = projects_df["first_issuance_at"].dt.year.fillna(0).astype(int)
-    projects_df["project_duration"] = (projects_df["first_retirement_at"] - projects_df["first_issuance_at"]).dt.days / 365.25
-    projects_df["project_duration"] = projects_df["project_duration"].fillna(1).astype(int)
-    projects_df["co2_reduced"] = projects_df["issued"].fillna(0) * 1000
-
-    # --- 3. Processamento de credits_df ---
-    credits_df = credits_df.rename(columns={"quantity": "volume"})
-    if "volume" in credits_df.columns:
-        credits_df["price"] = credits_df["volume"] * 0.1 + 5 + (credits_df.index % 100) / 100
-    else:
-        credits_df["volume"] = 100 # Valor de exemplo
-        credits_df["price"] = credits_df["volume"] * 0.1 + 5 + (credits_df.index % 100) / 100
+# --- Gráficos em Cache para Performance --- #
+# As figuras ficam serializadas no figure_cache, com chaves curtas (seção,
+# gráfico, versão dos dados, filtros): um acerto não faz hash de DataFrames
+# nem reconstrói a figura. Use resources.figure(...) e figure_cache.plotly_chart.
 
-    # --- 4. Otimização Principal: Unir os DataFrames ---
-    merged_df = pd.merge(projects_df, credits_df, on="project_id", how="inner")
-    
-    # --- 5. Tradução dos Tipos de Projeto ---
-    translation_map = {
-        'Afforestation + Reforestation': 'Florestamento e Reflorestamento',
-        'Avoided Grassland Conversion': 'Conversão de Pastagem Evitada',
-        'Biomass': 'Biomassa',
-        'Centralized Solar': 'Energia Solar Centralizada',
-        'Clean Water': 'Água Limpa',
-        'Compost': 'Compostagem',
-        'Cookstove': 'Fogões Eficientes',
-        'Distributed Solar': 'Energia Solar Distribuída',
-        'Energy Efficiency': 'Eficiência Energética',
-        'Landfill': 'Aterro Sanitário',
-        'Waste Diversion': 'Desvio de Resíduos',
-        'Renewable Energy': 'Energia Renovável',
-        'Advanced Refrigerant': 'Refrigerante Avançado',
-        'Manure Bodigester': 'Biodigestor de Esterco',
-        'Road Construction': 'Construção de Estradas',
-        'Gas Leak Repair': 'Reparo de Vazamento de Gás',
-        'Wind': 'Energia Eólica'
-        # Adicione outras traduções conforme encontrar novos tipos de projeto
-    }
-    # Cria uma nova coluna com os nomes traduzidos
-    merged_df['project_type_pt'] = merged_df['project_type'].map(translation_map).fillna(merged_df['project_type'])
-
-    return projects_df, credits_df, merged_df
-
-# --- Funções de Gráfico em Cache para Performance --- #
-@st.cache_data
-def generate_histogram(df, project_type):
-    """Gera o histograma de contagem de projetos. Cacheado."""
-    return px.histogram(df, x=project_type, title="Contagem de Projetos por Tipo")
-
-@st.cache_data
-def generate_boxplot(df, project_type, price):
-    """Gera o boxplot de distribuição de preços. Cacheado."""
-    return px.box(df, x=project_type, y=price, title="Distribuição de Preços por Tipo de Projeto")
-
-@st.cache_data
-def generate_scatter_plot(df, x_axis, y_axis, color, hover_data):
-    """Gera o gráfico de dispersão. Cacheado."""
-    return px.scatter(df, x=x_axis, y=y_axis, color=color,
-                      hover_data=hover_data,
-                      title="Volume de CO₂ Reduzido vs. Preço do Crédito")
-
-# Carrega os dados uma vez no início
-projects_df, credits_df, merged_df = load_data()
-
-# Função em cache para carregar o GeoJSON
-@st.cache_data
-def load_geojson():
+@profiling.cache_resource()
+def load_year_scatter(year):
+    """Índice de LOD (densidade + amostra estratificada) dos créditos de um ano. Cacheado."""
+    return resources.year_scatter(year)
+
+def lod_zoom_controls(lod, key, x_label, y_label):
+    """
+    Controles de zoom de um gráfico com LOD: cada intervalo mais estreito
+    recalcula a densidade e a amostra só com os pontos visíveis.
+    """
+    x_min, x_max, y_min, y_max = lod.bounds()
+    col_x, col_y = st.columns(2)
+    x_range = col_x.slider(f"Intervalo de {x_label}", x_min, x_max, (x_min, x_max), key=f"{key}_x") if x_max > x_min else None
+    y_range = col_y.slider(f"Intervalo de {y_label}", y_min, y_max, (y_min, y_max), key=f"{key}_y") if y_max > y_min else None
+    show_density = st.checkbox("Mostrar mapa de densidade", value=True, key=f"{key}_density")
+    return x_range, y_range, show_density
+
+def lod_meta(view):
+    """Contagens de uma visão com LOD guardadas junto com a figura em cache."""
+    return {"shown": len(view.positions), "total": view.total}
+
+def lod_caption(meta):
+    if meta["shown"] < meta["total"]:
+        st.info(f"Para garantir a performance, o gráfico mostra {meta['shown']:,} de {meta['total']:,} pontos "
+                "(amostra estratificada por grupo, incluindo os extremos); o fundo mostra a densidade de todos eles. "
+                "Reduza os intervalos para ver mais detalhes.")
+
+@profiling.cache_resource()
+def load_year_cube():
+    """Cubo de agregados por ano/tipo, construído uma vez na carga dos dados."""
+    return resources.year_cube()
+
+@profiling.cache_resource()
+def load_time_series():
+    """Rollups diário e mensal das transações, construídos uma vez na carga dos dados."""
+    return resources.time_series()
+
+@profiling.cache_resource()
+def load_pricing_model():
+    """Modelo OLS de preços, ajustado uma vez por processo."""
+    return resources.pricing()
+
+@profiling.cache_resource()
+def load_segmentation_engine():
+    """Modelos de segmentação compartilhados entre as sessões."""
+    return resources.segmentation_engine()
+
+# Função em cache para carregar o GeoJSON já simplificado e com as métricas por
+# país (compartilhado, somente leitura)
+@profiling.cache_resource()
+def load_geo_layers():
+    load_data()
     try:
-        with open('countries.geo.json') as f:
-            return json.load(f)
+        return resources.geo_layer_cache()
     except FileNotFoundError:
         st.error("Arquivo 'countries.geo.json' não encontrado. Por favor, adicione-o à pasta do projeto para visualizar o mapa.")
         return None
 
-# Carregue o geojson uma vez
-geojson_data_cached = load_geojson()
+@profiling.cache_resource()
+def load_facet_index():
+    """Bitmaps por valor de cada faceta dos projetos, usados pelos filtros globais."""
+    load_data()
+    return resources.facet_index()
+
+@profiling.cache_resource()
+def load_protocol_index():
+    """Índice invertido metodologia -> projetos, a partir da coluna `protocol` interpretada uma vez."""
+    load_data()
+    return resources.protocol_index()
+
+@profiling.cache_resource()
+def load_project_search():
+    """Índice invertido de tokens (com busca por prefixo) sobre nome, proponente e ID dos projetos."""
+    load_data()
+    return resources.project_search()
+
+@profiling.cache_resource()
+def load_emission_factors():
+    """Tabela de fatores de emissão por atividade (emission_factors.csv)."""
+    import emissions
+
+    try:
+        return emissions.load_factors()
+    except (FileNotFoundError, ValueError) as error:
+        st.error(f"Erro ao ler a tabela de fatores de emissão: {error}")
+        st.stop()
+
+# Linhas acrescentadas aos CSVs entram de forma incremental (resources.refresh),
+# só depois do pré-aquecimento, para não competir com ele
+if warmup.finished():
+    data_refresh = resources.refresh()
+    if data_refresh == "completa":
+        st.cache_resource.clear()
+    elif data_refresh == "incremental":
+        load_year_scatter.clear()
+        load_pricing_model.clear()
+        load_facet_index.clear()
+        load_protocol_index.clear()
+        load_project_search.clear()
+        st.toast("Dados atualizados com as novas linhas dos arquivos.")
 
 # Adicione esta função no seu app.py
 
@@ -152,19 +175,127 @@ def formatar_numero(num):
     else:
         return f"{num/1_000_000_000:.1f} bi"
 
+def part_downloads(container, state, name, file_stem, file_format):
+    """
+    Download das partes em `state["parts"]` (número → arquivo e linhas, de
+    export.spool_parts), uma parte por vez: o st.download_button guarda em
+    memória os bytes que recebe, então a memória do download fica limitada a
+    uma parte (export.MAX_DOWNLOAD_ROWS linhas). Com mais de uma parte, um
+    seletor escolhe a parte. A parte baixada é descartada da sessão.
+    """
+    import export
+
+    parts = state["parts"]
+    file_info = export.FORMATS[file_format]
+    if state["part_count"] > 1:
+        container.caption(f"{state['total_rows']:,} linhas, divididas em {state['part_count']} arquivos de até "
+                          f"{export.MAX_DOWNLOAD_ROWS:,} linhas; restam {len(parts)} para baixar.")
+        labels = {
+            number: f"Parte {number} de {state['part_count']}: linhas {part['first_row']:,} a {part['first_row'] + part['rows'] - 1:,}"
+            for number, part in parts.items()
+        }
+        number = container.selectbox("Parte", list(labels), format_func=labels.get, key=f"baixar_{name}_parte")
+        file_name = f"{file_stem}_parte{number}.{file_info['extension']}"
+    else:
+        number = next(iter(parts))
+        file_name = f"{file_stem}.{file_info['extension']}"
+    part = parts[number]
+    part["file"].seek(0)
+    downloaded = container.download_button(
+        f"Baixar {part['rows']:,} linhas ({file_format})", part["file"].read(),
+        file_name=file_name, mime=file_info["mime"], key=f"baixar_{name}_{number}"
+    )
+    if downloaded:
+        part["file"].close()
+        del parts[number]
+        st.rerun()
+
+
+def spooled_parts(chunks, file_format, progress=None):
+    """As partes de export.spool_parts no formato de `part_downloads`."""
+    import export
+
+    parts = {}
+    first_row = 1
+    for number, (file, rows) in enumerate(export.spool_parts(chunks, file_format, progress), start=1):
+        parts[number] = {"file": file, "rows": rows, "first_row": first_row}
+        first_row += rows
+    return parts
+
+
+def close_parts(state):
+    """Fecha (e apaga) os arquivos das partes ainda não baixadas."""
+    for part in state["parts"].values():
+        part["file"].close()
+
+
+def export_controls(key, file_stem, build):
+    """
+    Exportação da seleção atual em CSV ou Parquet. `build()` retorna (número
+    de linhas, iterador de blocos), como resources.credit_export e
+    export.frame_export; os blocos são gravados em arquivos temporários
+    (partes de até export.MAX_DOWNLOAD_ROWS linhas), com uma barra de
+    progresso, só quando o usuário pede. As partes ficam na sessão enquanto
+    `key` (nome, *filtros), o formato e a versão dos dados não mudarem, até
+    serem baixadas.
+    """
+    import export
+
+    name = key[0]
+    col_format, col_action = st.columns([1, 3])
+    file_format = col_format.radio("Formato", list(export.FORMATS), key=f"exportar_{name}_formato", horizontal=True)
+    export_key = (key, file_format, resources.data_version("projects", "credits"))
+    exported = st.session_state.get(f"exportacao_{name}")
+    if exported is not None and (exported["key"] != export_key or not exported["parts"]):
+        close_parts(exported)
+        exported = st.session_state[f"exportacao_{name}"] = None
+
+    if exported is None:
+        if not col_action.button("Gerar arquivo para download", key=f"exportar_{name}"):
+            return
+        total_rows, chunks = build()
+        if not total_rows:
+            col_action.warning("Nenhuma linha para exportar com a seleção atual.")
+            return
+        progress_bar = col_action.progress(0.0, text="Gravando...")
+
+        def progress(rows):
+            progress_bar.progress(min(rows / total_rows, 1.0), text=f"{rows:,} de {total_rows:,} linhas gravadas")
+
+        parts = spooled_parts(chunks, file_format, progress)
+        progress_bar.empty()
+        if not parts:
+            col_action.warning("Nenhuma linha para exportar com a seleção atual.")
+            return
+        exported = st.session_state[f"exportacao_{name}"] = {
+            "key": export_key, "parts": parts, "part_count": len(parts), "total_rows": sum(p["rows"] for p in parts.values()),
+        }
+
+    part_downloads(col_action, exported, name, file_stem, file_format)
+
 # --- 3. SUBSTITUA A SIDEBAR ANTIGA POR ESTA --- #
 
+# Seção de administração (instrumentação): só aparece com ?admin=1 na URL
+show_admin = st.query_params.get("admin") == "1"
+
+# Seções que aplicam os filtros globais; as demais não os mostram
+FILTERED_SECTIONS = {
+    "Introdução", "Exploração dos Dados", "Dinâmica do Mercado", "Segmentação de Projetos",
+    "Metodologias", "Busca de Projetos",
+}
+
 with st.sidebar:
     section = option_menu(
         menu_title="Menu Principal",
         options=[
             "Introdução", "Exploração dos Dados", "Dinâmica do Mercado",
-            "Fatores de Precificação", "Segmentação de Projetos", "Calculadora de Emissões"
-        ],
+            "Fatores de Precificação", "Segmentação de Projetos", "Metodologias", "Busca de Projetos",
+            "Calculadora de Emissões"
+        ] + (["Administração"] if show_admin else []),
         icons=[
             "house-door-fill", "clipboard-data-fill", "graph-up-arrow", "currency-dollar",
-            "diagram-3-fill", "calculator-fill"
-        ],
+            "diagram-3-fill", "journal-text", "search", "calculator-fill"
+        ] + (["speedometer2"] if show_admin else []),
         menu_icon="cast",
         default_index=0,
         styles={
@@ -175,6 +306,31 @@ with st.sidebar:
         }
     )
 
+    # Filtros globais por faceta dos projetos: a mesma seleção vale para as
+    # métricas, o histograma, a dispersão, a série mensal, o mapa e a segmentação.
+    # Só as seções que leem a seleção montam a barra (e carregam os dados)
+    selection = []
+    if section in FILTERED_SECTIONS:
+        facet_index = load_facet_index()
+        with st.expander("Filtros"):
+            for facet, label in filters.FACETS.items():
+                values = st.multiselect(label, facet_index.values[facet], key=f"filtro_{facet}",
+                                        format_func=filters.format_value)
+                if values:
+                    selection.append((facet, tuple(values)))
+            selection = tuple(selection)
+            if selection:
+                st.caption(f"{facet_index.count(selection):,} de {facet_index.size:,} projetos selecionados.")
+    else:
+        selection = ()
+        # Sem os widgets nesta execução, o Streamlit descartaria os valores
+        # escolhidos; regravados, a seleção volta com as seções filtradas
+        for facet in filters.FACETS:
+            if f"filtro_{facet}" in st.session_state:
+                st.session_state[f"filtro_{facet}"] = st.session_state[f"filtro_{facet}"]
+
+section_stage = profiling.enter_stage(f"seção: {section}")
+
 # --- Seção: Introdução (VERSÃO FINAL COM CARDS MODERNOS) --- #
 if section == "Introdução":
 
@@ -209,6 +365,7 @@ if section == "Introdução":
     .value-blue { color: #1f77b4; }
     .value-green { color: #2ca02c; }
     .value-orange { color: #ff7f0e; }
+    .value-purple { color: #9467bd; }
     </style>
     """, unsafe_allow_html=True)
 
@@ -221,11 +378,18 @@ if section == "Introdução":
     st.header("Visão Geral do Conjunto de Dados")
 
     # Calcula as métricas
-    total_projects = merged_df['project_id'].nunique()
-    total_co2_reduced = int(merged_df['co2_reduced'].sum() / 1_000_000)
-    num_countries = merged_df['country'].nunique()
-
-    col1, col2, col3 = st.columns(3, gap="large")
+    # Apenas projetos com créditos; o CO₂ soma uma vez por linha de crédito.
+    # Os números saem da tabela de métricas por projeto, agregada uma vez
+    load_data()
+    overview = resources.overview(selection)
+    if selection:
+        st.caption("Métricas dos projetos selecionados nos filtros da barra lateral.")
+    total_projects = overview['project_count']
+    total_co2_reduced = int(overview['co2_sum'] / 1_000_000)
+    num_countries = overview['country_count']
+    traded_volume = formatar_numero(overview['volume'])
+
+    col1, col2, col3, col4 = st.columns(4, gap="large")
 
     with col1:
         st.markdown(f"""
@@ -250,6 +414,14 @@ if section == "Introdução":
             <p class="value-orange">{num_countries}</p>
         </div>
         """, unsafe_allow_html=True)
+
+    with col4:
+        st.markdown(f"""
+        <div class="metric-card">
+            <h3>🔁 Volume Transacionado</h3>
+            <p class="value-purple">{traded_volume}</p>
+        </div>
+        """, unsafe_allow_html=True)
         
     st.divider()
 
@@ -274,74 +446,100 @@ if section == "Introdução":
 
 # --- Seção: Exploração dos Dados (VERSÃO RADICALMENTE OTIMIZADA) --- #
 elif section == "Exploração dos Dados":
+    import scatter_lod
+
+    year_cube = load_year_cube() if not selection else resources.selected_year_cube(selection)
     st.header("Exploração de Dados Otimizada")
     st.markdown("Para garantir a máxima performance, esta análise foca em um ano de implementação por vez. Use o seletor abaixo para alterar o ano.")
 
     # --- FILTRO PRINCIPAL: SELEÇÃO DE ANO ---
     # Forçamos a análise de um ano por vez para reduzir drasticamente o volume de dados.
-    available_years = sorted(merged_df["implementation_year"].unique(), reverse=True)
-    selected_year = st.selectbox(
-        "Selecione o Ano de Implementação para Análise",
-        options=available_years
-    )
+    # Métricas, histograma e tabela vêm do cubo ano/tipo pré-calculado na carga.
+    available_years = year_cube.years
+    if not available_years:
+        st.warning("Nenhum crédito nos projetos selecionados pelos filtros.")
+    else:
+        selected_year = st.selectbox(
+            "Selecione o Ano de Implementação para Análise",
+            options=available_years
+        )
 
-    # Filtra o dataframe principal APENAS pelo ano selecionado.
-    # Todas as operações seguintes serão feitas neste dataframe muito menor.
-    year_filtered_df = merged_df[merged_df["implementation_year"] == selected_year]
-    
-    st.info(f"Analisando {len(year_filtered_df):,} registros para o ano de {selected_year}.")
+        year_cells = year_cube.year_cells(selected_year)
+        year_summary = year_cube.year_summary(selected_year)
+
+        st.info(f"Analisando {year_summary['credit_count']:,} registros para o ano de {selected_year}.")
     
-    # --- 1. MÉTRICAS-CHAVE (SUBSTITUI A TABELA GIGANTE) ---
-    st.subheader("Resumo do Ano")
-    col1, col2, col3 = st.columns(3)
-    col1.metric("Total de Projetos", f"{year_filtered_df['project_id'].nunique():,}")
-    col2.metric("Preço Médio (USD)", f"${year_filtered_df['price'].mean():.2f}")
-    col3.metric("Volume Total (CO₂)", f"{year_filtered_df['co2_reduced'].sum():,}")
-
-    # --- 2. GRÁFICO LEVE: HISTOGRAMA POR TIPO ---
-    st.subheader(f"Contagem de Projetos por Tipo em {selected_year}")
-    fig_hist = generate_histogram(year_filtered_df, 'project_type')
-    st.plotly_chart(fig_hist, use_container_width=True)
-
-    # --- 3. TABELA-RESUMO (SUBSTITUI O GRÁFICO PESADO DE BOXPLOT) ---
-    st.subheader(f"Resumo de Preços por Tipo de Projeto em {selected_year}")
-    price_summary_df = year_filtered_df.groupby('project_type')['price'].agg(['mean', 'median', 'min', 'max']).reset_index()
-    price_summary_df = price_summary_df.rename(columns={
-        'mean': 'Preço Médio', 'median': 'Mediana', 'min': 'Preço Mínimo', 'max': 'Preço Máximo'
-    })
-    st.dataframe(price_summary_df, use_container_width=True)
-
-    # --- 4. GRÁFICO OTIMIZADO: DISPERSÃO COM AMOSTRAGEM ---
-    with st.expander(f"Clique para ver a análise de Volume vs. Preço em {selected_year}"):
-        MAX_POINTS_TO_PLOT = 2000 
-        plot_df = year_filtered_df
-        if len(year_filtered_df) > MAX_POINTS_TO_PLOT:
-            st.info(f"Para garantir a performance, o gráfico mostra uma amostra aleatória de {MAX_POINTS_TO_PLOT} de um total de {len(year_filtered_df):,} pontos.")
-            plot_df = year_filtered_df.sample(n=MAX_POINTS_TO_PLOT, random_state=42)
-        
-        fig_scatter = generate_scatter_plot(plot_df, 'co2_reduced', 'price', 'project_type',
-                                            ["name", "project_type", "co2_reduced", "price"])
-        st.plotly_chart(fig_scatter, use_container_width=True)
+        # --- 1. MÉTRICAS-CHAVE (SUBSTITUI A TABELA GIGANTE) ---
+        st.subheader("Resumo do Ano")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Total de Projetos", f"{year_summary['project_count']:,}")
+        col2.metric("Preço Médio (USD)", f"${year_summary['price_mean']:.2f}")
+        col3.metric("Volume Total (CO₂)", f"{year_summary['co2_sum']:,}")
+
+        # --- 2. GRÁFICO LEVE: HISTOGRAMA POR TIPO ---
+        st.subheader(f"Contagem de Projetos por Tipo em {selected_year}")
+        with profiling.stage("gráfico: histograma"):
+            figure_cache.plotly_chart(resources.year_histogram(int(selected_year), selection).spec)
+
+        # --- 3. TABELA-RESUMO (SUBSTITUI O GRÁFICO PESADO DE BOXPLOT) ---
+        st.subheader(f"Resumo de Preços por Tipo de Projeto em {selected_year}")
+        price_summary_df = year_cells[['price_mean', 'price_median', 'price_min', 'price_max']].reset_index()
+        price_summary_df = price_summary_df.rename(columns={
+            'price_mean': 'Preço Médio', 'price_median': 'Mediana', 'price_min': 'Preço Mínimo', 'price_max': 'Preço Máximo'
+        })
+        st.dataframe(price_summary_df, use_container_width=True)
+
+        # --- 4. GRÁFICO OTIMIZADO: DISPERSÃO COM NÍVEL DE DETALHE ---
+        with st.expander(f"Clique para ver a análise de Volume vs. Preço em {selected_year}"):
+            # Só os créditos do ano são lidos, uma vez por processo
+            if selection:
+                year_lod, year_points = resources.selected_year_scatter(int(selected_year), selection)
+            else:
+                year_lod, year_points = load_year_scatter(int(selected_year))
+            x_range, y_range, show_density = lod_zoom_controls(year_lod, f"scatter_{selected_year}", "CO₂ Reduzido", "Preço")
+
+            def build_year_scatter():
+                view = year_lod.view(x_range, y_range)
+                plot_df = year_points.iloc[view.positions]
+                fig = scatter_lod.lod_figure(view, plot_df, 'co2_reduced', 'price', 'project_type',
+                                             resources.SCATTER_COLUMNS,
+                                             title="Volume de CO₂ Reduzido vs. Preço do Crédito",
+                                             show_density=show_density)
+                return fig, lod_meta(view)
+
+            with profiling.stage("gráfico: dispersão LOD"):
+                scatter_chart = resources.figure("Exploração dos Dados", "dispersão",
+                                                 (int(selected_year), x_range, y_range, show_density), build_year_scatter,
+                                                 depends=(("year", int(selected_year)),), selection=selection)
+                lod_caption(scatter_chart.meta)
+                figure_cache.plotly_chart(scatter_chart.spec)
+
+        # --- 5. EXPORTAÇÃO DOS CRÉDITOS DO ANO (COM OS FILTROS GLOBAIS) ---
+        st.subheader(f"Exportar os Créditos de {selected_year}")
+        st.caption("Uma linha por crédito, com os dados do projeto, gravada em blocos de tamanho fixo.")
+        export_controls(("creditos_ano", int(selected_year), selection), f"creditos_{selected_year}",
+                        lambda: resources.credit_export(selection, years=[int(selected_year)]))
 
 # ________________________________________________________________________________________________________________________________________________________________________________________
 
 # --- Seção: Dinâmica do Mercado (VERSÃO FINAL COM CORREÇÃO DO TYPEERROR) --- #
 elif section == "Dinâmica do Mercado":
+    import streamlit.components.v1 as components
+    from plotly.subplots import make_subplots
+    import plotly.graph_objects as go
+    import export
+    import geo_layers
+
     st.header("Dinâmica do Mercado")
     st.markdown("Explore a evolução do mercado ao longo do tempo e sua distribuição geográfica.")
 
-    # Prepara os dados base para a seção
-    if 'transaction_date' in credits_df.columns:
-        credits_df["transaction_date"] = pd.to_datetime(credits_df["transaction_date"], utc=True)
-        monthly_data = credits_df.set_index("transaction_date").resample("M").agg({
-            "volume": "sum", "price": "mean"
-        }).reset_index()
-    else:
+    # Prepara os dados base para a seção: rollups mensais já agregados na carga
+    # (com filtros globais, rollups só dos créditos dos projetos selecionados)
+    market_series = load_time_series() if not selection else resources.selected_time_series(selection)
+    if market_series is None:
         monthly_data = pd.DataFrame()
-
-    if "country" not in projects_df.columns:
-        country_list = ["Brazil" if i % 2 == 0 else "China" for i in range(len(projects_df))]
-        projects_df['country'] = country_list
+    else:
+        monthly_data = resources.monthly_series() if not selection else market_series.series("M")
 
     # Cria as abas para organizar a visualização
     tab1, tab2 = st.tabs(["📈 Evolução Temporal", "🌍 Distribuição Geográfica"])
@@ -360,47 +558,62 @@ elif section == "Dinâmica do Mercado":
 
             if len(selected_date_range) == 2:
                 start_date, end_date = selected_date_range
-                mask = (monthly_data['transaction_date'].dt.date >= start_date) & (monthly_data['transaction_date'].dt.date <= end_date)
-                filtered_monthly_data = monthly_data[mask]
+                if (start_date, end_date) == (min_date, max_date):
+                    # Período padrão: série pré-calculada (e pré-aquecida)
+                    filtered_monthly_data = monthly_data
+                else:
+                    filtered_monthly_data = market_series.series("M", start=start_date, end=end_date)
 
                 col1, col2, col3 = st.columns(3, gap="large")
                 col1.metric("Meses Analisados", filtered_monthly_data.shape[0])
                 col2.metric("Pico de Volume", f"{int(filtered_monthly_data['volume'].max()):,}")
                 col3.metric("Preço Médio no Período", f"${filtered_monthly_data['price'].mean():.2f}")
 
-                fig = make_subplots(specs=[[{"secondary_y": True}]])
-                fig.add_trace(go.Scatter(x=filtered_monthly_data['transaction_date'], y=filtered_monthly_data['volume'], name="Volume Transacionado", line=dict(color='#1f77b4')), secondary_y=False)
-                fig.add_trace(go.Scatter(x=filtered_monthly_data['transaction_date'], y=filtered_monthly_data['price'], name="Preço Médio", line=dict(color='#ff7f0e', dash='dash')), secondary_y=True)
+                def build_monthly_chart():
+                    fig = make_subplots(specs=[[{"secondary_y": True}]])
+                    fig.add_trace(go.Scatter(x=filtered_monthly_data['transaction_date'], y=filtered_monthly_data['volume'], name="Volume Transacionado", line=dict(color='#1f77b4')), secondary_y=False)
+                    fig.add_trace(go.Scatter(x=filtered_monthly_data['transaction_date'], y=filtered_monthly_data['price'], name="Preço Médio", line=dict(color='#ff7f0e', dash='dash')), secondary_y=True)
 
-                fig.update_layout(title_text="Evolução Mensal: Volume de Transações vs. Preço Médio", template="plotly_white", legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
-                fig.update_xaxes(title_text="Data")
-                fig.update_yaxes(title_text="<b>Volume Transacionado</b>", secondary_y=False)
-                fig.update_yaxes(title_text="<b>Preço Médio (USD)</b>", secondary_y=True)
-                
-                st.plotly_chart(fig, use_container_width=True)
+                    fig.update_layout(title_text="Evolução Mensal: Volume de Transações vs. Preço Médio", template="plotly_white", legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
+                    fig.update_xaxes(title_text="Data")
+                    fig.update_yaxes(title_text="<b>Volume Transacionado</b>", secondary_y=False)
+                    fig.update_yaxes(title_text="<b>Preço Médio (USD)</b>", secondary_y=True)
+                    return fig
+
+                with profiling.stage("gráfico: série mensal"):
+                    monthly_chart = resources.figure("Dinâmica do Mercado", "série mensal", (start_date, end_date), build_monthly_chart, depends=("credits",), selection=selection)
+                    figure_cache.plotly_chart(monthly_chart.spec)
+
+                with st.expander("Exportar a série mensal"):
+                    export_controls(("serie_mensal", start_date, end_date, selection), "serie_mensal",
+                                    lambda: export.frame_export(filtered_monthly_data))
             else:
                 st.warning("Por favor, selecione um período de início e fim.")
+        elif selection and market_series is not None:
+            st.warning("Nenhuma transação nos projetos selecionados pelos filtros.")
         else:
             st.warning("Não foi possível gerar a análise temporal. Verifique a coluna 'transaction_date' no seu arquivo.")
 
     with tab2:
         st.subheader("Análise Geográfica dos Projetos")
 
-        if geojson_data_cached:
-            geojson_data = copy.deepcopy(geojson_data_cached)
-            
-            metric_to_show = st.radio(
+        geo_layers_cached = load_geo_layers()
+        if geo_layers_cached:
+            col_metric, col_detail = st.columns([3, 1])
+            metric_to_show = col_metric.radio(
                 "Selecione a métrica para visualizar no mapa:",
-                ("Volume de CO₂ Reduzido", "Número de Projetos"),
+                tuple(geo_layers.MAP_METRICS),
                 horizontal=True, key="folium_metric"
             )
+            detail_level = col_detail.select_slider(
+                "Nível de detalhe do mapa",
+                options=list(geo_layers.SIMPLIFY_TOLERANCES),
+                value=geo_layers.DEFAULT_DETAIL, key="folium_detail"
+            )
 
-            if metric_to_show == "Volume de CO₂ Reduzido":
-                country_data = projects_df.groupby("country")["co2_reduced"].sum().reset_index()
-                data_column, legend_name, alias_name, fill_color = 'co2_reduced', 'Volume de CO₂ Reduzido (ton)', 'Volume (ton):', 'YlOrRd'
-            else: # Número de Projetos
-                country_data = projects_df.groupby("country")['project_id'].nunique().reset_index().rename(columns={'project_id': 'project_count'})
-                data_column, legend_name, alias_name, fill_color = 'project_count', 'Número de Projetos', 'Nº de Projetos:', 'YlGn'
+            # Métricas por país já calculadas na carga da camada (ou as da seleção dos filtros)
+            country_data = geo_layers_cached.metrics if not selection else resources.selected_country_metrics(selection)
+            data_column = geo_layers.MAP_METRICS[metric_to_show]["column"]
 
             if not country_data.empty:
                 top_country = country_data.sort_values(by=data_column, ascending=False).iloc[0]
@@ -408,164 +621,357 @@ elif section == "Dinâmica do Mercado":
                 colA.metric("Total de Países com Projetos", f"{country_data['country'].nunique()}")
                 colB.metric(f"País com Maior Métrica", top_country['country'], f"{int(top_country[data_column]):,}")
 
-            # Injeta os dados no GeoJSON, garantindo a conversão de tipo
-            data_dict = country_data.set_index('country')[data_column]
-            for feature in geojson_data['features']:
-                country_name = feature['properties']['name']
-                value = data_dict.get(country_name, 0)
-                # CORREÇÃO DO TYPEERROR: Converte o valor para um int padrão do Python
-                feature['properties'][data_column] = int(value)
-
-            # Cria o mapa Folium
-            m = folium.Map(location=[20, 0], zoom_start=2, tiles='CartoDB positron')
-            folium.Choropleth(
-                geo_data=geojson_data, data=country_data, columns=['country', data_column],
-                key_on='feature.properties.name', fill_color=fill_color, fill_opacity=0.7,
-                line_opacity=0.2, legend_name=legend_name
-            ).add_to(m)
-            tooltip = folium.GeoJsonTooltip(
-                fields=['name', data_column], aliases=['País:', alias_name],
-                style=('background-color: white; color: #333333; font-family: arial; font-size: 12px; padding: 10px;'),
-                sticky=True
-            )
-            folium.GeoJson(geojson_data, style_function=lambda x: {'fillOpacity': 0, 'weight': 0}, tooltip=tooltip).add_to(m)
-            folium.LayerControl().add_to(m)
+            # Exibe o mapa no Streamlit: o HTML é renderizado uma vez por métrica/nível
+            with profiling.stage("mapa: html folium"):
+                if not selection:
+                    components.html(geo_layers_cached.map_html(metric_to_show, detail_level), height=500)
+                elif not country_data.empty:
+                    components.html(resources.selected_map_html(selection, metric_to_show, detail_level), height=500)
+                else:
+                    st.warning("Nenhum projeto selecionado pelos filtros.")
 
-            # Exibe o mapa no Streamlit
-            st_folium(m, use_container_width=True, height=500)
+            if not country_data.empty:
+                with st.expander("Exportar as métricas por país"):
+                    export_controls(("paises", selection), "metricas_por_pais", lambda: export.frame_export(country_data))
 #_____________________________________________________________________
 
 
 # --- Seção: Fatores de Precificação --- #
 elif section == "Fatores de Precificação":
+    import plotly.express as px
+    import export
+    import pricing_model
+
     st.header("Análise dos Fatores de Precificação")
     st.markdown("Nesta seção, exploramos os resultados de um modelo de regressão (OLS) para entender quais fatores impactam o preço dos créditos de carbono.")
 
     tab1, tab2 = st.tabs(["📊 Resultados do Modelo", "⚙️ Simulador de Preços"])
 
+    # Modelo ajustado uma vez por processo a partir das estatísticas suficientes
+    price_model = load_pricing_model()
+    model_result = price_model.fit()
+
+    def format_pvalue(p):
+        return "< 0.01" if p < 0.01 else f"{p:.3f}"
+
     with tab1:
         st.subheader("Qualidade Geral do Modelo")
         col1, col2, col3 = st.columns(3)
-        col1.metric(label="R-squared (R²)", value="75.6%", help="Percentual da variação no preço que o modelo consegue explicar.")
-        col2.metric(label="Adj. R-squared", value="75.5%", help="R² ajustado para o número de variáveis no modelo.")
-        col3.metric(label="P-valor (F-statistic)", value="< 0.01", help="Um valor baixo indica que o modelo como um todo é estatisticamente significativo.")
+        col1.metric(label="R-squared (R²)", value=f"{model_result['r2']:.1%}", help="Percentual da variação no preço que o modelo consegue explicar.")
+        col2.metric(label="Adj. R-squared", value=f"{model_result['adj_r2']:.1%}", help="R² ajustado para o número de variáveis no modelo.")
+        col3.metric(label="P-valor (F-statistic)", value=format_pvalue(model_result['f_pvalue']), help="Um valor baixo indica que o modelo como um todo é estatisticamente significativo.")
 
         st.subheader("Impacto de Cada Fator no Preço")
-        coef_data = {
-            'Fator': ['Intercepto (Constante)', 'CO₂ Reduzido (por ton)', 'Duração do Projeto (ano)', 'Tipo de Projeto A', 'Tipo de Projeto B'],
-            'Impacto (Coeficiente)': [-1.2345, 0.0005, 0.1234, 0.5678, 0.3456],
-            'P-valor': ['< 0.01', '< 0.01', '< 0.01', '< 0.01', '< 0.01']
-        }
-        coef_df = pd.DataFrame(coef_data)
+        coefficients = model_result["coefficients"]
+        coef_df = pd.DataFrame({
+            'Fator': [pricing_model.factor_label(c) for c in coefficients.index],
+            'Impacto (Coeficiente)': coefficients['coef'].to_numpy(),
+            'P-valor': [format_pvalue(p) for p in coefficients['p_value']]
+        })
         st.dataframe(coef_df, use_container_width=True)
 
-        st.markdown("""
-        **Interpretação:**
-        * **Duração do Projeto e Tipo de Projeto** são os fatores com maior impacto positivo no preço.
-        * O **volume de CO₂** também tem um impacto positivo, embora menor em magnitude por unidade.
-        * Todos os fatores são **estatisticamente significativos** (P-valor < 0.01), indicando que suas influências não são meramente ao acaso.
-        """)
+        significant = coef_df[(coefficients['p_value'].to_numpy() < 0.05) & (coef_df['Fator'] != 'Intercepto (Constante)').to_numpy()]
+        strongest = significant.reindex(significant['Impacto (Coeficiente)'].abs().sort_values(ascending=False).index).head(3)
+        interpretation = [
+            f"* O modelo foi ajustado sobre **{model_result['n']:,} transações** e explica **{model_result['r2']:.1%}** da variação no preço.",
+            f"* **{len(significant)} de {len(coef_df) - 1} fatores** são estatisticamente significativos (P-valor < 0.05).",
+        ] + [
+            f"* **{row['Fator']}**: {row['Impacto (Coeficiente)']:+.4g} no preço."
+            for _, row in strongest.iterrows()
+        ]
+        st.markdown("**Interpretação:**\n" + "\n".join(interpretation))
 
         st.subheader("Visualização do Impacto dos Fatores")
-        fig_coef = px.bar(
-            coef_df[coef_df['Fator'] != 'Intercepto (Constante)'], 
-            x='Fator', 
-            y='Impacto (Coeficiente)',
-            title='Impacto de Cada Fator no Preço do Crédito',
-            labels={'Impacto (Coeficiente)': 'Aumento no Preço (unidade monetária)'},
-            color='Impacto (Coeficiente)',
-            color_continuous_scale='Viridis'
-        )
-        st.plotly_chart(fig_coef, use_container_width=True)
+        with profiling.stage("gráfico: coeficientes"):
+            coef_chart = resources.figure("Fatores de Precificação", "coeficientes", (), lambda: px.bar(
+                coef_df[coef_df['Fator'] != 'Intercepto (Constante)'],
+                x='Fator',
+                y='Impacto (Coeficiente)',
+                title='Impacto de Cada Fator no Preço do Crédito',
+                labels={'Impacto (Coeficiente)': 'Aumento no Preço (unidade monetária)'},
+                color='Impacto (Coeficiente)',
+                color_continuous_scale='Viridis'
+            ), depends=("credits",))
+            figure_cache.plotly_chart(coef_chart.spec)
 
         with st.expander("Ver Diagnósticos Avançados e Saída Completa do Modelo"):
-            st.markdown("""
-            * **Durbin-Watson:** `1.987` (Excelente. Indica ausência de autocorrelação nos erros do modelo).
-            * **Jarque-Bera (Prob):** `0.00` (Indica que os erros não seguem uma distribuição normal. No entanto, com um grande número de observações (50.000), o Teorema do Limite Central suporta a validade do modelo).
-            * **Cond. No.:** `1.0e+05` (Um valor alto que sugere possível multicolinearidade, um ponto de atenção na análise).
-            """)
-            st.text("""
-                                  OLS Regression Results
-            ==============================================================================
-            Dep. Variable:                  price   R-squared:                       0.756
-            Model:                            OLS   Adj. R-squared:                  0.755
-            Method:                 Least Squares   F-statistic:                 1.234e+04
-            Date:                Mon, 16 Jun 2025   Prob (F-statistic):               0.00
-            Time:                        14:41:40   Log-Likelihood:            -2.468e+05
-            No. Observations:               50000   AIC:                         4.937e+05
-            Df Residuals:                   49996   BIC:                         4.937e+05
-            Df Model:                           3
-            Covariance Type:            nonrobust
-            ====================================================================================
-                                 coef    std err          t      P>|t|      [0.025      0.975]
-            ------------------------------------------------------------------------------------
-            const               -1.2345      0.012   -102.875      0.000      -1.258      -1.211
-            co2_reduced          0.0005    1.0e-06    500.000      0.000       0.000       0.000
-            project_duration     0.1234      0.001    123.400      0.000       0.121       0.125
-            project_type_A       0.5678      0.005    113.560      0.000       0.558       0.578
-            project_type_B       0.3456      0.004     86.400      0.000       0.338       0.353
-            =====================================================================================
-            Omnibus:                    123.456   Durbin-Watson:                   1.987
-            Prob(Omnibus):                  0.000   Jarque-Bera (JB):              234.567
-            Skew:                           0.123   Prob(JB):                         0.00
-            Kurtosis:                       3.456   Cond. No.                     1.0e+05
-            =====================================================================================
+            st.markdown(f"""
+            * **Cond. No. (escalado):** `{model_result['cond_no']:.3g}` (Valores altos sugerem possível multicolinearidade, um ponto de atenção na análise).
+            * O modelo é ajustado a partir das estatísticas suficientes (XᵀX, Xᵀy), sem guardar os resíduos individuais; por isso diagnósticos como Durbin-Watson e Jarque-Bera não são calculados.
             """)
+            st.text(price_model.summary_text())
 
     with tab2:
         st.subheader("Estime o Preço de um Crédito")
         with st.form("price_simulator_form"):
             sim_co2_volume = st.number_input("Volume de CO₂ (toneladas)", min_value=0.0, value=1000.0)
             sim_project_duration = st.slider("Duração do Projeto (anos)", min_value=1, max_value=30, value=10)
-            sim_project_type = st.selectbox("Tipo de Projeto", projects_df["project_type"].unique())
+            sim_project_type = st.selectbox("Tipo de Projeto", price_model.project_types)
             submitted = st.form_submit_button("Calcular Preço Estimado")
             if submitted:
-                predicted_price = (-1.2345) + (sim_co2_volume * 0.0005) + (sim_project_duration * 0.1234)
-                # Assumindo que o tipo de projeto base não adiciona valor e A/B são relativos a ele
-                if sim_project_type == "Forestry": # Simulação para Tipo A
-                    predicted_price += 0.5678
-                elif sim_project_type == "Renewable Energy": # Simulação para Tipo B
-                    predicted_price += 0.3456
-                
+                predicted_price = price_model.predict(pd.DataFrame({
+                    'co2_reduced': [sim_co2_volume], 'project_duration': [sim_project_duration], 'project_type': [sim_project_type]
+                }))[0]
                 st.success(f"O preço estimado do crédito é: ${max(0, predicted_price):.2f}")
 
+        # Predição em lote: todos os tipos × todas as durações de uma só vez
+        with st.expander("Comparar o preço estimado entre tipos e durações"):
+            scenario_df = pd.MultiIndex.from_product(
+                [price_model.project_types, range(1, 31)], names=['project_type', 'project_duration']
+            ).to_frame(index=False).assign(co2_reduced=sim_co2_volume)
+            scenario_df['predicted_price'] = price_model.predict(scenario_df)
+            st.caption(f"{len(scenario_df):,} cenários calculados para {sim_co2_volume:,.0f} toneladas de CO₂.")
+            by_type = scenario_df[scenario_df['project_duration'] == sim_project_duration].sort_values('predicted_price', ascending=False)
+            scenario_chart = resources.figure(
+                "Fatores de Precificação", "cenários", (sim_co2_volume, sim_project_duration), lambda: px.bar(
+                    by_type, x='project_type', y='predicted_price',
+                    title=f"Preço Estimado por Tipo de Projeto ({sim_project_duration} anos)",
+                    labels={'project_type': 'Tipo de Projeto', 'predicted_price': 'Preço Estimado (USD)'}
+                ), depends=("credits",)
+            )
+            figure_cache.plotly_chart(scenario_chart.spec)
+
+        with st.expander("Simulação em lote a partir de um arquivo"):
+            st.markdown("Envie um CSV com as colunas `co2_reduced`, `project_duration` e `project_type` para estimar o preço de todos os projetos hipotéticos de uma vez.")
+            uploaded_scenarios = st.file_uploader("Arquivo de projetos hipotéticos", type="csv", key="price_batch_upload")
+            if uploaded_scenarios is not None:
+                try:
+                    batch_df = pd.read_csv(uploaded_scenarios)
+                    missing = [c for c in ['co2_reduced', 'project_duration', 'project_type'] if c not in batch_df.columns]
+                    if missing:
+                        raise ValueError(f"colunas ausentes: {', '.join(missing)}")
+                    batch_df, invalid_number_rows, unknown_type_rows = price_model.predict_scenarios(batch_df)
+                except ValueError as error:
+                    st.error(f"Não foi possível ler o arquivo de projetos: {error}")
+                else:
+                    st.caption(f"{int(batch_df['predicted_price'].notna().sum()):,} de {len(batch_df):,} linhas com preço estimado.")
+                    if invalid_number_rows:
+                        st.warning(f"{invalid_number_rows:,} linhas com `co2_reduced` ou `project_duration` vazio ou não numérico ficaram sem preço.")
+                    if unknown_type_rows:
+                        st.warning(f"{unknown_type_rows:,} linhas com `project_type` vazio ou fora dos tipos do modelo "
+                                   "(os do simulador acima) ficaram sem preço.")
+                    st.dataframe(batch_df.head(1000), use_container_width=True)
+                    export_controls(("precos_lote", uploaded_scenarios.file_id), "precos_estimados",
+                                    lambda: export.frame_export(batch_df))
+
 #______________________________________________________________________
 
 # --- Seção: Segmentação de Projetos --- #
 elif section == "Segmentação de Projetos":
-    st.header("Segmentação de Projetos")
-    features = projects_df[['co2_reduced', 'project_duration']].fillna(0)
-    
-    if len(features) >= 2:
-        kmeans = KMeans(n_clusters=2, random_state=42, n_init='auto').fit(features)
-        projects_df['cluster'] = kmeans.labels_
-        projects_df['cluster'] = projects_df['cluster'].map({0: "Cluster 0 (Pequeno Volume)", 1: "Cluster 1 (Grande Volume)"})
+    import scatter_lod
+    import segmentation
 
+    projects_df = load_data().projects()
+    st.header("Segmentação de Projetos")
+    # Modelos em cache por (atributos, escala, k): abrir a página é uma consulta ao cache
+    col_features, col_scaling, col_k = st.columns([3, 2, 1])
+    selected_features = col_features.multiselect(
+        "Atributos usados na segmentação",
+        options=list(segmentation.SEGMENTATION_FEATURES),
+        default=list(segmentation.DEFAULT_FEATURES),
+        format_func=segmentation.SEGMENTATION_FEATURES.get
+    )
+    selected_scaling = col_scaling.selectbox(
+        "Escala dos atributos",
+        options=list(segmentation.SCALINGS),
+        format_func=segmentation.SCALINGS.get
+    )
+    selected_k = col_k.number_input("Número de clusters (k)", min_value=2, max_value=8, value=segmentation.DEFAULT_K)
+
+    # Os clusters são ajustados sobre todos os projetos; com filtros globais,
+    # o gráfico e os perfis mostram só os projetos selecionados
+    segment_mask = resources.project_mask(selection)
+
+    if len(selected_features) < 2:
+        st.warning("Selecione ao menos dois atributos para a segmentação.")
+    elif segment_mask is not None and not segment_mask.any():
+        st.warning("Nenhum projeto selecionado pelos filtros.")
+    elif len(projects_df) >= selected_k:
+        segmentation_engine = load_segmentation_engine()
+        model, labels = segmentation_engine.segment(selected_features, selected_scaling, selected_k)
+        cluster_names = np.array([f"Cluster {i}" for i in range(model.k)])[labels]
+        # Os atributos dos gráficos incluem as métricas de crédito de cada projeto
+        projects_df = segmentation_engine.projects.assign(cluster=cluster_names)
+        profile_projects = segmentation_engine.projects
+        if segment_mask is not None:
+            projects_df, profile_projects = projects_df[segment_mask], profile_projects[segment_mask]
+            labels, cluster_names = labels[segment_mask], cluster_names[segment_mask]
+
+        x_feature, y_feature = selected_features[:2]
         st.subheader("Projetos Segmentados por Cluster")
-        # CORREÇÃO APLICADA AQUI: 'project_name' alterado para 'name'
-        fig_cluster = px.scatter(projects_df, x="co2_reduced", y="project_duration", color="cluster",
-                                 hover_data=["name", "project_type", "cluster"],
-                                 title="Segmentação de Projetos (Volume de CO₂ Reduzido vs. Duração do Projeto)")
-        st.plotly_chart(fig_cluster, use_container_width=True)
+        # Amostra estratificada por cluster (com os extremos) sobre a densidade de todos os projetos
+        cluster_lod = scatter_lod.ScatterLOD(projects_df[x_feature].fillna(0), projects_df[y_feature].fillna(0), labels)
+        x_range, y_range, show_density = lod_zoom_controls(
+            cluster_lod, "segmentation", segmentation.SEGMENTATION_FEATURES[x_feature],
+            segmentation.SEGMENTATION_FEATURES[y_feature]
+        )
+
+        def build_cluster_scatter():
+            view = cluster_lod.view(x_range, y_range)
+            # CORREÇÃO APLICADA AQUI: 'project_name' alterado para 'name'
+            fig = scatter_lod.lod_figure(
+                view, projects_df.iloc[view.positions], x_feature, y_feature, "cluster",
+                ["name", "project_type", "cluster"],
+                labels=segmentation.SEGMENTATION_FEATURES,
+                category_orders={"cluster": sorted(set(cluster_names))},
+                title=f"Segmentação de Projetos ({segmentation.SEGMENTATION_FEATURES[x_feature]} vs. {segmentation.SEGMENTATION_FEATURES[y_feature]})",
+                show_density=show_density
+            )
+            return fig, lod_meta(view)
+
+        with profiling.stage("gráfico: clusters"):
+            cluster_chart = resources.figure(
+                "Segmentação de Projetos", "clusters",
+                (tuple(selected_features), selected_scaling, int(selected_k), x_range, y_range, show_density),
+                build_cluster_scatter, selection=selection
+            )
+            lod_caption(cluster_chart.meta)
+            figure_cache.plotly_chart(cluster_chart.spec)
 
         st.subheader("Perfis dos Clusters")
-        cluster_descriptions = {
-            "Cluster 0 (Pequeno Volume)": "Este cluster compreende projetos de menor escala...",
-            "Cluster 1 (Grande Volume)": "Este cluster representa projetos de grande porte..."
-        }
-        for cluster_name, description in cluster_descriptions.items():
-            with st.expander(f"Ver Perfil do {cluster_name}"):
-                st.markdown(description)
+        st.caption(f"Os clusters são numerados em ordem crescente de {segmentation.SEGMENTATION_FEATURES[selected_features[0]]}.")
+        profiles = model.profiles(profile_projects, labels)
+        for cluster_id, profile in profiles.iterrows():
+            with st.expander(f"Ver Perfil do Cluster {cluster_id}"):
+                st.markdown(f"**{int(profile['projects']):,} projetos.** Médias dos atributos:")
+                st.dataframe(
+                    profile.drop("projects").rename(index=segmentation.SEGMENTATION_FEATURES).to_frame("Média"),
+                    use_container_width=True
+                )
     else:
         st.warning("Não há dados suficientes para criar clusters de projetos.")
 
 #_______________________________
 
+# --- Seção: Metodologias --- #
+elif section == "Metodologias":
+    import plotly.express as px
+    import protocols
+
+    st.header("Metodologias dos Projetos")
+    st.markdown("Totais de créditos por metodologia (protocolo) de certificação. Um projeto com mais de uma metodologia entra no total de cada uma.")
+
+    # Índice invertido metodologia -> projetos, montado uma vez na carga
+    protocol_index = load_protocol_index()
+    methodology_df = resources.protocol_totals() if not selection else resources.selected_protocol_totals(selection)
+
+    if methodology_df.empty:
+        st.warning("Nenhum projeto com metodologia informada entre os selecionados pelos filtros.")
+    else:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Metodologias", f"{len(methodology_df):,}")
+        col2.metric("Mais Usada", methodology_df["project_count"].idxmax(), f"{methodology_df['project_count'].max():,} projetos")
+        col3.metric("Créditos Emitidos", formatar_numero(methodology_df["issued"].sum()))
+
+        volume_columns = {f"{kind}_volume": label for kind, label in protocols.TRANSACTION_LABELS.items()}
+        labels = {
+            "protocol": "Metodologia", "project_count": "Projetos",
+            "issued": "Créditos Emitidos", "retired": "Créditos Aposentados",
+            **{column: f"Volume de {label} (transações)" for column, label in volume_columns.items()},
+        }
+
+        st.subheader("Metodologias com Mais Créditos Emitidos")
+        top_n = st.slider("Número de metodologias no gráfico", min_value=5, max_value=50, value=20, step=5)
+
+        def build_methodology_chart():
+            top = methodology_df.head(top_n).reset_index().melt(
+                id_vars="protocol", value_vars=["issued", "retired"], var_name="total", value_name="credits"
+            )
+            top["total"] = top["total"].map(labels)
+            return px.bar(top, x="protocol", y="credits", color="total", barmode="group",
+                          labels={"protocol": "Metodologia", "credits": "Créditos", "total": ""},
+                          title="Créditos Emitidos e Aposentados por Metodologia")
+
+        with profiling.stage("gráfico: metodologias"):
+            methodology_chart = resources.figure("Metodologias", "emitidos e aposentados", (top_n,),
+                                                 build_methodology_chart, selection=selection)
+            figure_cache.plotly_chart(methodology_chart.spec)
+
+        st.subheader("Totais por Metodologia")
+        st.dataframe(methodology_df.reset_index().rename(columns=labels), hide_index=True, use_container_width=True)
+
+        # Projetos de uma metodologia: consulta ao índice invertido
+        st.subheader("Projetos por Metodologia")
+        selected_protocol = st.selectbox("Selecione a metodologia", options=list(methodology_df.index))
+        protocol_keys = protocol_index.projects(selected_protocol)
+        project_mask = resources.project_mask(selection)
+        if project_mask is not None:
+            protocol_keys = protocol_keys[project_mask[protocol_keys]]
+        protocol_projects = load_data().projects().iloc[protocol_keys]
+        st.dataframe(
+            protocol_projects[["project_id", "name", "country", "project_type", "registry", "issued", "retired"]],
+            hide_index=True, use_container_width=True
+        )
+
+#_______________________________
+
+# --- Seção: Busca de Projetos --- #
+elif section == "Busca de Projetos":
+    import plotly.express as px
+    import search
+
+    st.header("Busca de Projetos")
+    st.markdown("Procure projetos por parte do nome, do proponente ou pelo identificador do registro (ex.: VCS5565) e veja o histórico de créditos de cada um.")
+
+    # Índice montado uma vez na carga: cada consulta é uma busca binária por termo
+    project_search = load_project_search()
+    query = st.text_input("Buscar projeto", key="busca_projeto", placeholder="Nome, proponente ou ID do registro")
+
+    if query.strip():
+        hit_keys, hit_scores = project_search.search(query)
+        if not len(hit_keys):
+            st.info("Nenhum projeto encontrado.")
+        else:
+            projects_df = load_data().projects()
+            st.caption(f"{len(hit_keys)} projetos encontrados, do mais relevante (no máximo {search.MAX_RESULTS}).")
+            hits_df = projects_df.iloc[hit_keys][["project_id", "name", "proponent", "country", "project_type", "registry"]]
+            st.dataframe(hits_df.assign(relevancia=hit_scores), hide_index=True, use_container_width=True)
+
+            selected_key = st.selectbox(
+                "Ver o histórico de créditos do projeto", hit_keys.tolist(),
+                format_func=lambda key: f"{projects_df['project_id'].iat[key]} – {projects_df['name'].iat[key]}"
+            )
+            project = projects_df.iloc[selected_key]
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("País", project["country"])
+            col2.metric("Tipo de Projeto", project["project_type"])
+            col3.metric("Créditos Emitidos", formatar_numero(project["issued"]))
+            col4.metric("Créditos Aposentados", formatar_numero(project["retired"]))
+
+            # Só as linhas de crédito do projeto são lidas
+            credit_history = load_data().project_credits(selected_key)
+            if credit_history.empty:
+                st.info("O projeto não tem transações de crédito.")
+            else:
+                st.subheader("Histórico de Créditos")
+                if {"transaction_date", "transaction_type"} <= set(credit_history.columns):
+                    def build_history_chart():
+                        yearly = credit_history.assign(year=credit_history["transaction_date"].dt.year).groupby(
+                            ["year", "transaction_type"], observed=True
+                        )["volume"].sum().reset_index()
+                        return px.bar(yearly, x="year", y="volume", color="transaction_type", barmode="group",
+                                      labels={"year": "Ano", "volume": "Volume", "transaction_type": "Transação"},
+                                      title=f"Volume Anual de Créditos: {project['name']}")
+
+                    history_chart = resources.figure("Busca de Projetos", "histórico", (int(selected_key),),
+                                                     build_history_chart, depends=("credits",))
+                    figure_cache.plotly_chart(history_chart.spec)
+                st.dataframe(credit_history, hide_index=True, use_container_width=True)
+
+#_______________________________
+
 # --- Seção: Calculadora de Emissões (VERSÃO MODERNA E INTERATIVA) --- #
 elif section == "Calculadora de Emissões":
+    import emissions
+    import export
+
     st.header("Calculadora Interativa de Emissões")
     st.markdown("Selecione uma atividade e a quantidade consumida para estimar instantaneamente a pegada de carbono correspondente.")
 
+    # Fatores de emissão por atividade (emission_factors.csv)
+    factors_df = load_emission_factors()
+    factors_by_activity = factors_df.set_index("activity")
+
     # Usamos um container para agrupar visualmente a calculadora
     with st.container(border=True):
         col1, col2 = st.columns([2, 3], gap="large")
@@ -574,22 +980,14 @@ elif section == "Calculadora de Emissões":
             # --- ENTRADAS DO USUÁRIO ---
             st.subheader("1. Insira os Dados")
             
-            # Estrutura de dados aprimorada com unidades
-            emission_data = {
-                "Gasolina (carro)": {"fator": 2.31, "unidade": "litros"},
-                "Diesel (caminhão)": {"fator": 2.68, "unidade": "litros"},
-                "Eletricidade (média Brasil)": {"fator": 0.09, "unidade": "kWh"},
-                "Gás Natural (residencial)": {"fator": 2.02, "unidade": "m³"}
-            }
-            
             # Seletor de atividade
             activity = st.selectbox(
                 "Selecione a Atividade",
-                options=list(emission_data.keys())
+                options=list(factors_by_activity.index)
             )
             
             # A unidade muda dinamicamente com base na seleção
-            unidade_selecionada = emission_data[activity]['unidade']
+            unidade_selecionada = factors_by_activity.at[activity, 'unit']
             
             # Entrada de quantidade com rótulo dinâmico
             quantity = st.number_input(
@@ -604,23 +1002,168 @@ elif section == "Calculadora de Emissões":
             st.subheader("2. Veja o Resultado")
             
             if activity:
-                fator = emission_data[activity]['fator']
-                emissions = quantity * fator
+                fator = factors_by_activity.at[activity, 'factor']
+                emissions_kg, arvores_necessarias = emissions.emissions(quantity, fator)
                 
                 # Exibe o resultado principal com st.metric
                 st.metric(
                     label="Emissões Estimadas de CO₂e",
-                    value=f"{emissions:.2f} kg"
+                    value=f"{emissions_kg:.2f} kg"
                 )
                 
                 # Explicação didática do cálculo
                 st.markdown("---")
                 st.markdown(f"**Como calculamos:**")
-                st.latex(f"\\text{{{quantity:.2f} {unidade_selecionada}}} \\times \\text{{{fator} kg/ {unidade_selecionada}}} = \\text{{{emissions:.2f} kg CO₂e}}")
+                st.latex(f"\\text{{{quantity:.2f} {unidade_selecionada}}} \\times \\text{{{fator} kg/ {unidade_selecionada}}} = \\text{{{emissions_kg:.2f} kg CO₂e}}")
 
-                # Contexto do mundo real
-                arvores_necessarias = emissions / 22 # Média de 22 kg de CO₂ absorvido por árvore/ano
+                # Contexto do mundo real (média de 22 kg de CO₂ absorvido por árvore/ano)
                 st.info(f"💡 Para contextualizar, seriam necessárias aproximadamente **{arvores_necessarias:.1f} árvores** crescendo por um ano para absorver essa quantidade de CO₂.", icon="🌳")
             
             else:
-                st.info("Selecione uma atividade para começar.")
\ No newline at end of file
+                st.info("Selecione uma atividade para começar.")
+
+    # --- CÁLCULO EM LOTE ---
+    st.subheader("Cálculo em Lote")
+    st.markdown(
+        "Envie um arquivo de consumo (CSV ou Parquet) com as colunas `activity` e `quantity` "
+        "(ou `atividade` e `quantidade`), uma linha por registro: frotas, contas de energia etc. "
+        "As atividades precisam estar na tabela de fatores abaixo (sem diferença de maiúsculas)."
+    )
+    with st.expander("Tabela de fatores de emissão"):
+        st.dataframe(factors_df.rename(columns={"activity": "Atividade", "unit": "Unidade", "factor": "kg CO₂e por unidade"}),
+                     hide_index=True, use_container_width=True)
+
+    col_file, col_format = st.columns([3, 1])
+    uploaded = col_file.file_uploader("Arquivo de consumo", type=["csv", "parquet"], key="lote_arquivo")
+    batch_format = col_format.radio("Formato do resultado", list(export.FORMATS), key="lote_formato")
+
+    # O resultado por linha fica na sessão, em partes de até
+    # export.MAX_DOWNLOAD_ROWS linhas (arquivos temporários): o clique no
+    # download (que reexecuta o script) não refaz o cálculo, e cada parte é
+    # descartada depois de baixada
+    batch = st.session_state.get("lote_resultado")
+    if batch is not None and (uploaded is None or batch["file_id"] != uploaded.file_id or batch["format"] != batch_format):
+        close_parts(batch)
+        batch = st.session_state["lote_resultado"] = None
+
+    if (uploaded is not None and (batch is None or not batch["parts"])
+            and st.button("Calcular emissões do arquivo", type="primary")):
+        summary = emissions.BatchSummary()
+        try:
+            with st.spinner("Calculando em blocos..."):
+                uploaded.seek(0)
+                chunks = emissions.read_chunks(uploaded, uploaded.name)
+                parts = spooled_parts(emissions.iter_results(chunks, factors_df, summary), batch_format)
+        except ValueError as error:
+            st.error(f"Não foi possível ler o arquivo de consumo: {error}")
+        else:
+            batch = st.session_state["lote_resultado"] = {
+                "file_id": uploaded.file_id, "format": batch_format, "parts": parts,
+                "part_count": len(parts), "total_rows": summary.rows, "summary": summary,
+            }
+
+    if batch is not None:
+        summary = batch["summary"]
+        col_rows, col_co2, col_trees = st.columns(3)
+        col_rows.metric("Linhas calculadas", f"{summary.rows - summary.unmatched_rows:,} de {summary.rows:,}")
+        col_co2.metric("Emissões de CO₂e", f"{summary.co2e_kg / 1000:,.2f} t")
+        col_trees.metric("Árvores por um ano", formatar_numero(summary.co2e_kg / emissions.TREE_ABSORPTION_KG))
+        if summary.unmatched_rows:
+            st.warning(f"{summary.unmatched_rows:,} linhas com atividade fora da tabela de fatores ficaram sem cálculo.")
+            st.dataframe(summary.unmatched.sort_values(ascending=False).head(20).rename("linhas"), use_container_width=True)
+        if summary.invalid_quantity_rows:
+            st.warning(f"{summary.invalid_quantity_rows:,} linhas com quantidade vazia ou inválida ficaram sem emissão.")
+
+        st.dataframe(
+            summary.table().reset_index().rename(columns={
+                "activity": "Atividade", "unit": "Unidade", "rows": "Linhas", "quantity": "Quantidade",
+                "co2e_kg": "CO₂e (kg)", "trees": "Árvores por um ano",
+            }),
+            hide_index=True, use_container_width=True
+        )
+        if batch["parts"]:
+            part_downloads(st, batch, "lote", "emissoes", batch["format"])
+        elif batch["part_count"]:
+            st.caption("Resultado por linha já baixado; calcule de novo para baixá-lo outra vez.")
+
+#_______________________________
+
+# --- Seção: Administração (oculta; ?admin=1) --- #
+elif section == "Administração":
+    st.header("Instrumentação do Painel")
+    st.markdown("Tempo de parede, tempo de CPU, memória alocada, acertos de cache e bytes enviados ao navegador por etapa de cada execução.")
+    st.caption(f"Motor de consultas: {load_data().name} (variável de ambiente PAINEL_MOTOR)")
+
+    profiling_on = st.toggle("Instrumentação ligada", value=profiling.PROFILER.enabled,
+                             help="Vale para o processo inteiro. O tracemalloc deixa todas as execuções mais lentas enquanto estiver ligado.")
+    if profiling_on != profiling.PROFILER.enabled:
+        if profiling_on:
+            profiling.PROFILER.enable()
+        else:
+            profiling.PROFILER.disable()
+        st.rerun()
+
+    st.subheader("Memória das Tabelas")
+    memory_df = resources.memory_report()
+    memory_totals = memory_df.groupby("frame", sort=False)[["bytes", "default_bytes"]].sum()
+    for col_frame, (frame_name, frame_total) in zip(st.columns(len(memory_totals)), memory_totals.iterrows()):
+        col_frame.metric(f"Tabela {frame_name}", f"{frame_total['bytes'] / 2 ** 20:.1f} MB",
+                         f"{frame_total['bytes'] / frame_total['default_bytes'] - 1:+.0%} em relação aos tipos padrão",
+                         delta_color="inverse")
+    if load_data().name == "duckdb":
+        st.caption("Com o DuckDB, os créditos ficam nos arquivos Parquet e não ocupam a memória do processo.")
+    with st.expander("Memória por coluna"):
+        st.dataframe(memory_df, hide_index=True, use_container_width=True)
+
+    st.subheader("Cache de Figuras")
+    figure_stats = figure_cache.FIGURES.stats()
+    requests_total = figure_stats["hits"] + figure_stats["misses"]
+    col_entries, col_memory, col_hits, col_evictions = st.columns(4)
+    col_entries.metric("Figuras em cache", f"{figure_stats['entries']:,} / {figure_cache.FIGURES.max_entries:,}")
+    col_memory.metric("Memória", f"{figure_stats['bytes'] / 2 ** 20:.1f} / {figure_cache.FIGURES.max_bytes / 2 ** 20:.0f} MB")
+    col_hits.metric("Taxa de acerto", f"{figure_stats['hits'] / requests_total:.0%}" if requests_total else "-")
+    col_evictions.metric("Descartes (LRU)", f"{figure_stats['evictions']:,}")
+
+    summary = profiling.PROFILER.summary()
+    if summary.empty:
+        st.info("Nenhuma etapa registrada ainda. Com a instrumentação ligada, navegue pelas seções e volte aqui.")
+    else:
+        st.subheader("Resumo por Etapa")
+        st.dataframe(summary, use_container_width=True)
+
+        st.subheader("Registros Recentes")
+        st.dataframe(profiling.PROFILER.frame().tail(200).iloc[::-1], hide_index=True, use_container_width=True)
+
+        col_json, col_prom, col_clear = st.columns(3)
+        col_json.download_button("Exportar JSON", profiling.PROFILER.to_json(),
+                                 file_name="profiling.json", mime="application/json")
+        col_prom.download_button("Exportar Prometheus", profiling.PROFILER.to_prometheus(),
+                                 file_name="profiling.prom", mime="text/plain")
+        if col_clear.button("Limpar registros"):
+            profiling.PROFILER.clear()
+            st.rerun()
+
+profiling.exit_stage(section_stage)
+
+# Depois da primeira renderização: pré-aquece em segundo plano os recursos das
+# outras seções (uma vez por processo) e mostra o progresso na barra lateral
+warmer = warmup.start()
+
+@st.experimental_fragment(run_every=1 if not warmer.done else None)
+def warmup_status():
+    """Progresso do pré-aquecimento na barra lateral (atualizado a cada segundo enquanto roda)."""
+    finished, total = warmer.progress()
+    if not warmer.done:
+        st.progress(finished / total if total else 0.0,
+                    text=f"Pré-aquecendo caches: {finished}/{total} tarefas ({warmer.elapsed():.0f} s)")
+        return
+    failed = [row for row in warmer.report() if row["estado"] == "falhou"]
+    st.caption(f"Caches pré-aquecidos em {warmer.elapsed():.1f} s ({total} tarefas"
+               + (f", {len(failed)} com erro)" if failed else ")"))
+    with st.expander("Tempos do pré-aquecimento"):
+        st.dataframe(pd.DataFrame(warmer.report()), hide_index=True, use_container_width=True)
+
+with st.sidebar:
+    warmup_status()
+
+profiling.end_run()
@@ -0,0 +1,8 @@
+"""
+Benchmarks do painel: gerador de dados sintéticos e medições sem interface.
+
+Uso (a partir da raiz do repositório):
+
+    python -m benchmarks.generate_data --size 1m
+    python -m benchmarks.run_benchmarks --size 1m --output resultados.json
+"""
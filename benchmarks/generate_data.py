@@ -0,0 +1,159 @@
+"""
+Gera projects.csv e credits.csv sintéticos, com o mesmo esquema dos
+arquivos reais, para medir o painel em volumes diferentes, e um arquivo de
+consumo (consumption.csv) para o cálculo em lote da calculadora de emissões.
+
+    python -m benchmarks.generate_data --size 10k
+    python -m benchmarks.generate_data --rows 2500000 --out-dir /tmp/dados
+
+Os créditos são gravados em blocos, então 10 milhões de linhas não precisam
+caber na memória de uma vez. O countries.geo.json do repositório é copiado
+para o diretório de saída, que fica autocontido (é o diretório de trabalho
+dos benchmarks).
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+import emissions
+import geo_layers
+
+# Número de linhas de credits.csv em cada tamanho predefinido
+SIZES = {
+    "10k": 10_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+DATA_ROOT = os.path.join("benchmarks", "data")
+WRITE_CHUNK = 1_000_000
+# Arquivo de consumo (atividade, quantidade), com o mesmo número de linhas dos créditos
+CONSUMPTION_CSV = "consumption.csv"
+
+CATEGORIES = ["ghg-management", "renewable-energy", "fuel-switching", "forest", "energy-efficiency",
+              "agriculture", "unknown", "land-use", "carbon-capture", "biochar"]
+STATUSES = ["unknown", "listed", "registered", "completed", "active", "canceled", "inactive"]
+REGISTRIES = ["verra", "gold-standard", "climate-action-reserve", "american-carbon-registry", "art-trees"]
+PROTOCOLS = ["vm0048", "vm0007", "ams-i-d", "ams-iii-h", "acm0002", "arb-forest", "gs-cookstoves", "vmr0006"]
+
+
+def default_out_dir(size):
+    return os.path.join(DATA_ROOT, size)
+
+
+def _country_names():
+    """Países do GeoJSON (para o mapa ter correspondência) ou uma lista fixa."""
+    try:
+        names = [f["properties"]["name"] for f in geo_layers.load_geojson()["features"]]
+    except FileNotFoundError:
+        names = ["Brazil", "India", "China", "Indonesia", "Kenya", "Peru", "Colombia", "Mexico"]
+    # Inclui os nomes brutos que o data_loader padroniza
+    return names + list(data_loader.COUNTRY_NAMES)
+
+
+def _dates(rng, n, start="2000-01-01", days=365 * 24, missing=0.0):
+    values = pd.Series(pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, n), unit="D"))
+    return values.dt.strftime("%Y-%m-%dT%H:%M:%SZ").where(rng.random(n) >= missing)
+
+
+def generate_projects(n_projects, rng):
+    """DataFrame de projetos com as colunas de projects.csv."""
+    types = list(data_loader.PROJECT_TYPE_TRANSLATIONS) + ["REDD+", "Improved Forest Management", "Unknown"]
+    countries = _country_names()
+    # Emissões com cauda longa; cerca de 40% dos projetos sem créditos emitidos
+    issued = np.where(rng.random(n_projects) < 0.4, 0, rng.lognormal(9, 2.5, n_projects).astype("int64"))
+    retired = (issued * rng.random(n_projects)).astype("int64")
+    protocols = [str(list(rng.choice(PROTOCOLS, size=rng.integers(1, 3), replace=False)))
+                 for _ in range(n_projects)]
+    return pd.DataFrame({
+        "category": rng.choice(CATEGORIES, n_projects),
+        "country": rng.choice(countries, n_projects),
+        "first_issuance_at": _dates(rng, n_projects, missing=0.4),
+        "first_retirement_at": _dates(rng, n_projects, start="2005-01-01", days=365 * 19, missing=0.5),
+        "is_compliance": rng.random(n_projects) < 0.1,
+        "issued": issued,
+        "listed_at": _dates(rng, n_projects, missing=0.5),
+        "name": [f"Projeto Sintético {i}" for i in range(n_projects)],
+        "project_id": [f"SYN{i}" for i in range(n_projects)],
+        "project_type": rng.choice(types, n_projects),
+        "project_type_source": "synthetic",
+        "project_url": [f"https://example.org/projects/SYN{i}" for i in range(n_projects)],
+        "proponent": rng.choice([f"Proponente {i}" for i in range(max(1, n_projects // 20))], n_projects),
+        "protocol": protocols,
+        "registry": rng.choice(REGISTRIES, n_projects),
+        "retired": retired,
+        "status": rng.choice(STATUSES, n_projects),
+    })
+
+
+def generate_credits(n_rows, project_ids, rng):
+    """DataFrame de créditos com as colunas de credits.csv."""
+    return pd.DataFrame({
+        "project_id": rng.choice(project_ids, n_rows),
+        "quantity": rng.integers(1, 5000, n_rows),
+        "vintage": rng.integers(2000, 2024, n_rows),
+        "transaction_date": _dates(rng, n_rows, start="2005-01-01", days=365 * 19),
+        "transaction_type": rng.choice(["issuance", "retirement"], n_rows, p=[0.4, 0.6]),
+    })
+
+
+def generate_consumption(n_rows, activities, rng):
+    """Linhas de consumo do cálculo em lote; ~1% com atividade fora da tabela de fatores."""
+    activity = rng.choice(np.append(activities, "Atividade desconhecida"), n_rows,
+                          p=np.append(np.full(len(activities), 0.99 / len(activities)), 0.01))
+    return pd.DataFrame({
+        "activity": activity,
+        "quantity": rng.lognormal(4, 1.5, n_rows).round(2),
+        "asset": rng.integers(0, 10_000, n_rows),
+    })
+
+
+def generate(n_rows, out_dir, n_projects=None, seed=0):
+    """Grava projects.csv, credits.csv, consumption.csv e countries.geo.json em `out_dir`."""
+    rng = np.random.default_rng(seed)
+    n_projects = n_projects or int(np.clip(n_rows // 100, 1_000, 100_000))
+    os.makedirs(out_dir, exist_ok=True)
+
+    projects = generate_projects(n_projects, rng)
+    projects.to_csv(os.path.join(out_dir, data_loader.PROJECTS_CSV), index=False)
+
+    project_ids = projects.loc[projects["issued"] > 0, "project_id"].to_numpy()
+    credits_path = os.path.join(out_dir, data_loader.CREDITS_CSV)
+    for start in range(0, n_rows, WRITE_CHUNK):
+        chunk = generate_credits(min(WRITE_CHUNK, n_rows - start), project_ids, rng)
+        chunk.to_csv(credits_path, index=False, mode="w" if start == 0 else "a", header=start == 0)
+
+    if os.path.exists(emissions.FACTORS_CSV):
+        activities = emissions.load_factors()["activity"].to_numpy()
+        consumption_path = os.path.join(out_dir, CONSUMPTION_CSV)
+        for start in range(0, n_rows, WRITE_CHUNK):
+            chunk = generate_consumption(min(WRITE_CHUNK, n_rows - start), activities, rng)
+            chunk.to_csv(consumption_path, index=False, mode="w" if start == 0 else "a", header=start == 0)
+
+    if os.path.exists(geo_layers.GEOJSON_PATH):
+        shutil.copyfile(geo_layers.GEOJSON_PATH, os.path.join(out_dir, geo_layers.GEOJSON_PATH))
+    # Um cache colunar antigo não corresponde mais aos CSVs gerados
+    shutil.rmtree(os.path.join(out_dir, data_loader.CACHE_DIR), ignore_errors=True)
+    return {"out_dir": out_dir, "projects": n_projects, "credits": n_rows, "seed": seed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos para os benchmarks.")
+    parser.add_argument("--size", choices=list(SIZES), default="10k")
+    parser.add_argument("--rows", type=int, help="número de créditos (substitui --size)")
+    parser.add_argument("--projects", type=int, help="número de projetos (padrão: créditos / 100)")
+    parser.add_argument("--out-dir", help=f"padrão: {DATA_ROOT}/<size>")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    n_rows = args.rows or SIZES[args.size]
+    out_dir = args.out_dir or default_out_dir(args.size if not args.rows else str(args.rows))
+    print(json.dumps(generate(n_rows, out_dir, args.projects, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
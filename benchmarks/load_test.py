@@ -0,0 +1,314 @@
+"""
+Teste de carga do painel com várias sessões simultâneas, sem navegador.
+
+    python -m benchmarks.load_test --size 10k --sessions 8 --duration 60
+    python -m benchmarks.load_test --size 1m --sessions 1 2 4 8 16 --output carga.json
+
+Cada sessão simulada é um AppTest do Streamlit numa thread própria, com o
+estado da sessão preservado entre as execuções, como um analista com uma
+aba aberta. Todas as sessões rodam no mesmo processo e compartilham os
+recursos em cache (st.cache_resource, resources.py, figure_cache), como
+no servidor. Em laço, até o fim da duração, cada sessão escolhe uma seção
+ao acaso, executa o script e, nas seções com controles, faz uma interação
+aleatória (ano, métrica e nível de detalhe do mapa, intervalo de datas),
+que é outra execução.
+
+O relatório traz, por seção e tipo de execução (navegação ou interação), os
+percentis da latência e as execuções com exceção; a vazão (execuções por
+segundo) do conjunto; e a memória residente (RSS) do processo, amostrada
+durante o teste e medida ao fim de cada execução. Como as sessões
+compartilham o processo, o RSS por seção é o do processo ao fim das
+execuções daquela seção, não o consumo isolado de cada uma.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+import data_loader
+from benchmarks import generate_data
+from benchmarks.run_benchmarks import APP_PATH, REPO_ROOT, SECTIONS, environment, max_rss_mb
+
+# Chave do estado da sessão com a seção que o menu simulado devolve
+SECTION_KEY = "_teste_carga_secao"
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Intervalo entre as amostras de RSS
+RSS_INTERVAL = 0.25
+
+
+def rss_mb():
+    """Memória residente atual do processo (Linux: /proc; nos demais, o pico)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return max_rss_mb()
+
+
+class RSSMonitor:
+    """Amostra o RSS do processo numa thread, até `stop()`."""
+
+    def __init__(self, interval=RSS_INTERVAL):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-monitor", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.samples.append(rss_mb())
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return {
+            "start_mb": self.samples[0],
+            "end_mb": self.samples[-1],
+            "peak_mb": max(self.samples),
+            "mean_mb": float(np.mean(self.samples)),
+        }
+
+
+def install_simulation():
+    """
+    Prepara o processo para vários AppTest simultâneos:
+
+    - o option_menu devolve a seção gravada no estado de cada sessão;
+    - o AppTest cria um Runtime falso no início de cada execução e o apaga
+      no fim, o que, com sessões simultâneas, derrubaria as execuções das
+      outras. Aqui todas usam um único Runtime falso, como as sessões de um
+      servidor, e a opção global.appTest (que o AppTest liga só durante a
+      execução) fica ligada.
+    """
+    import logging
+    from unittest.mock import MagicMock
+
+    import streamlit as st
+    import streamlit_option_menu
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    def simulated_menu(menu_title, options, **kwargs):
+        return st.session_state.get(SECTION_KEY, options[kwargs.get("default_index", 0)])
+
+    streamlit_option_menu.option_menu = simulated_menu
+
+    shared_runtime = MagicMock(spec=Runtime)
+    shared_runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared_runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: shared_runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+    config.set_option("global.appTest", True)
+    # Com o Runtime presente, o estado das sessões alterado pelas threads do
+    # teste (fora de um script) geraria um aviso a cada execução
+    logging.getLogger("streamlit.runtime.scriptrunner.script_run_context").setLevel(logging.ERROR)
+
+
+# --- Interações aleatórias por seção --- #
+
+def _widget(widgets, label_prefix):
+    return next((widget for widget in widgets if widget.label.startswith(label_prefix)), None)
+
+
+def _pick_year(app, rng):
+    year = _widget(app.selectbox, "Selecione o Ano de Implementação")
+    if year is None or not year.options:
+        return None
+    return year.select_index(rng.randrange(len(year.options)))
+
+
+def _pick_market(app, rng):
+    if rng.random() < 0.5:
+        dates = _widget(app.date_input, "Selecione o período")
+        if dates is not None:
+            low, high = dates.min, dates.max
+            days = (high - low).days
+            start = low + (high - low) * rng.random() if days else low
+            end = start + (high - start) * rng.random()
+            return dates.set_value((start, end))
+    metric = app.radio(key="folium_metric")
+    detail = app.select_slider(key="folium_detail")
+    metric.set_value(rng.choice(metric.options))
+    return detail.set_value(rng.choice(detail.options))
+
+
+INTERACTIONS = {
+    "Exploração dos Dados": _pick_year,
+    "Dinâmica do Mercado": _pick_market,
+}
+
+
+class SimulatedSession:
+    """Uma sessão do painel: um AppTest mantido entre as execuções."""
+
+    def __init__(self, number, seed, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.number = number
+        self.rng = random.Random(seed)
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.records = []
+
+    def _run(self, section, kind, run):
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        self.records.append({
+            "session": self.number, "section": section, "kind": kind, "seconds": seconds,
+            "exceptions": len(self.app.exception), "rss_mb": rss_mb(),
+        })
+
+    def step(self, sections):
+        """Navega para uma seção ao acaso e, se ela tiver controles, interage uma vez."""
+        section = self.rng.choice(sections)
+        self.app.session_state[SECTION_KEY] = section
+        self._run(section, "navegação", self.app.run)
+        interact = INTERACTIONS.get(section)
+        if interact is not None and not self.app.exception:
+            widget = interact(self.app, self.rng)
+            if widget is not None:
+                self._run(section, "interação", widget.run)
+
+
+def _summary(records, wall_s):
+    seconds = np.array([record["seconds"] for record in records])
+    if not len(seconds):
+        return {"runs": 0}
+    return {
+        "runs": len(seconds),
+        "errors": sum(record["exceptions"] > 0 for record in records),
+        **{f"p{p}_s": float(np.percentile(seconds, p)) for p in PERCENTILES},
+        "mean_s": float(seconds.mean()),
+        "max_s": float(seconds.max()),
+        "throughput_rps": len(seconds) / wall_s,
+        "rss_max_mb": max(record["rss_mb"] for record in records),
+    }
+
+
+def run_load(sessions, duration, sections=SECTIONS, seed=0, timeout=600):
+    """
+    Executa `sessions` sessões simultâneas por `duration` segundos e retorna
+    o resumo geral, por seção e por (seção, tipo), e as amostras de RSS.
+    """
+    simulated = [SimulatedSession(i, seed + i, timeout) for i in range(sessions)]
+    deadline = time.perf_counter() + duration
+    errors = []
+
+    def loop(session):
+        try:
+            while time.perf_counter() < deadline:
+                session.step(sections)
+        except Exception as error:  # uma sessão com erro não derruba as demais
+            errors.append(f"sessão {session.number}: {type(error).__name__}: {error}")
+
+    monitor = RSSMonitor().start()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=loop, args=(session,), name=f"sessao-{session.number}") for session in simulated]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_s = time.perf_counter() - start
+    rss = monitor.stop()
+
+    records = [record for session in simulated for record in session.records]
+    by_section, by_kind = {}, {}
+    for record in records:
+        by_section.setdefault(record["section"], []).append(record)
+        by_kind.setdefault(f"{record['section']} / {record['kind']}", []).append(record)
+    return {
+        "sessions": sessions,
+        "wall_s": wall_s,
+        "total": _summary(records, wall_s),
+        "sections": {section: _summary(rows, wall_s) for section, rows in by_section.items()},
+        "section_kinds": {name: _summary(rows, wall_s) for name, rows in sorted(by_kind.items())},
+        "rss": rss,
+        "session_errors": errors,
+    }
+
+
+def warm_up(sections=SECTIONS, timeout=600):
+    """Uma passagem sequencial por todas as seções (cargas e caches), medida à parte."""
+    session = SimulatedSession(-1, 0, timeout)
+    for section in sections:
+        session.app.session_state[SECTION_KEY] = section
+        session._run(section, "navegação", session.app.run)
+    return {record["section"]: record["seconds"] for record in session.records}
+
+
+def format_report(result):
+    """Tabela (texto) com os percentis de latência e o RSS por seção e tipo de execução."""
+    header = (f"{'seção / tipo':<44}{'n':>6}{'erros':>6}" + "".join(f"{f'p{p} (s)':>9}" for p in PERCENTILES)
+              + f"{'RSS máx (MB)':>14}")
+    lines = [f"{result['sessions']} sessões, {result['wall_s']:.0f}s: "
+             f"{result['total']['throughput_rps']:.2f} execuções/s, "
+             f"RSS {result['rss']['start_mb']:.0f} -> {result['rss']['peak_mb']:.0f} MB (pico)", header]
+    for name, stats in [*result["section_kinds"].items(), ("total", result["total"])]:
+        if not stats["runs"]:
+            continue
+        lines.append(f"{name:<44}{stats['runs']:>6}{stats['errors']:>6}"
+                     + "".join(f"{stats[f'p{p}_s']:>9.3f}" for p in PERCENTILES) + f"{stats['rss_max_mb']:>14.0f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga do painel com sessões simultâneas (AppTest).")
+    parser.add_argument("--size", choices=list(generate_data.SIZES), default="10k")
+    parser.add_argument("--data-dir", help=f"padrão: {generate_data.DATA_ROOT}/<size>")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[4],
+                        help="sessões simultâneas; com vários valores, um teste para cada")
+    parser.add_argument("--duration", type=float, default=60.0, help="segundos de cada teste")
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=SECTIONS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-warmup", action="store_true", help="não faz a passagem inicial pelas seções")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or generate_data.default_out_dir(args.size)
+    if not os.path.exists(os.path.join(data_dir, data_loader.CREDITS_CSV)):
+        print(f"Gerando dados sintéticos em {data_dir}...", file=sys.stderr)
+        generate_data.generate(generate_data.SIZES[args.size], data_dir)
+
+    install_simulation()
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    previous_dir = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        report = {"environment": environment(), "data_dir": data_dir, "duration_s": args.duration}
+        if not args.no_warmup:
+            report["warmup_s"] = warm_up(args.sections)
+        report["runs"] = []
+        for sessions in args.sessions:
+            result = run_load(sessions, args.duration, args.sections, args.seed)
+            print(format_report(result) + "\n", file=sys.stderr)
+            report["runs"].append(result)
+        report["max_rss_mb"] = max_rss_mb()
+    finally:
+        os.chdir(previous_dir)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
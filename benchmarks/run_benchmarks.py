@@ -0,0 +1,336 @@
+"""
+Mede, sem interface, as etapas de cálculo do painel sobre um conjunto de
+dados (gerado por benchmarks.generate_data) e grava o resultado em JSON.
+
+    python -m benchmarks.run_benchmarks --size 1m --output main.json
+    python -m benchmarks.run_benchmarks --size 1m --apptest --output branch.json
+    python -m benchmarks.run_benchmarks --compare main.json branch.json
+
+Cada etapa chama as mesmas funções usadas pelo app.py e registra tempo de
+parede (perf_counter), tempo de CPU (process_time) e o pico de memória
+alocada durante a etapa (tracemalloc). Com --apptest, cada seção do painel
+também é executada pelo AppTest do Streamlit, sem navegador.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+import aggregates
+import data_loader
+import dataset
+import emissions
+import export
+import filters
+import geo_layers
+import pricing_model
+import protocols
+import query_engine
+import resources
+import scatter_lod
+import search
+import segmentation
+from benchmarks import generate_data
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "app.py")
+
+SECTIONS = [
+    "Introdução", "Exploração dos Dados", "Dinâmica do Mercado",
+    "Fatores de Precificação", "Segmentação de Projetos", "Metodologias", "Busca de Projetos",
+    "Calculadora de Emissões",
+]
+
+
+# --- Medição --- #
+
+def measure(function, repeat=1, setup=None):
+    """
+    Executa `function` `repeat` vezes e retorna (resultado da última
+    execução, métricas). `setup` roda antes de cada execução, fora da medição.
+    """
+    wall, cpu, peak = [], [], []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        result = function()
+        wall.append(time.perf_counter() - wall_start)
+        cpu.append(time.process_time() - cpu_start)
+        peak.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return result, {
+        "wall_s": wall,
+        "best_s": min(wall),
+        "median_s": statistics.median(wall),
+        "cpu_s": statistics.median(cpu),
+        "peak_mb": max(peak) / 2 ** 20,
+    }
+
+
+def max_rss_mb():
+    # ru_maxrss é em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# --- Etapas --- #
+
+def run_stages(data_dir, repeat=1):
+    """Mede cada etapa de cálculo do painel sobre os arquivos de `data_dir`."""
+    paths = {
+        "projects_path": os.path.join(data_dir, data_loader.PROJECTS_CSV),
+        "credits_path": os.path.join(data_dir, data_loader.CREDITS_CSV),
+        "cache_dir": os.path.join(data_dir, data_loader.CACHE_DIR),
+    }
+    results = {}
+
+    def stage(name, function, setup=None):
+        value, results[name] = measure(function, repeat, setup)
+        print(f"{name:<28}{results[name]['best_s']:>10.3f}s{results[name]['peak_mb']:>10.1f} MB", file=sys.stderr)
+        return value
+
+    def clear_cache():
+        shutil.rmtree(paths["cache_dir"], ignore_errors=True)
+
+    # Carga: a frio (CSV -> cache colunar) e a quente (cache mapeado em memória)
+    stage("load_cold", lambda: dataset.load_dataset(**paths), setup=clear_cache)
+    carbon_data = stage("load_warm", lambda: dataset.load_dataset(**paths))
+
+    # Exploração dos Dados: cubo ano/tipo e o resumo de preços de cada ano
+    cube = stage("year_cube_build", lambda: aggregates.build_year_type_cube(carbon_data))
+    stage("year_filter_price_summary", lambda: [
+        (cube.year_summary(year), cube.year_cells(year)[["price_mean", "price_median", "price_min", "price_max"]])
+        for year in cube.years
+    ])
+    def year_scatter():
+        busiest_year = max(cube.rows, key=lambda year: len(cube.rows[year]))
+        points = carbon_data.credit_view(["project_type", "co2_reduced", "price"], rows=cube.rows[busiest_year])
+        return scatter_lod.ScatterLOD(points["co2_reduced"], points["price"], points["project_type"]).view()
+
+    stage("year_scatter_lod", year_scatter)
+
+    # Dinâmica do Mercado: rollups diário/mensal e a série mensal do painel
+    store = stage("time_series_build", lambda: aggregates.build_time_series(carbon_data))
+    if store is not None:
+        stage("monthly_series", lambda: store.series("M"))
+
+    # Métricas de atividade de crédito por projeto, lidas pelo mapa, pela
+    # visão geral, pela precificação e pela segmentação
+    projects = carbon_data.projects
+    project_metrics = stage("project_metrics_build", lambda: aggregates.build_project_metrics(carbon_data))
+    features = stage("project_features", lambda: aggregates.project_features(projects, project_metrics.table()))
+    stage("overview", lambda: project_metrics.overview(projects))
+
+    # Mapa: agregação por país, injeção das métricas no GeoJSON e HTML do Folium
+    metrics = stage("country_aggregation", lambda: geo_layers.country_metrics(features))
+    geojson_path = os.path.join(data_dir, geo_layers.GEOJSON_PATH)
+    if os.path.exists(geojson_path):
+        geojson = geo_layers.load_geojson(geojson_path)
+        stage("geojson_injection", lambda: geo_layers.GeoLayerCache(geojson, metrics).feature_collection())
+        stage("map_render", lambda: geo_layers.GeoLayerCache(geojson, metrics).map_html(next(iter(geo_layers.MAP_METRICS))))
+
+    # Filtros globais: bitmaps das facetas, máscara de uma seleção de duas
+    # facetas e o cubo ano/tipo só com os projetos selecionados
+    facet_index = stage("facet_index_build", lambda: filters.FacetIndex(projects))
+    selection = (("project_type", tuple(facet_index.values["project_type"][:5])), ("is_compliance", (False,)))
+    project_mask = stage("facet_mask", lambda: facet_index.mask(selection))
+    stage("filtered_year_cube", lambda: aggregates.build_year_type_cube(carbon_data, project_mask=project_mask))
+
+    # Metodologias: interpretação da coluna protocol e totais pelo índice invertido
+    pairs = stage("protocol_explode", lambda: data_loader.explode_protocols(projects))
+    protocol_index = protocols.ProtocolIndex(pairs, len(projects))
+    stage("protocol_totals", lambda: protocols.methodology_totals(protocol_index, projects))
+
+    # Busca de projetos: índice de tokens e consultas por prefixo
+    project_search = stage("search_index_build", lambda: search.ProjectSearch(projects))
+    stage("search_queries", lambda: [project_search.search(query) for query in ("vcs", "solar coo", "wind power")])
+
+    # Calculadora de Emissões: o arquivo de consumo inteiro, lido e calculado
+    # em blocos e gravado num arquivo temporário, em cada formato
+    consumption_path = os.path.join(data_dir, generate_data.CONSUMPTION_CSV)
+    if os.path.exists(consumption_path):
+        factors = emissions.load_factors(os.path.join(REPO_ROOT, emissions.FACTORS_CSV))
+
+        def emissions_batch(file_format):
+            chunks = emissions.read_chunks(consumption_path, consumption_path)
+            file, _ = export.spool(emissions.iter_results(chunks, factors, emissions.BatchSummary()), file_format)
+            file.close()
+
+        stage("emissions_batch_csv", lambda: emissions_batch("CSV"))
+        stage("emissions_batch_parquet", lambda: emissions_batch("Parquet"))
+
+    # Exportação: todos os créditos, em blocos de export.BUFFER_BYTES, num arquivo temporário
+    pandas_engine = query_engine.PandasEngine(carbon_data)
+    export_columns = [column for column in resources.EXPORT_COLUMNS
+                      if column in carbon_data.credits.columns or column in projects.columns]
+
+    def export_credits(file_format):
+        chunksize = export.chunk_rows(pandas_engine.credit_sample(export_columns))
+        _, chunks = pandas_engine.credit_chunks(export_columns, chunksize)
+        file, _ = export.spool(chunks, file_format)
+        file.close()
+
+    stage("export_credits_csv", lambda: export_credits("CSV"))
+    stage("export_credits_parquet", lambda: export_credits("Parquet"))
+
+    # Fatores de Precificação e Segmentação
+    stage("pricing_fit", lambda: pricing_model.fit_from_metrics(projects, project_metrics))
+    stage("kmeans", lambda: segmentation.SegmentationEngine(features).segment())
+
+    # Motor de consultas DuckDB sobre Parquet: as mesmas agregações, feitas na
+    # varredura dos arquivos (a memória do DuckDB não aparece no tracemalloc)
+    if importlib.util.find_spec("duckdb") is not None:
+        parquet_dir = os.path.join(paths["cache_dir"], "parquet")
+        csv_paths = {"projects_path": paths["projects_path"], "credits_path": paths["credits_path"]}
+        stage("duckdb_parquet_build", lambda: data_loader.load_parquet_tables(**csv_paths, parquet_dir=parquet_dir),
+              setup=lambda: shutil.rmtree(parquet_dir, ignore_errors=True))
+        engine = stage("duckdb_open", lambda: query_engine.DuckDBEngine(parquet_dir))
+        stage("duckdb_year_cube", engine.year_type_cube)
+        stage("duckdb_time_series", engine.time_series)
+        stage("duckdb_filtered_summary", lambda: engine.credit_summary(
+            ["project_type"], years=cube.years[:3], start=pd.Timestamp("2015-01-01"), end=pd.Timestamp("2019-12-31")))
+        stage("duckdb_filtered_year_cube", lambda: engine.year_type_cube(project_mask=project_mask))
+        stage("duckdb_project_metrics", engine.project_metrics)
+        stage("duckdb_pricing_fit", lambda: pricing_model.fit_from_engine(engine))
+
+    # Memória das tabelas carregadas (tipos compactos) e com os tipos padrão do pandas
+    memory = data_loader.memory_report({"projects": carbon_data.projects, "credits": carbon_data.credits})
+    frame_bytes = memory.groupby("frame")[["bytes", "default_bytes"]].sum().astype(int).to_dict("index")
+    return results, {"projects": len(carbon_data.projects), "credits": len(carbon_data.credits),
+                     "frame_bytes": frame_bytes}
+
+
+def run_apptest(data_dir, repeat=1):
+    """
+    Executa cada seção do painel com o AppTest (sem navegador). A primeira
+    execução inclui a carga dos recursos em cache; as seguintes, não.
+    """
+    import streamlit_option_menu
+    from streamlit.testing.v1 import AppTest
+
+    current = {"section": None}
+
+    def fixed_menu(menu_title, options, **kwargs):
+        return current["section"]
+
+    streamlit_option_menu.option_menu = fixed_menu
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    previous_dir = os.getcwd()
+    os.chdir(data_dir)
+    results = {}
+    try:
+        for section in SECTIONS:
+            current["section"] = section
+            runs = []
+            for _ in range(repeat + 1):
+                app = AppTest.from_file(APP_PATH, default_timeout=600)
+                start = time.perf_counter()
+                app.run()
+                runs.append(time.perf_counter() - start)
+            results[section] = {
+                "first_s": runs[0],
+                "warm_s": statistics.median(runs[1:]),
+                "exceptions": [str(e.value)[:500] for e in app.exception],
+            }
+            print(f"{section:<28}{runs[0]:>10.3f}s{results[section]['warm_s']:>10.3f}s", file=sys.stderr)
+    finally:
+        os.chdir(previous_dir)
+    return results
+
+
+# --- Metadados e comparação --- #
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    versions = {}
+    for module in ("pandas", "numpy", "pyarrow", "duckdb", "sklearn", "streamlit", "folium"):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+    }
+
+
+def compare(base, head):
+    """Tabela (texto) com a razão head/base do melhor tempo e do pico de memória."""
+    lines = [f"{'etapa':<28}{'base (s)':>10}{'head (s)':>10}{'tempo':>8}{'memória':>9}"]
+    for name, head_stage in head["stages"].items():
+        base_stage = base["stages"].get(name)
+        if base_stage is None:
+            continue
+        lines.append(
+            f"{name:<28}{base_stage['best_s']:>10.3f}{head_stage['best_s']:>10.3f}"
+            f"{head_stage['best_s'] / max(base_stage['best_s'], 1e-9):>7.2f}x"
+            f"{head_stage['peak_mb'] / max(base_stage['peak_mb'], 1e-9):>8.2f}x"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks das etapas de cálculo do painel.")
+    parser.add_argument("--size", choices=list(generate_data.SIZES), default="10k")
+    parser.add_argument("--data-dir", help=f"padrão: {generate_data.DATA_ROOT}/<size>")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--apptest", action="store_true", help="também executa as seções com o AppTest")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="compara dois resultados em JSON")
+    args = parser.parse_args(argv)
+    # As etapas rodam com o Copy-on-Write do pandas, como no painel (app.py)
+    pd.set_option("mode.copy_on_write", True)
+
+    if args.compare:
+        with open(args.compare[0]) as base, open(args.compare[1]) as head:
+            print(compare(json.load(base), json.load(head)))
+        return
+
+    data_dir = args.data_dir or generate_data.default_out_dir(args.size)
+    if not os.path.exists(os.path.join(data_dir, data_loader.CREDITS_CSV)):
+        print(f"Gerando dados sintéticos em {data_dir}...", file=sys.stderr)
+        generate_data.generate(generate_data.SIZES[args.size], data_dir)
+
+    stages, rows = run_stages(data_dir, args.repeat)
+    report = {
+        "environment": environment(),
+        "data_dir": data_dir,
+        "rows": rows,
+        "repeat": args.repeat,
+        "stages": stages,
+    }
+    if args.apptest:
+        report["apptest"] = run_apptest(data_dir, args.repeat)
+    report["max_rss_mb"] = max_rss_mb()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,715 @@
+"""
+Pipeline de carga dos dados de projetos e créditos de carbono.
+
+Este módulo não depende do Streamlit: o app chama `load_frames()` e trata os
+erros na interface. O resultado do processamento é gravado em um cache colunar
+(Arrow IPC) em disco, invalidado pela impressão digital dos CSVs de origem,
+para que reinícios do servidor não precisem reprocessar os CSVs.
+"""
+import ast
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+PROJECTS_CSV = "projects.csv"
+CREDITS_CSV = "credits.csv"
+CACHE_DIR = ".cache"
+
+# Linhas de credits.csv processadas por vez
+CREDITS_CHUNKSIZE = 250_000
+
+# Incremente sempre que o processamento abaixo mudar, para invalidar caches antigos.
+CACHE_SCHEMA_VERSION = 7
+
+CACHE_TABLES = ("projects", "credits")
+
+# Tabelas Parquet lidas pelo motor de consultas (query_engine.py)
+PARQUET_DIR = os.path.join(CACHE_DIR, "parquet")
+
+# Padronização dos nomes dos países (para o Folium)
+COUNTRY_NAMES = {
+    'United States': 'United States of America',
+    'Congo, The Democratic Republic of the': 'Democratic Republic of the Congo',
+    'Tanzania, United Republic of': 'United Republic of Tanzania',
+    "Lao People's Democratic Republic": 'Laos',
+    'Viet Nam': 'Vietnam',
+    'Korea, Republic of': 'South Korea'
+}
+
+PROJECT_TYPE_TRANSLATIONS = {
+    'Afforestation + Reforestation': 'Florestamento e Reflorestamento',
+    'Avoided Grassland Conversion': 'Conversão de Pastagem Evitada',
+    'Biomass': 'Biomassa',
+    'Centralized Solar': 'Energia Solar Centralizada',
+    'Clean Water': 'Água Limpa',
+    'Compost': 'Compostagem',
+    'Cookstove': 'Fogões Eficientes',
+    'Distributed Solar': 'Energia Solar Distribuída',
+    'Energy Efficiency': 'Eficiência Energética',
+    'Landfill': 'Aterro Sanitário',
+    'Waste Diversion': 'Desvio de Resíduos',
+    'Renewable Energy': 'Energia Renovável',
+    'Advanced Refrigerant': 'Refrigerante Avançado',
+    'Manure Bodigester': 'Biodigestor de Esterco',
+    'Road Construction': 'Construção de Estradas',
+    'Gas Leak Repair': 'Reparo de Vazamento de Gás',
+    'Wind': 'Energia Eólica'
+    # Adicione outras traduções conforme encontrar novos tipos de projeto
+}
+
+# Códigos de metodologia do MDL e da Verra (ex.: "AMS-III.AK", "vm0048",
+# "AR-ACM0003"), padronizados para a grafia em minúsculas com hífens
+PROTOCOL_CODE = re.compile(r"(?:ar-)?(?:acm|ams|am|vmr|vm)(?=[\d-])[\w.-]*", re.IGNORECASE)
+
+# Tipos compactos das colunas: categorias para os textos com poucos valores
+# distintos e o menor inteiro que comporta o domínio de cada coluna numérica.
+# co2_reduced (issued × 1000) passa do int32 e fica em int64. Os tipos com
+# inicial maiúscula (Int16) são os inteiros do pandas que aceitam nulos.
+PROJECTS_SCHEMA = {
+    "country": "category",
+    "project_type": "category",
+    "project_type_pt": "category",
+    "project_type_source": "category",
+    "registry": "category",
+    "category": "category",
+    "status": "category",
+    "issued": "int32",
+    "retired": "int32",
+    "implementation_year": "Int16",
+    "project_duration": "Int16",
+}
+CREDITS_SCHEMA = {
+    "transaction_type": "category",
+    "vintage": "int16",
+}
+
+
+# --- Processamento --- #
+
+def apply_schema(frame, schema):
+    """
+    Converte as colunas de `frame` presentes em `schema` para os tipos
+    compactos. Uma coluna inteira só é reduzida se todos os valores couberem
+    no tipo e, nos tipos sem nulos, se não tiver nulos; senão, fica como está.
+    """
+    for column, dtype in schema.items():
+        if column not in frame.columns or frame[column].dtype == dtype:
+            continue
+        values = frame[column]
+        if dtype == "category":
+            frame[column] = values.astype("category")
+            continue
+        limits = np.iinfo(dtype.lower())
+        nullable = dtype != dtype.lower()
+        if pd.api.types.is_numeric_dtype(values) and (nullable or values.notna().all()) and (
+                values.count() == 0 or (limits.min <= values.min() and values.max() <= limits.max)):
+            frame[column] = values.astype(dtype)
+    return frame
+
+
+def memory_report(frames):
+    """
+    Memória de cada coluna de `frames` (dicionário nome -> DataFrame): tipo,
+    bytes ocupados (com os textos, deep=True) e os bytes estimados com os
+    tipos padrão do pandas (textos como object e números em 64 bits). Colunas
+    lidas do cache mapeado contam os bytes do arquivo, compartilhados entre
+    os processos.
+    """
+    rows = []
+    for name, frame in frames.items():
+        for column in frame.columns:
+            values = frame[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                default = values.astype(object).memory_usage(index=False, deep=True)
+            elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                default = 8 * len(values)
+            else:
+                default = values.memory_usage(index=False, deep=True)
+            rows.append({
+                "frame": name, "column": column, "dtype": str(values.dtype), "rows": len(values),
+                "bytes": int(values.memory_usage(index=False, deep=True)), "default_bytes": int(default),
+            })
+    return pd.DataFrame(rows, columns=["frame", "column", "dtype", "rows", "bytes", "default_bytes"])
+
+
+def prepare_projects(projects_df, first_key=0):
+    """
+    Padroniza países, datas e cria as colunas derivadas dos projetos.
+    As chaves `project_key` começam em `first_key` (projetos acrescentados).
+    """
+    projects_df['country'] = projects_df['country'].replace(COUNTRY_NAMES)
+
+    # Correção de fuso horário: Padroniza para UTC
+    projects_df["first_issuance_at"] = pd.to_datetime(projects_df["first_issuance_at"], errors="coerce", utc=True)
+    projects_df["first_retirement_at"] = pd.to_datetime(projects_df["first_retirement_at"], errors="coerce", utc=True)
+
+    # Criação de colunas calculadas. Sem a data de emissão (ou de
+    # aposentadoria), o ano e a duração ficam nulos; a duração dos projetos
+    # com créditos é completada pelas datas das transações
+    # (aggregates.project_features)
+    projects_df["implementation_year"] = projects_df["first_issuance_at"].dt.year.astype("Int16")
+    duration = (projects_df["first_retirement_at"] - projects_df["first_issuance_at"]).dt.days / 365.25
+    projects_df["project_duration"] = np.trunc(duration).astype("Int16")
+    projects_df["co2_reduced"] = projects_df["issued"].fillna(0) * 1000
+
+    # Tradução dos tipos de projeto
+    projects_df['project_type_pt'] = projects_df['project_type'].map(PROJECT_TYPE_TRANSLATIONS).fillna(projects_df['project_type'])
+
+    # Chave inteira usada pela tabela fato de créditos
+    projects_df = projects_df.drop_duplicates("project_id", ignore_index=True)
+    projects_df.insert(0, "project_key", np.arange(first_key, first_key + len(projects_df), dtype="int32"))
+    return apply_schema(projects_df, PROJECTS_SCHEMA)
+
+
+def normalize_protocol(name):
+    """
+    Nome padronizado de uma metodologia: "AMS-I.F." e "ams-i-f" viram
+    "ams-i-f", e o título que às vezes segue o código é descartado. Nomes só
+    por extenso ficam como estão.
+    """
+    name = name.strip()
+    code = PROTOCOL_CODE.match(name)
+    if code is None:
+        return name
+    return code.group(0).rstrip(".").lower().replace(".", "-")
+
+
+def parse_protocol_list(text):
+    """
+    Metodologias de um valor da coluna `protocol`, uma lista do Python em
+    texto (ex.: "['ams-i-d', 'ams-iii-h']"); alguns itens juntam vários
+    códigos separados por ";".
+    """
+    if not isinstance(text, str) or not text.strip():
+        return []
+    try:
+        items = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        items = [text]
+    if isinstance(items, str):
+        items = [items]
+    names = (normalize_protocol(part) for item in items for part in str(item).split(";"))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def explode_protocols(projects_df):
+    """
+    Pares (project_key, protocol) das metodologias de cada projeto, com
+    `protocol` categórico. Cada texto distinto da coluna é interpretado uma
+    única vez; os pares são montados com operações vetorizadas.
+    """
+    codes, texts = pd.factorize(projects_df["protocol"])
+    parsed = [parse_protocol_list(text) for text in texts]
+    names = [name for names in parsed for name in names]
+    # Itens de cada texto distinto: posições [starts[i], starts[i] + lengths[i]) de `names`
+    lengths = np.array([len(names) for names in parsed] + [0], dtype="int64")
+    starts = np.concatenate([[0], np.cumsum(lengths[:-1])])
+    # Projetos sem protocolo (NaN) têm código -1: apontam para o texto vazio do fim
+    project_lengths = lengths[codes]
+    total = int(project_lengths.sum())
+    first = np.repeat(starts[codes] - (np.cumsum(project_lengths) - project_lengths), project_lengths)
+    items = first + np.arange(total)
+    protocols = pd.Categorical(np.asarray(names, dtype=object)[items] if total else [],
+                               categories=sorted(set(names)))
+    return pd.DataFrame({
+        "project_key": np.repeat(projects_df["project_key"].to_numpy(), project_lengths).astype("int32"),
+        "protocol": protocols,
+    })
+
+
+def credits_dtypes(project_ids):
+    """
+    Tipos compactos declarados na leitura de credits.csv.
+
+    `project_id` usa as mesmas categorias da dimensão de projetos, de modo que
+    todos os blocos compartilham os códigos e a junção é feita sobre inteiros.
+    """
+    return {
+        "project_id": pd.CategoricalDtype(project_ids),
+        "transaction_type": "category",
+    }
+
+
+def prepare_credits(credits_df):
+    """
+    Renomeia a quantidade para volume, converte as datas e cria a coluna
+    sintética de preço. Opera sobre um bloco de créditos por vez.
+    """
+    credits_df = credits_df.rename(columns={"quantity": "volume"})
+    if "volume" not in credits_df.columns:
+        credits_df["volume"] = 100 # Valor de exemplo
+    credits_df["volume"] = credits_df["volume"].fillna(0).astype("int32")
+    # O índice continua entre os blocos, então o preço é o mesmo da leitura única
+    credits_df["price"] = (credits_df["volume"] * 0.1 + 5 + (credits_df.index % 100) / 100).astype("float32")
+    if "transaction_date" in credits_df.columns:
+        credits_df["transaction_date"] = pd.to_datetime(credits_df["transaction_date"], errors="coerce", utc=True)
+    return apply_schema(credits_df, CREDITS_SCHEMA)
+
+
+@contextlib.contextmanager
+def _csv_from(path, offset=0):
+    """
+    Arquivo `path` aberto no byte `offset` e as opções do `pd.read_csv` para
+    lê-lo. A partir de um offset (o início de uma linha acrescentada), as
+    colunas vêm do cabeçalho do arquivo.
+    """
+    options = {"names": pd.read_csv(path, nrows=0).columns, "header": None} if offset else {}
+    with open(path, "rb") as f:
+        f.seek(offset)
+        yield f, options
+
+
+def iter_credit_chunks(credits_path, project_ids, chunksize=CREDITS_CHUNKSIZE, offset=0, first_row=0):
+    """
+    Lê credits.csv em blocos de `chunksize` linhas, já tipados e processados.
+    Com `offset`, lê só as linhas a partir desse byte (as acrescentadas),
+    numeradas a partir de `first_row`.
+    """
+    with _csv_from(credits_path, offset) as (f, options), \
+            pd.read_csv(f, dtype=credits_dtypes(project_ids), chunksize=chunksize, **options) as reader:
+        for chunk in reader:
+            # O preço sintético depende da posição da linha no arquivo inteiro
+            chunk.index = chunk.index + first_row
+            yield prepare_credits(chunk)
+
+
+def encode_project_key(credits_chunk):
+    """
+    Substitui o `project_id` textual do bloco pela chave inteira do projeto.
+
+    Como as categorias de `project_id` seguem a ordem da dimensão, o código da
+    categoria já é a posição do projeto em projects_df. Créditos de projetos
+    ausentes em projects.csv (código -1) são descartados, como no antigo
+    merge interno.
+    """
+    codes = credits_chunk["project_id"].cat.codes.to_numpy()
+    credits_chunk = credits_chunk.loc[codes >= 0].drop(columns="project_id")
+    credits_chunk.insert(0, "project_key", codes[codes >= 0].astype("int32"))
+    return credits_chunk
+
+
+def empty_credits(credits_path, project_ids):
+    """Tabela de créditos vazia, com as colunas e os tipos da tabela fato."""
+    return encode_project_key(prepare_credits(pd.read_csv(credits_path, dtype=credits_dtypes(project_ids), nrows=0)))
+
+
+def iter_encoded_credit_chunks(credits_path, project_ids, chunksize=CREDITS_CHUNKSIZE, offset=0, first_row=0,
+                               stats=None):
+    """
+    Blocos de créditos já com `project_key`. Se não houver linhas, gera um
+    único bloco vazio, com as colunas esperadas. `stats`, se dado, acumula
+    as linhas lidas (credit_rows) e as descartadas por não terem projeto
+    (orphan_credits).
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("credit_rows", 0)
+    stats.setdefault("orphan_credits", 0)
+    empty = True
+    for chunk in iter_credit_chunks(credits_path, project_ids, chunksize, offset, first_row):
+        empty = False
+        encoded = encode_project_key(chunk)
+        stats["credit_rows"] += len(chunk)
+        stats["orphan_credits"] += len(chunk) - len(encoded)
+        yield encoded
+    if empty:
+        yield empty_credits(credits_path, project_ids)
+
+
+def build_frames(projects_path=PROJECTS_CSV, credits_path=CREDITS_CSV, chunksize=CREDITS_CHUNKSIZE, stats=None):
+    """
+    Lê os CSVs e executa todo o processamento.
+    Retorna (projects_df, credits_df): a dimensão de projetos e a tabela fato
+    de créditos, ligadas pela chave inteira `project_key`. `stats` é repassado
+    a `iter_encoded_credit_chunks`.
+
+    credits.csv é processado em blocos: cada bloco é tipado e tem o
+    `project_id` trocado pela chave do projeto assim que é lido, então o pico
+    de memória depende do tamanho do bloco, e não do arquivo inteiro com os
+    tipos padrão do pandas.
+    """
+    projects_df = prepare_projects(pd.read_csv(projects_path))
+    project_ids = projects_df["project_id"].unique()
+
+    credit_chunks = list(iter_encoded_credit_chunks(credits_path, project_ids, chunksize, stats=stats))
+    # Blocos com categorias diferentes viram object na concatenação
+    credits_df = apply_schema(pd.concat(credit_chunks, ignore_index=True), CREDITS_SCHEMA)
+    return projects_df, credits_df
+
+
+# --- Cache colunar em disco --- #
+
+def _content_hash(path, prefix_size=None, block_size=1 << 20):
+    """
+    SHA-256 do arquivo e, numa mesma leitura, dos seus primeiros `prefix_size`
+    bytes. O hash do prefixo é None se não for pedido ou se o prefixo não
+    terminar numa quebra de linha (não é o fim de uma linha completa).
+    """
+    digest = hashlib.sha256()
+    prefix_digest, prefix_last = None, b""
+    position, last_byte = 0, b""
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            if prefix_size is not None and prefix_digest is None and position + len(block) >= prefix_size:
+                cut = prefix_size - position
+                digest.update(block[:cut])
+                prefix_digest = digest.copy()
+                prefix_last = (last_byte + block[:cut])[-1:]
+                digest.update(block[cut:])
+            else:
+                digest.update(block)
+            position += len(block)
+            last_byte = block[-1:]
+    prefix_hash = prefix_digest.hexdigest() if prefix_digest is not None and prefix_last == b"\n" else None
+    return digest.hexdigest(), prefix_hash
+
+
+def file_fingerprint(path, previous=None):
+    """
+    Retorna tamanho, mtime e hash SHA-256 do arquivo.
+
+    Se `previous` tiver o mesmo tamanho e mtime, o hash anterior é reaproveitado
+    e o arquivo não é relido. Quando só o mtime muda (um novo deploy, por
+    exemplo), o hash confirma que o conteúdo continua o mesmo. Se o arquivo
+    cresceu e os seus primeiros `previous["size"]` bytes têm o hash anterior,
+    só houve acréscimo de linhas: `appended_at` guarda o byte onde elas começam.
+    """
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if previous and all(previous.get(k) == v for k, v in fingerprint.items()):
+        fingerprint["sha256"] = previous["sha256"]
+        return fingerprint
+    grew = bool(previous) and stat.st_size > previous.get("size", stat.st_size)
+    fingerprint["sha256"], prefix_hash = _content_hash(path, previous["size"] if grew else None)
+    if grew and prefix_hash == previous.get("sha256"):
+        fingerprint["appended_at"] = previous["size"]
+    return fingerprint
+
+
+def _manifest_path(cache_dir):
+    return os.path.join(cache_dir, "manifest.json")
+
+
+def _table_path(cache_dir, name):
+    return os.path.join(cache_dir, f"{name}.arrow")
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(_manifest_path(cache_dir)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_manifest(cache_dir, manifest):
+    # `appended_at` só vale para a comparação com o manifesto anterior
+    sources = {
+        name: {k: v for k, v in fingerprint.items() if k != "appended_at"}
+        for name, fingerprint in manifest.get("sources", {}).items()
+    }
+    tmp_path = _manifest_path(cache_dir) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({**manifest, "sources": sources}, f, indent=2)
+    os.replace(tmp_path, _manifest_path(cache_dir))
+
+
+def _same_content(sources, previous_sources):
+    return all(
+        previous_sources.get(name, {}).get("sha256") == fp["sha256"]
+        for name, fp in sources.items()
+    ) and set(sources) == set(previous_sources)
+
+
+def _manifest(sources, stats):
+    return {"version": CACHE_SCHEMA_VERSION, "sources": sources, **stats}
+
+
+# --- Acréscimos aos CSVs --- #
+
+# Linhas novas já processadas: projetos (com as próximas project_key) e créditos
+Delta = namedtuple("Delta", ["projects", "credits"])
+
+
+class FullReloadRequired(Exception):
+    """Os CSVs mudaram de um jeito que não é só acréscimo de linhas."""
+
+
+def _source_changes(cache_dir, projects_path, credits_path):
+    """
+    Compara os CSVs com o manifesto de `cache_dir`. Retorna (manifesto,
+    impressões digitais atuais, offsets), em que `offsets` tem, por tabela, o
+    byte onde começam as linhas acrescentadas (None se a tabela não mudou).
+    Lança FullReloadRequired se não houver manifesto válido ou se algum CSV
+    mudou de outra forma; FileNotFoundError se algum CSV não existir.
+    """
+    manifest = _read_manifest(cache_dir) or {}
+    if manifest.get("version") != CACHE_SCHEMA_VERSION:
+        raise FullReloadRequired(cache_dir)
+    previous_sources = manifest["sources"]
+    sources = {
+        "projects": file_fingerprint(projects_path, previous_sources.get("projects")),
+        "credits": file_fingerprint(credits_path, previous_sources.get("credits")),
+    }
+    offsets = {}
+    for name, fingerprint in sources.items():
+        if fingerprint["sha256"] == previous_sources[name]["sha256"]:
+            offsets[name] = None
+        elif "appended_at" in fingerprint:
+            offsets[name] = fingerprint["appended_at"]
+        else:
+            raise FullReloadRequired(name)
+    return manifest, sources, offsets
+
+
+def read_appended(projects_df, offsets, manifest, projects_path=PROJECTS_CSV, credits_path=CREDITS_CSV):
+    """
+    Processa só as linhas acrescentadas aos CSVs (ver `_source_changes`).
+    `projects_df` é a dimensão atual. Retorna (Delta, estatísticas do
+    manifesto atualizadas).
+
+    Projetos com um `project_id` já conhecido são ignorados, como no
+    `drop_duplicates` da carga completa. Lança FullReloadRequired se um
+    projeto novo puder ter créditos antigos, descartados antes por falta do
+    projeto: só a carga completa os recupera.
+    """
+    new_projects = projects_df.iloc[:0]
+    if offsets["projects"] is not None:
+        with _csv_from(projects_path, offsets["projects"]) as (f, options):
+            appended = pd.read_csv(f, **options)
+        appended = appended[~appended["project_id"].isin(projects_df["project_id"])]
+        new_projects = prepare_projects(appended.reset_index(drop=True), first_key=len(projects_df))
+        if len(new_projects) and manifest.get("orphan_credits"):
+            raise FullReloadRequired("orphan_credits")
+
+    project_ids = pd.concat([projects_df["project_id"], new_projects["project_id"]], ignore_index=True).to_numpy()
+    stats = {"credit_rows": manifest["credit_rows"], "orphan_credits": manifest["orphan_credits"]}
+    if offsets["credits"] is not None:
+        chunks = iter_encoded_credit_chunks(credits_path, project_ids, offset=offsets["credits"],
+                                            first_row=stats["credit_rows"], stats=stats)
+        new_credits = pd.concat(list(chunks), ignore_index=True)
+    else:
+        new_credits = empty_credits(credits_path, project_ids)
+    return Delta(new_projects, new_credits), stats
+
+
+def append_rows(table, rows):
+    """Concatena `rows` a `table`, mantendo como categóricas as colunas que já eram."""
+    combined = pd.concat([table, rows], ignore_index=True)
+    for column in table.columns:
+        if isinstance(table[column].dtype, pd.CategoricalDtype) and column in rows.columns:
+            combined[column] = combined[column].astype("category")
+    return combined
+
+
+# --- Cache colunar em disco --- #
+
+def read_cached_frames(cache_dir=CACHE_DIR):
+    """
+    Lê as tabelas do cache via memory-map. Retorna None se faltar alguma.
+
+    Com um único record batch por tabela e `split_blocks=True`, as colunas
+    numéricas sem nulos viram arrays NumPy somente leitura apontando direto
+    para o arquivo mapeado, sem cópia: o sistema operacional compartilha essas
+    páginas entre todos os processos do servidor.
+    """
+    frames = []
+    for name in CACHE_TABLES:
+        path = _table_path(cache_dir, name)
+        if not os.path.exists(path):
+            return None
+        frames.append(feather.read_table(path, memory_map=True).to_pandas(split_blocks=True))
+    return tuple(frames)
+
+
+def write_cached_frames(frames, manifest, cache_dir=CACHE_DIR):
+    """
+    Grava as tabelas em Arrow IPC sem compressão e em um único record batch,
+    para permitir a leitura sem cópia via memory-map.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    # Sem manifesto, uma gravação interrompida nunca é lida como cache válido.
+    if os.path.exists(_manifest_path(cache_dir)):
+        os.remove(_manifest_path(cache_dir))
+    for name, df in zip(CACHE_TABLES, frames):
+        tmp_path = _table_path(cache_dir, name) + ".tmp"
+        feather.write_feather(df.reset_index(drop=True), tmp_path, compression="uncompressed", chunksize=max(len(df), 1))
+        os.replace(tmp_path, _table_path(cache_dir, name))
+    _write_manifest(cache_dir, manifest)
+
+
+def update_frames(frames, projects_path=PROJECTS_CSV, credits_path=CREDITS_CSV, cache_dir=CACHE_DIR):
+    """
+    Atualiza (projects_df, credits_df) com as linhas acrescentadas aos CSVs
+    desde a gravação do cache. Retorna (frames, Delta), com Delta None se
+    nada mudou. Só as linhas novas são lidas e processadas; as tabelas do
+    cache são regravadas já com elas (o memory-map exige um único record
+    batch). Lança FullReloadRequired se os CSVs não só cresceram.
+    """
+    manifest, sources, offsets = _source_changes(cache_dir, projects_path, credits_path)
+    if all(offset is None for offset in offsets.values()):
+        if sources != manifest["sources"]:
+            # Conteúdo igual com mtime novo: só atualiza o manifesto
+            try:
+                _write_manifest(cache_dir, {**manifest, "sources": sources})
+            except OSError:
+                pass
+        return frames, None
+
+    delta, stats = read_appended(frames[0], offsets, manifest, projects_path, credits_path)
+    frames = (append_rows(frames[0], delta.projects), append_rows(frames[1], delta.credits))
+    try:
+        write_cached_frames(frames, _manifest(sources, stats), cache_dir)
+    except OSError:
+        return frames, delta
+    return read_cached_frames(cache_dir) or frames, delta
+
+
+def load_frames(projects_path=PROJECTS_CSV, credits_path=CREDITS_CSV, cache_dir=CACHE_DIR):
+    """
+    Carrega (projects_df, credits_df), usando o cache colunar quando os CSVs
+    de origem não mudaram desde a última gravação, ou só receberam linhas
+    novas (que são processadas e acrescentadas ao cache).
+
+    Lança FileNotFoundError se algum CSV de origem não existir.
+    """
+    frames = read_cached_frames(cache_dir)
+    if frames is not None:
+        try:
+            return update_frames(frames, projects_path, credits_path, cache_dir)[0]
+        except FullReloadRequired:
+            pass
+
+    sources = {
+        "projects": file_fingerprint(projects_path),
+        "credits": file_fingerprint(credits_path),
+    }
+    stats = {}
+    frames = build_frames(projects_path, credits_path, stats=stats)
+    try:
+        write_cached_frames(frames, _manifest(sources, stats), cache_dir)
+    except OSError:
+        # O cache é uma otimização: sem permissão de escrita, seguimos sem ele.
+        return frames
+    # Relê do cache para que a primeira carga também use os arrays mapeados
+    return read_cached_frames(cache_dir) or frames
+
+
+# --- Tabelas Parquet (motor de consultas) --- #
+
+def parquet_path(parquet_dir, name):
+    return os.path.join(parquet_dir, f"{name}.parquet")
+
+
+def credit_parts_glob(parquet_dir):
+    """Padrão dos arquivos de créditos: uma parte por carga (a completa e cada acréscimo)."""
+    return os.path.join(parquet_dir, "credits", "part-*.parquet")
+
+
+def _credit_part_path(parquet_dir, number):
+    return os.path.join(parquet_dir, "credits", f"part-{number:05d}.parquet")
+
+
+def _write_projects_parquet(projects_df, parquet_dir):
+    tmp_path = parquet_path(parquet_dir, "projects") + ".tmp"
+    pq.write_table(pa.Table.from_pandas(projects_df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, parquet_path(parquet_dir, "projects"))
+
+
+def _write_credit_part(chunks, path, schema=None):
+    """Grava os blocos de créditos num arquivo Parquet, um row group por bloco."""
+    tmp_path = path + ".tmp"
+    writer = None
+    try:
+        for chunk in chunks:
+            # O esquema do primeiro bloco (ou da parte anterior) vale para todos
+            table = pa.Table.from_pandas(chunk, schema=writer.schema if writer else schema, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, path)
+
+
+def build_parquet_tables(projects_path=PROJECTS_CSV, credits_path=CREDITS_CSV, parquet_dir=PARQUET_DIR,
+                         chunksize=CREDITS_CHUNKSIZE, stats=None):
+    """
+    Grava projects.parquet e credits/part-00000.parquet com o mesmo
+    processamento de `build_frames`, sem montar a tabela de créditos na
+    memória: cada bloco de credits.csv vira um row group, e as estatísticas
+    (mín./máx.) de cada row group permitem ao motor de consultas pular os
+    blocos fora de um filtro.
+    """
+    shutil.rmtree(os.path.join(parquet_dir, "credits"), ignore_errors=True)
+    os.makedirs(os.path.join(parquet_dir, "credits"))
+    projects_df = prepare_projects(pd.read_csv(projects_path))
+    project_ids = projects_df["project_id"].unique()
+    _write_projects_parquet(projects_df, parquet_dir)
+    _write_credit_part(iter_encoded_credit_chunks(credits_path, project_ids, chunksize, stats=stats),
+                       _credit_part_path(parquet_dir, 0))
+
+
+def update_parquet_tables(projects_path=PROJECTS_CSV, credits_path=CREDITS_CSV, parquet_dir=PARQUET_DIR):
+    """
+    Acrescenta às tabelas Parquet as linhas novas dos CSVs: os créditos novos
+    viram uma nova parte (as anteriores não são reescritas) e a dimensão de
+    projetos, pequena, é regravada. Retorna o Delta, ou None se nada mudou.
+    Lança FullReloadRequired se os CSVs não só cresceram.
+    """
+    manifest, sources, offsets = _source_changes(parquet_dir, projects_path, credits_path)
+    if all(offset is None for offset in offsets.values()):
+        if sources != manifest["sources"]:
+            _write_manifest(parquet_dir, {**manifest, "sources": sources})
+        return None
+
+    parts = sorted(glob.glob(credit_parts_glob(parquet_dir)))
+    if not parts:
+        raise FullReloadRequired(parquet_dir)
+    projects_df = pd.read_parquet(parquet_path(parquet_dir, "projects"))
+    delta, stats = read_appended(projects_df, offsets, manifest, projects_path, credits_path)
+    os.remove(_manifest_path(parquet_dir))
+    if len(delta.projects):
+        _write_projects_parquet(append_rows(projects_df, delta.projects), parquet_dir)
+    if len(delta.credits):
+        _write_credit_part([delta.credits], _credit_part_path(parquet_dir, len(parts)), pq.read_schema(parts[0]))
+    _write_manifest(parquet_dir, _manifest(sources, stats))
+    return delta
+
+
+def load_parquet_tables(projects_path=PROJECTS_CSV, credits_path=CREDITS_CSV, parquet_dir=PARQUET_DIR):
+    """
+    Retorna o diretório com as tabelas Parquet, regravando-as por completo só
+    quando os CSVs de origem mudaram de outra forma que não acréscimo de
+    linhas (mesmo manifesto do cache colunar). Lança FileNotFoundError se
+    algum CSV de origem não existir.
+    """
+    try:
+        update_parquet_tables(projects_path, credits_path, parquet_dir)
+        if os.path.exists(parquet_path(parquet_dir, "projects")) and glob.glob(credit_parts_glob(parquet_dir)):
+            return parquet_dir
+    except FullReloadRequired:
+        pass
+
+    sources = {
+        "projects": file_fingerprint(projects_path),
+        "credits": file_fingerprint(credits_path),
+    }
+    os.makedirs(parquet_dir, exist_ok=True)
+    if os.path.exists(_manifest_path(parquet_dir)):
+        os.remove(_manifest_path(parquet_dir))
+    stats = {}
+    build_parquet_tables(projects_path, credits_path, parquet_dir, stats=stats)
+    _write_manifest(parquet_dir, _manifest(sources, stats))
+    return parquet_dir
@@ -0,0 +1,89 @@
+"""
+Modelo estrela do painel: tabela fato de créditos + dimensão de projetos.
+
+A tabela fato guarda apenas as colunas da transação e a chave inteira
+`project_key` (posição do projeto em `projects`). Os atributos do projeto são
+buscados pela chave apenas para as colunas que cada seção realmente usa, em vez
+de copiados para todas as linhas de crédito como no antigo `merged_df`.
+
+O mesmo `CarbonDataset` é compartilhado por todas as sessões do servidor. As
+tabelas internas nunca são alteradas: `projects` e `credits` entregam views
+(cópias rasas), e qualquer coluna que uma seção acrescente fica apenas na sua
+view. Com o Copy-on-Write do pandas, ligado pelo app.py, nem uma alteração de
+valores numa view chega à tabela original.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+import data_loader
+
+class CarbonDataset:
+    """Fato de créditos e dimensão de projetos ligados por `project_key`."""
+
+    def __init__(self, projects, credits):
+        self._projects = projects
+        self._credits = credits
+        # Número de linhas de crédito por projeto, indexado por project_key
+        self.credit_counts = np.bincount(credits["project_key"].to_numpy(), minlength=len(projects))
+        self.credit_counts.flags.writeable = False
+
+    @property
+    def projects(self):
+        """View da dimensão de projetos (alterações não afetam o dataset)."""
+        return self._projects.copy(deep=False)
+
+    @property
+    def credits(self):
+        """View da tabela fato de créditos (alterações não afetam o dataset)."""
+        return self._credits.copy(deep=False)
+
+    @property
+    def traded_projects(self):
+        """Máscara booleana dos projetos com ao menos um crédito."""
+        return self.credit_counts > 0
+
+    def credit_mask(self, project_mask):
+        """Converte uma máscara sobre projetos em uma máscara sobre créditos."""
+        return np.asarray(project_mask)[self._credits["project_key"].to_numpy()]
+
+    @functools.cached_property
+    def _rows_by_project(self):
+        """Posições dos créditos ordenadas por project_key e o início de cada projeto."""
+        keys = self._credits["project_key"].to_numpy()
+        order = np.argsort(keys, kind="stable")
+        return order, np.searchsorted(keys[order], np.arange(len(self._projects) + 1))
+
+    def project_rows(self, project_key):
+        """Posições (em ordem) dos créditos de um projeto, sem varrer a tabela fato."""
+        order, offsets = self._rows_by_project
+        return order[offsets[project_key]:offsets[project_key + 1]]
+
+    def credit_view(self, columns, rows=None):
+        """
+        Retorna as colunas pedidas para as linhas de crédito selecionadas.
+
+        `columns` pode misturar colunas do fato e da dimensão; as da dimensão
+        são buscadas pela chave do projeto. `rows` é uma máscara booleana ou
+        um array de posições sobre `credits` (None = todas as linhas).
+        """
+        fact_columns = [c for c in columns if c in self._credits.columns]
+        credits = self._credits[list(dict.fromkeys(["project_key", *fact_columns]))]
+        if rows is not None:
+            rows = np.asarray(rows)
+            credits = credits[rows] if rows.dtype == bool else credits.iloc[rows]
+        keys = credits["project_key"].to_numpy()
+
+        view = {}
+        for column in columns:
+            if column in fact_columns:
+                view[column] = credits[column]
+            else:
+                view[column] = self._projects[column].iloc[keys].set_axis(credits.index)
+        return pd.DataFrame(view, index=credits.index)
+
+
+def load_dataset(**kwargs):
+    """Carrega os dados (com o cache colunar) e monta o modelo estrela."""
+    return CarbonDataset(*data_loader.load_frames(**kwargs))
@@ -0,0 +1,153 @@
+"""
+Calculadora de emissões: fatores por atividade e o cálculo em lote.
+
+Os fatores de emissão (kg de CO₂e por unidade consumida) ficam em
+emission_factors.csv. No lote, o arquivo de consumo (colunas `activity` e
+`quantity`; ou `atividade` e `quantidade`) é lido em blocos; em cada bloco,
+as atividades distintas são procuradas uma vez na tabela de fatores e o
+fator de cada linha sai de uma indexação por código (sem `apply` por linha).
+Os totais por atividade são acumulados bloco a bloco, e os blocos
+calculados seguem para a exportação (export.py), sem montar o resultado
+inteiro em memória.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+FACTORS_CSV = "emission_factors.csv"
+
+# Média de CO₂ absorvido por uma árvore em um ano (kg)
+TREE_ABSORPTION_KG = 22.0
+
+# Linhas do arquivo de consumo calculadas por vez
+BATCH_CHUNKSIZE = 100_000
+
+# Nomes aceitos para as colunas do arquivo de consumo
+COLUMN_ALIASES = {"atividade": "activity", "quantidade": "quantity"}
+
+
+def _activity_key(activities):
+    """Chave de comparação das atividades: sem espaços nas pontas e sem diferença de caixa."""
+    return activities.astype("string").str.strip().str.casefold()
+
+
+def load_factors(path=FACTORS_CSV):
+    """
+    Tabela de fatores (activity, unit, factor), na ordem do arquivo. Lança
+    FileNotFoundError se o arquivo não existir e ValueError se faltar coluna
+    ou houver atividade repetida.
+    """
+    factors = pd.read_csv(path, dtype={"activity": "string", "unit": "string", "factor": "float64"})
+    missing = {"activity", "unit", "factor"} - set(factors.columns)
+    if missing:
+        raise ValueError(f"Colunas ausentes em {path}: {', '.join(sorted(missing))}")
+    factors["activity"] = factors["activity"].str.strip()
+    duplicated = factors["activity"][_activity_key(factors["activity"]).duplicated()]
+    if len(duplicated):
+        raise ValueError(f"Atividades repetidas em {path}: {', '.join(duplicated)}")
+    return factors[["activity", "unit", "factor"]].reset_index(drop=True)
+
+
+def emissions(quantity, factor):
+    """Emissões (kg de CO₂e) e o equivalente em árvores crescendo por um ano."""
+    co2e_kg = quantity * factor
+    return co2e_kg, co2e_kg / TREE_ABSORPTION_KG
+
+
+def compute(chunk, factors):
+    """
+    Bloco do arquivo de consumo com as colunas matched_activity (o nome da
+    atividade na tabela de fatores), unit, factor, co2e_kg e trees. Linhas
+    com atividade fora da tabela ficam sem fator; com quantidade inválida,
+    sem emissão (NaN).
+    """
+    codes, activities = pd.factorize(_activity_key(chunk["activity"]))
+    positions = pd.Index(_activity_key(factors["activity"])).get_indexer(activities)
+    # Posição de cada linha na tabela de fatores; -1 para atividade vazia ou sem fator
+    row_positions = np.append(positions, -1)[codes]
+
+    def take(column):
+        # Com allow_fill, a posição -1 vira nulo
+        return pd.Series(factors[column].array.take(row_positions, allow_fill=True), index=chunk.index)
+
+    quantity = pd.to_numeric(chunk["quantity"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    factor = take("factor").to_numpy(dtype="float64", na_value=np.nan)
+    co2e_kg, trees = emissions(quantity, factor)
+    return chunk.assign(quantity=quantity, matched_activity=take("activity"), unit=take("unit"),
+                        factor=factor, co2e_kg=co2e_kg, trees=trees)
+
+
+def read_chunks(file, file_name, chunksize=BATCH_CHUNKSIZE):
+    """
+    Blocos de `chunksize` linhas de um arquivo de consumo CSV ou Parquet
+    (pelo nome do arquivo). Lança ValueError se faltar alguma coluna.
+
+    Todas as colunas chegam como texto (dtype "string"), a quantidade
+    inclusive (convertida em `compute`): assim os tipos não mudam de um bloco
+    para outro, como aconteceria com os tipos inferidos bloco a bloco (um
+    código numérico no primeiro bloco e com letras depois, uma coluna vazia
+    no primeiro bloco), e o resultado de todos os blocos cabe no esquema do
+    primeiro na exportação.
+    """
+    if file_name.lower().endswith(".parquet"):
+        parquet = pq.ParquetFile(file)
+        names = [COLUMN_ALIASES.get(name.lower(), name.lower()) for name in parquet.schema_arrow.names]
+        _check_columns(names)
+        schema = pa.schema([pa.field(name, pa.string()) for name in parquet.schema_arrow.names])
+        for batch in parquet.iter_batches(batch_size=chunksize):
+            yield batch.cast(schema).to_pandas(types_mapper={pa.string(): pd.StringDtype()}.get).set_axis(names, axis=1)
+        return
+    with pd.read_csv(file, chunksize=chunksize, dtype="string") as reader:
+        for chunk in reader:
+            chunk = chunk.rename(columns=lambda name: COLUMN_ALIASES.get(name.strip().lower(), name.strip().lower()))
+            _check_columns(chunk.columns)
+            yield chunk
+
+
+def _check_columns(names):
+    missing = {"activity", "quantity"} - set(names)
+    if missing:
+        raise ValueError(f"Colunas ausentes no arquivo de consumo: {', '.join(sorted(missing))}")
+
+
+class BatchSummary:
+    """Totais por atividade acumulados a cada bloco calculado."""
+
+    def __init__(self):
+        self.rows = 0
+        self.unmatched_rows = 0
+        self.invalid_quantity_rows = 0
+        self.unmatched = pd.Series(dtype="int64")
+        self._totals = pd.DataFrame(columns=["rows", "quantity", "co2e_kg"],
+                                    index=pd.MultiIndex.from_tuples([], names=["activity", "unit"]))
+
+    def add(self, results):
+        """Acumula um bloco devolvido por `compute`."""
+        self.rows += len(results)
+        matched = results["factor"].notna()
+        self.unmatched_rows += int((~matched).sum())
+        self.invalid_quantity_rows += int((matched & results["quantity"].isna()).sum())
+        unmatched = results.loc[~matched, "activity"].astype("string").fillna("(vazia)").value_counts()
+        self.unmatched = self.unmatched.add(unmatched, fill_value=0).astype("int64")
+        totals = results[matched].groupby(["matched_activity", "unit"]).agg(
+            rows=("co2e_kg", "size"), quantity=("quantity", "sum"), co2e_kg=("co2e_kg", "sum")
+        ).rename_axis(["activity", "unit"])
+        self._totals = self._totals.add(totals, fill_value=0)
+
+    def table(self):
+        """Totais por (activity, unit): linhas, quantidade, CO₂e e árvores, do maior CO₂e."""
+        totals = self._totals.astype({"rows": "int64", "quantity": "float64", "co2e_kg": "float64"})
+        return totals.assign(trees=totals["co2e_kg"] / TREE_ABSORPTION_KG).sort_values("co2e_kg", ascending=False)
+
+    @property
+    def co2e_kg(self):
+        return float(self._totals["co2e_kg"].sum())
+
+
+def iter_results(chunks, factors, summary):
+    """Calcula cada bloco de `chunks`, acumula em `summary` e o devolve."""
+    for chunk in chunks:
+        results = compute(chunk, factors)
+        summary.add(results)
+        yield results
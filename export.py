@@ -0,0 +1,137 @@
+"""
+Gravação de resultados em blocos, em CSV ou Parquet.
+
+Os blocos (DataFrames com as mesmas colunas) são gravados um a um num
+arquivo temporário em disco, sem montar a tabela inteira em memória, pelos
+gravadores incrementais do pyarrow: no CSV, o cabeçalho sai uma vez; no
+Parquet, cada bloco vira um row group. O arquivo é apagado quando fechado.
+
+O tamanho dos blocos vem de `chunk_rows`: o número de linhas que cabe em
+BUFFER_BYTES, estimado por uma amostra. A memória da gravação fica então
+limitada a um bloco, qualquer que seja o número de linhas selecionadas.
+
+O download é outra história: o st.download_button recebe o arquivo pronto
+em bytes, que o servidor mantém em memória enquanto o botão aparece. Por
+isso `spool_parts` divide a seleção em arquivos (partes) de até
+MAX_DOWNLOAD_ROWS linhas, todos em disco, e a página oferece uma parte por
+vez: a memória do download fica limitada a uma parte, e nenhuma linha fica
+de fora.
+"""
+import tempfile
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+FORMATS = {
+    "CSV": {"extension": "csv", "mime": "text/csv"},
+    "Parquet": {"extension": "parquet", "mime": "application/vnd.apache.parquet"},
+}
+
+_WRITERS = {"CSV": pa_csv.CSVWriter, "Parquet": pq.ParquetWriter}
+
+# Memória (aproximada) de um bloco de linhas na exportação
+BUFFER_BYTES = 16 * 2 ** 20
+
+# Linhas no máximo em cada parte de um download (créditos em CSV: ~40 MB)
+MAX_DOWNLOAD_ROWS = 250_000
+
+
+def chunk_rows(sample, buffer_bytes=BUFFER_BYTES):
+    """Linhas por bloco para que um bloco com as colunas de `sample` ocupe até `buffer_bytes`."""
+    row_bytes = sample.memory_usage(index=False, deep=True).sum() / max(len(sample), 1)
+    return max(1, int(buffer_bytes // max(row_bytes, 1)))
+
+
+def frame_export(frame, buffer_bytes=BUFFER_BYTES):
+    """Um DataFrame já em memória (ex.: agregados) como (número de linhas, iterador de blocos)."""
+    chunksize = chunk_rows(frame.head(1000), buffer_bytes)
+    return len(frame), (frame.iloc[start:start + chunksize] for start in range(0, len(frame), chunksize))
+
+
+def write_chunks(chunks, file_format, file, progress=None, max_rows=None):
+    """
+    Grava os blocos em `file` (binário) no formato de FORMATS; retorna o
+    número de linhas. `progress`, se dada, é chamada com o total de linhas
+    gravadas depois de cada bloco. Com `max_rows`, a gravação para nesse
+    número de linhas (o último bloco é cortado) e os blocos seguintes não
+    são lidos do iterador.
+    """
+    if file_format not in _WRITERS:
+        raise ValueError(f"Formato de exportação desconhecido: {file_format}")
+    rows = 0
+    schema = writer = None
+    try:
+        for chunk in chunks:
+            if max_rows is not None:
+                chunk = chunk.iloc[:max_rows - rows]
+            # O esquema do primeiro bloco vale para todos (ex.: uma coluna só
+            # com nulos num bloco não muda de tipo)
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                writer = _WRITERS[file_format](file, schema)
+            writer.write_table(table)
+            rows += len(chunk)
+            if progress is not None:
+                progress(rows)
+            if max_rows is not None and rows >= max_rows:
+                break
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def spool(chunks, file_format, progress=None, max_rows=None):
+    """
+    Grava os blocos (até `max_rows` linhas, ver write_chunks) num arquivo
+    temporário e o devolve posicionado no início, com o número de linhas
+    gravadas.
+    """
+    file = tempfile.TemporaryFile()
+    try:
+        rows = write_chunks(chunks, file_format, file, progress, max_rows)
+    except BaseException:
+        file.close()
+        raise
+    file.seek(0)
+    return file, rows
+
+
+def _part_pieces(chunks, part_rows):
+    """Os blocos cortados nas fronteiras das partes (a cada `part_rows` linhas)."""
+    rows = 0
+    for chunk in chunks:
+        start = 0
+        while start < len(chunk):
+            size = min(len(chunk) - start, part_rows - rows % part_rows)
+            yield chunk.iloc[start:start + size]
+            start += size
+            rows += size
+
+
+def spool_parts(chunks, file_format, progress=None, part_rows=MAX_DOWNLOAD_ROWS):
+    """
+    Grava os blocos em arquivos temporários (as partes) de até `part_rows`
+    linhas cada, no formato de FORMATS; cada parte é um arquivo completo (no
+    CSV, com cabeçalho). Retorna a lista de (arquivo, linhas), com os
+    arquivos posicionados no início; vazia se não houver linhas. `progress`,
+    se dada, é chamada com o total de linhas gravadas em todas as partes.
+    """
+    pieces = _part_pieces(chunks, part_rows)
+    parts = []
+    written = 0
+    try:
+        while True:
+            part_progress = None if progress is None else (lambda rows: progress(written + rows))
+            file, rows = spool(pieces, file_format, part_progress, max_rows=part_rows)
+            if not rows:
+                file.close()
+                return parts
+            parts.append((file, rows))
+            written += rows
+    except BaseException:
+        for file, _ in parts:
+            file.close()
+        raise
@@ -0,0 +1,100 @@
+"""
+Cache de figuras Plotly com chaves semânticas e memória limitada.
+
+As chaves são tuplas curtas (seção, gráfico, versão dos dados, filtros...),
+então uma consulta não precisa fazer hash de DataFrames. O valor guardado é
+o JSON da figura já serializado: num acerto, `plotly_chart` passa o
+dicionário da figura ao st.plotly_chart, sem refazer as consultas nem o
+código que monta a figura (plotly.express etc.). O cache é do processo
+(compartilhado entre sessões e com o pré-aquecimento) e descarta as
+figuras menos usadas quando passa do limite de entradas ou de memória.
+"""
+import json
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+import streamlit as st
+
+MAX_ENTRIES = 256
+MAX_BYTES = 128 * 2 ** 20
+
+CachedFigure = namedtuple("CachedFigure", ["spec", "meta"])
+
+
+class FigureCache:
+    """LRU de figuras serializadas, limitado por número de entradas e por bytes."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        size = sys.getsizeof(entry.spec)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._sizes.pop(key)
+                del self._entries[key]
+            self._entries[key] = entry
+            self._sizes[key] = size
+            self.bytes += size
+            # A entrada recém-gravada fica mesmo que sozinha passe do limite
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                oldest, _ = self._entries.popitem(last=False)
+                self.bytes -= self._sizes.pop(oldest)
+                self.evictions += 1
+
+    def get_or_build(self, key, build):
+        """
+        Figura serializada da chave, construindo-a com `build()` numa falta.
+        `build` retorna uma figura Plotly ou (figura, metadados), em que os
+        metadados são um objeto pequeno devolvido junto com a figura (ex.: o
+        número de pontos amostrados, para a legenda do gráfico).
+        """
+        entry = self.get(key)
+        if entry is None:
+            built = build()
+            figure, meta = built if isinstance(built, tuple) else (built, None)
+            entry = CachedFigure(figure.to_json(), meta)
+            self.put(key, entry)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+FIGURES = FigureCache()
+
+
+def plotly_chart(spec, use_container_width=True):
+    """Exibe uma figura já serializada (o `spec` de CachedFigure) com o st.plotly_chart."""
+    return st.plotly_chart(json.loads(spec), use_container_width=use_container_width)
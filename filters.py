@@ -0,0 +1,75 @@
+"""
+Filtros globais por facetas da dimensão de projetos.
+
+Para cada faceta (ano de implementação, tipo, país, registro, categoria,
+status e mercado regulado), o `FacetIndex` guarda um bitmap por valor: um bit
+por projeto, empacotado em bytes (np.packbits). Uma seleção combina os
+valores de uma faceta com OU e as facetas entre si com E, bit a bit, sem
+comparar colunas; o resultado é uma máscara sobre `project_key`, que as
+seções aplicam aos créditos pela chave do projeto.
+
+Uma seleção é uma tupla de pares (faceta, valores), só com as facetas
+filtradas, e pode ser usada como chave de cache.
+"""
+import numpy as np
+import pandas as pd
+
+FACETS = {
+    "implementation_year": "Ano de Implementação",
+    "project_type": "Tipo de Projeto",
+    "country": "País",
+    "registry": "Registro",
+    "category": "Categoria",
+    "status": "Status",
+    "is_compliance": "Mercado Regulado",
+}
+
+# Número de bits 1 de cada byte
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def format_value(value):
+    """Rótulo de um valor de faceta na interface."""
+    if isinstance(value, (bool, np.bool_)):
+        return "Sim" if value else "Não"
+    return str(value)
+
+
+class FacetIndex:
+    """Bitmaps por valor de cada faceta sobre os projetos (na ordem de project_key)."""
+
+    def __init__(self, projects, facets=FACETS):
+        self.size = len(projects)
+        self.values = {}
+        self.bitmaps = {}
+        self._positions = {}
+        self._all = np.packbits(np.ones(self.size, dtype=bool))
+        for facet in facets:
+            # Projetos sem valor (NaN) não entram em nenhum bitmap da faceta
+            codes, uniques = pd.factorize(projects[facet], sort=True)
+            self.values[facet] = uniques.tolist()
+            self._positions[facet] = {value: i for i, value in enumerate(self.values[facet])}
+            bitmaps = np.empty((len(uniques), len(self._all)), dtype=np.uint8)
+            for i in range(len(uniques)):
+                bitmaps[i] = np.packbits(codes == i)
+            self.bitmaps[facet] = bitmaps
+
+    def bitmap(self, selection):
+        """Bitmap empacotado dos projetos que atendem à seleção."""
+        result = self._all.copy()
+        for facet, values in selection:
+            rows = [self._positions[facet][value] for value in values if value in self._positions[facet]]
+            if not rows:
+                return np.zeros_like(result)
+            result &= np.bitwise_or.reduce(self.bitmaps[facet][rows], axis=0)
+        return result
+
+    def mask(self, selection):
+        """Máscara booleana sobre os projetos (None se a seleção estiver vazia)."""
+        if not selection:
+            return None
+        return np.unpackbits(self.bitmap(selection), count=self.size).astype(bool)
+
+    def count(self, selection):
+        """Número de projetos da seleção, contando os bits do bitmap."""
+        return int(_POPCOUNT[self.bitmap(selection)].sum())
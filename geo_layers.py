@@ -0,0 +1,202 @@
+"""
+Camadas geográficas pré-processadas para o mapa coroplético.
+
+O GeoJSON dos países é simplificado uma vez por nível de tolerância, as
+métricas por país são gravadas nas propriedades de uma única feature
+collection e o HTML do mapa renderizado é memorizado por métrica/nível.
+Trocar de métrica no painel vira uma consulta a dicionário.
+"""
+import json
+
+import folium
+import numpy as np
+import pandas as pd
+
+GEOJSON_PATH = "countries.geo.json"
+
+# Tolerância (em graus) da simplificação Douglas-Peucker por nível de detalhe
+SIMPLIFY_TOLERANCES = {
+    "Alto": 0.0,
+    "Médio": 0.05,
+    "Baixo": 0.2,
+}
+DEFAULT_DETAIL = "Médio"
+
+# Casas decimais mantidas nas coordenadas (~1 km)
+COORDINATE_DECIMALS = 2
+
+# Métricas disponíveis no mapa. Para uma nova métrica, acrescente a entrada
+# aqui e a coluna correspondente em country_metrics().
+MAP_METRICS = {
+    "Volume de CO₂ Reduzido": {
+        "column": "co2_reduced", "legend": "Volume de CO₂ Reduzido (ton)",
+        "alias": "Volume (ton):", "fill_color": "YlOrRd",
+    },
+    "Número de Projetos": {
+        "column": "project_count", "legend": "Número de Projetos",
+        "alias": "Nº de Projetos:", "fill_color": "YlGn",
+    },
+    "Volume Transacionado": {
+        "column": "volume", "legend": "Volume de Créditos Transacionado",
+        "alias": "Volume Transacionado:", "fill_color": "PuBu",
+    },
+}
+
+
+def load_geojson(path=GEOJSON_PATH):
+    """Lê o GeoJSON dos países. Lança FileNotFoundError se não existir."""
+    with open(path) as f:
+        return json.load(f)
+
+
+# --- Simplificação das geometrias --- #
+
+def _simplify_line(points, tolerance):
+    """Douglas-Peucker iterativo sobre um array (n, 2) de coordenadas."""
+    if tolerance <= 0 or len(points) <= 4:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end <= start + 1:
+            continue
+        segment = points[end] - points[start]
+        relative = points[start + 1:end] - points[start]
+        norm = np.hypot(segment[0], segment[1])
+        if norm == 0:
+            distances = np.hypot(relative[:, 0], relative[:, 1])
+        else:
+            distances = np.abs(segment[0] * relative[:, 1] - segment[1] * relative[:, 0]) / norm
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return points[keep]
+
+
+def _simplify_ring(ring, tolerance):
+    points = np.asarray(ring, dtype=float)
+    simplified = _simplify_line(points, tolerance)
+    # Um anel precisa de pelo menos 4 pontos; se colapsar, mantém o original
+    if len(simplified) < 4:
+        simplified = points
+    return np.round(simplified, COORDINATE_DECIMALS).tolist()
+
+
+def simplify_geometry(geometry, tolerance):
+    """Simplifica um Polygon ou MultiPolygon do GeoJSON."""
+    if geometry["type"] == "Polygon":
+        coordinates = [_simplify_ring(ring, tolerance) for ring in geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        coordinates = [[_simplify_ring(ring, tolerance) for ring in polygon] for polygon in geometry["coordinates"]]
+    else:
+        return geometry
+    return {"type": geometry["type"], "coordinates": coordinates}
+
+
+# --- Métricas por país --- #
+
+def country_metrics(projects_df):
+    """
+    Métricas por país usadas pelo mapa, uma coluna por entrada de
+    MAP_METRICS. `projects_df` traz as métricas de crédito de cada projeto
+    (aggregates.project_features).
+    """
+    grouped = projects_df.groupby("country", observed=True)
+    return pd.DataFrame({
+        "co2_reduced": grouped["co2_reduced"].sum(),
+        "project_count": grouped["project_id"].nunique(),
+        "volume": grouped["volume"].sum(),
+    }).reset_index()
+
+
+class GeoLayerCache:
+    """
+    Feature collections simplificadas, já com as métricas por país, e o HTML
+    renderizado de cada mapa, memorizado por (métrica, nível de detalhe).
+    """
+
+    def __init__(self, geojson, metrics):
+        self.metrics = metrics
+        self._geojson = geojson
+        self._layers = {}
+        self._html = {}
+
+    def feature_collection(self, detail=DEFAULT_DETAIL):
+        """Feature collection no nível de detalhe pedido, com todas as métricas."""
+        if detail not in self._layers:
+            tolerance = SIMPLIFY_TOLERANCES[detail]
+            features = [{
+                "type": "Feature",
+                "id": feature.get("id"),
+                "properties": {"name": feature["properties"]["name"]},
+                "geometry": simplify_geometry(feature["geometry"], tolerance),
+            } for feature in self._geojson["features"]]
+            self._layers[detail] = self._with_metrics(features)
+        return self._layers[detail]
+
+    def _with_metrics(self, features, metrics=None):
+        """Feature collection com as métricas (as atuais, por padrão) nas propriedades de cada país."""
+        values = (self.metrics if metrics is None else metrics).set_index("country")
+        columns = [spec["column"] for spec in MAP_METRICS.values()]
+        collection = []
+        for feature in features:
+            name = feature["properties"]["name"]
+            properties = {"name": name}
+            for column in columns:
+                # Converte para int padrão do Python (serialização JSON)
+                properties[column] = int(values[column].get(name, 0))
+            collection.append({**feature, "properties": properties})
+        return {"type": "FeatureCollection", "features": collection}
+
+    def update_metrics(self, metrics):
+        """
+        Troca as métricas por país (ex.: depois de um acréscimo de dados): as
+        geometrias já simplificadas são reaproveitadas e só os mapas
+        renderizados são descartados.
+        """
+        self.metrics = metrics
+        self._layers = {detail: self._with_metrics(layer["features"]) for detail, layer in self._layers.items()}
+        self._html = {}
+
+    def map_html(self, metric, detail=DEFAULT_DETAIL):
+        """HTML completo do mapa Folium, renderizado uma única vez por chave."""
+        key = (metric, detail)
+        if key not in self._html:
+            self._html[key] = self._render(metric, detail)
+        return self._html[key]
+
+    def filtered_map_html(self, metrics, metric, detail=DEFAULT_DETAIL):
+        """
+        HTML do mapa com outras métricas por país (ex.: só dos projetos de uma
+        seleção), sobre as mesmas geometrias simplificadas. Não é memorizado.
+        """
+        return self._render(metric, detail, metrics)
+
+    def _render(self, metric, detail, metrics=None):
+        spec = MAP_METRICS[metric]
+        column = spec["column"]
+        geo_data = self.feature_collection(detail)
+        if metrics is None:
+            metrics = self.metrics
+        else:
+            geo_data = self._with_metrics(geo_data["features"], metrics)
+        m = folium.Map(location=[20, 0], zoom_start=2, tiles='CartoDB positron')
+        choropleth = folium.Choropleth(
+            geo_data=geo_data, data=metrics, columns=['country', column],
+            key_on='feature.properties.name', fill_color=spec["fill_color"], fill_opacity=0.7,
+            line_opacity=0.2, legend_name=spec["legend"]
+        )
+        # O tooltip usa a mesma camada do coroplético: a geometria vai uma vez só
+        choropleth.geojson.add_child(folium.GeoJsonTooltip(
+            fields=['name', column], aliases=['País:', spec["alias"]],
+            style=('background-color: white; color: #333333; font-family: arial; font-size: 12px; padding: 10px;'),
+            sticky=True
+        ))
+        choropleth.add_to(m)
+        folium.LayerControl().add_to(m)
+        return m.get_root().render()
@@ -0,0 +1,220 @@
+"""
+Modelo de precificação (OLS) ajustado por estatísticas suficientes.
+
+O preço de cada crédito é explicado por co2_reduced, project_duration e o
+tipo de projeto (one-hot, com a primeira categoria como base). Como todos os
+regressores são atributos do projeto, XᵀX e Xᵀy são acumulados por projeto
+(número de créditos, soma e soma dos quadrados dos preços, as mesmas da
+tabela de métricas por projeto, aggregates.ProjectMetrics), sem montar a
+matriz de desenho com uma linha por crédito. Novos créditos entram por
+`update`, que só soma as estatísticas das linhas novas.
+"""
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+import aggregates
+
+NUMERIC_FEATURES = ["co2_reduced", "project_duration"]
+CATEGORICAL_FEATURE = "project_type"
+
+FACTOR_LABELS = {
+    "const": "Intercepto (Constante)",
+    "co2_reduced": "CO₂ Reduzido (por ton)",
+    "project_duration": "Duração do Projeto (ano)",
+}
+
+
+def factor_label(column):
+    """Nome legível de uma coluna do modelo."""
+    prefix = f"{CATEGORICAL_FEATURE}_"
+    if column.startswith(prefix):
+        return f"Tipo de Projeto: {column[len(prefix):]}"
+    return FACTOR_LABELS.get(column, column)
+
+
+class PricingModel:
+    """OLS com XᵀX, Xᵀy, yᵀy e n acumulados; ajuste e predição vetorizados."""
+
+    def __init__(self, project_types):
+        # A primeira categoria (ordem alfabética) é a base, sem coluna própria
+        self.project_types = sorted(project_types)
+        self.columns = ["const", *NUMERIC_FEATURES, *[f"{CATEGORICAL_FEATURE}_{t}" for t in self.project_types[1:]]]
+        size = len(self.columns)
+        self.xtx = np.zeros((size, size))
+        self.xty = np.zeros(size)
+        self.yty = 0.0
+        self.y_sum = 0.0
+        self.n = 0
+        self._result = None
+
+    # --- Matriz de desenho --- #
+
+    def _add_project_types(self, project_types):
+        """Acrescenta colunas (zeradas) para tipos de projeto ainda não vistos."""
+        new_types = sorted(set(project_types) - set(self.project_types))
+        if not new_types:
+            return
+        self.project_types += new_types
+        self.columns += [f"{CATEGORICAL_FEATURE}_{t}" for t in new_types]
+        size = len(self.columns)
+        xtx = np.zeros((size, size))
+        xtx[:self.xtx.shape[0], :self.xtx.shape[1]] = self.xtx
+        self.xtx = xtx
+        self.xty = np.concatenate([self.xty, np.zeros(size - len(self.xty))])
+
+    def design_matrix(self, frame):
+        """Matriz X (uma linha por linha de `frame`) nas colunas do modelo."""
+        X = np.zeros((len(frame), len(self.columns)))
+        X[:, 0] = 1.0
+        for j, feature in enumerate(NUMERIC_FEATURES, start=1):
+            X[:, j] = frame[feature].fillna(0).to_numpy(dtype="float64")
+        offset = 1 + len(NUMERIC_FEATURES)
+        positions = {t: offset + i - 1 for i, t in enumerate(self.project_types) if i > 0}
+        type_columns = frame[CATEGORICAL_FEATURE].map(positions).to_numpy()
+        rows = np.flatnonzero(pd.notna(type_columns))
+        X[rows, type_columns[rows].astype(int)] = 1.0
+        return X
+
+    # --- Estatísticas suficientes --- #
+
+    def update(self, projects, counts, price_sums, price_sq_sums):
+        """
+        Soma as estatísticas de um lote de créditos, agregadas por projeto:
+        `counts`, `price_sums` e `price_sq_sums` são alinhados com `projects`.
+        """
+        counts = np.asarray(counts, dtype="float64")
+        keep = counts > 0
+        projects = projects[keep]
+        counts, price_sums = counts[keep], np.asarray(price_sums, dtype="float64")[keep]
+
+        self._add_project_types(projects[CATEGORICAL_FEATURE].dropna().unique())
+        X = self.design_matrix(projects)
+        self.xtx += X.T @ (X * counts[:, None])
+        self.xty += X.T @ price_sums
+        self.yty += float(np.asarray(price_sq_sums, dtype="float64")[keep].sum())
+        self.y_sum += float(price_sums.sum())
+        self.n += int(counts.sum())
+        self._result = None
+        return self
+
+    def update_from_credits(self, projects, credits):
+        """Agrega as linhas de crédito por project_key e chama `update`."""
+        keys = credits["project_key"].to_numpy()
+        prices = credits["price"].to_numpy(dtype="float64")
+        size = len(projects)
+        return self.update(
+            projects,
+            np.bincount(keys, minlength=size),
+            np.bincount(keys, weights=prices, minlength=size),
+            np.bincount(keys, weights=prices ** 2, minlength=size),
+        )
+
+    # --- Ajuste --- #
+
+    def fit(self):
+        """Resolve o OLS a partir das estatísticas acumuladas (com cache)."""
+        if self._result is not None:
+            return self._result
+
+        # Escala as colunas para um sistema bem condicionado (co2_reduced é enorme)
+        scale = np.sqrt(np.diag(self.xtx))
+        scale[scale == 0] = 1.0
+        xtx_scaled = self.xtx / np.outer(scale, scale)
+        xtx_inv = np.linalg.pinv(xtx_scaled) / np.outer(scale, scale)
+        beta = xtx_inv @ self.xty
+
+        n, k = self.n, int(np.linalg.matrix_rank(xtx_scaled))
+        rss = max(self.yty - 2 * beta @ self.xty + beta @ self.xtx @ beta, 0.0)
+        tss = self.yty - self.y_sum ** 2 / n
+        df_resid, df_model = n - k, k - 1
+        sigma2 = rss / df_resid if df_resid > 0 else np.nan
+        std_err = np.sqrt(np.clip(np.diag(xtx_inv) * sigma2, 0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_values = beta / std_err
+            f_value = ((tss - rss) / df_model) / sigma2 if df_model > 0 else np.nan
+        t_crit = stats.t.ppf(0.975, df_resid) if df_resid > 0 else np.nan
+        eigenvalues = np.linalg.eigvalsh(xtx_scaled)
+
+        r2 = 1 - rss / tss if tss > 0 else np.nan
+        self._result = {
+            "coefficients": pd.DataFrame({
+                "coef": beta,
+                "std_err": std_err,
+                "t": t_values,
+                "p_value": 2 * stats.t.sf(np.abs(t_values), df_resid),
+                "ci_low": beta - t_crit * std_err,
+                "ci_high": beta + t_crit * std_err,
+            }, index=self.columns),
+            "n": n,
+            "df_model": df_model,
+            "df_resid": df_resid,
+            "r2": r2,
+            "adj_r2": 1 - (1 - r2) * (n - 1) / df_resid if df_resid > 0 else np.nan,
+            "f_value": f_value,
+            "f_pvalue": stats.f.sf(f_value, df_model, df_resid) if df_model > 0 and df_resid > 0 else np.nan,
+            "cond_no": float(np.sqrt(eigenvalues.max() / eigenvalues[eigenvalues > 1e-12].min())),
+        }
+        return self._result
+
+    def predict(self, frame):
+        """Preço previsto para cada linha de `frame` (vetorizado)."""
+        beta = self.fit()["coefficients"]["coef"].to_numpy()
+        return self.design_matrix(frame) @ beta
+
+    def predict_scenarios(self, frame):
+        """
+        Preço previsto para cenários enviados pelo usuário, com validação: as
+        colunas numéricas são convertidas (valor inválido vira NaN) e as linhas
+        com número inválido ou com tipo de projeto fora do modelo (que
+        `predict` trataria como a categoria base) ficam sem preço (NaN).
+        Retorna (frame com `predicted_price`, linhas com número inválido,
+        linhas com tipo de projeto desconhecido).
+        """
+        frame = frame.assign(**{feature: pd.to_numeric(frame[feature], errors="coerce") for feature in NUMERIC_FEATURES})
+        invalid_number = frame[NUMERIC_FEATURES].isna().any(axis=1).to_numpy()
+        unknown_type = ~frame[CATEGORICAL_FEATURE].isin(self.project_types).to_numpy()
+        valid = ~(invalid_number | unknown_type)
+        prices = np.full(len(frame), np.nan)
+        prices[valid] = self.predict(frame[valid])
+        return frame.assign(predicted_price=prices), int(invalid_number.sum()), int(unknown_type.sum())
+
+    def summary_text(self):
+        """Resumo no formato da saída do statsmodels."""
+        result = self.fit()
+        lines = [
+            "OLS Regression Results".center(84),
+            "=" * 84,
+            f"{'Dep. Variable:':<20}{'price':>20}   {'R-squared:':<22}{result['r2']:>18.3f}",
+            f"{'No. Observations:':<20}{result['n']:>20}   {'Adj. R-squared:':<22}{result['adj_r2']:>18.3f}",
+            f"{'Df Residuals:':<20}{result['df_resid']:>20}   {'F-statistic:':<22}{result['f_value']:>18.4g}",
+            f"{'Df Model:':<20}{result['df_model']:>20}   {'Prob (F-statistic):':<22}{result['f_pvalue']:>18.3g}",
+            f"{'':<43}{'Cond. No. (escalado):':<22}{result['cond_no']:>18.3g}",
+            "=" * 84,
+            f"{'':<28}{'coef':>11}{'std err':>11}{'t':>9}{'P>|t|':>7}{'[0.025':>9}{'0.975]':>9}",
+            "-" * 84,
+        ]
+        for name, row in result["coefficients"].iterrows():
+            lines.append(
+                f"{name[:28]:<28}{row['coef']:>11.4g}{row['std_err']:>11.3g}{row['t']:>9.3f}"
+                f"{row['p_value']:>7.3f}{row['ci_low']:>9.2g}{row['ci_high']:>9.2g}"
+            )
+        lines.append("=" * 84)
+        return "\n".join(lines)
+
+
+def fit_from_metrics(projects, metrics):
+    """
+    Ajusta o modelo com as estatísticas de preço por projeto de `metrics`
+    (aggregates.ProjectMetrics), sem reagregar os créditos. Os atributos
+    vêm de aggregates.project_features (duração completada pelas transações).
+    """
+    model = PricingModel(projects[CATEGORICAL_FEATURE].dropna().unique())
+    model.update(aggregates.project_features(projects, metrics.table()), *metrics.price_stats())
+    model.fit()
+    return model
+
+
+def fit_from_engine(engine):
+    """Ajusta o modelo com as métricas por projeto agregadas pelo motor de consultas."""
+    return fit_from_metrics(engine.projects(), engine.project_metrics())
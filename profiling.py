@@ -0,0 +1,285 @@
+"""
+Instrumentação opcional das etapas do painel.
+
+Desligada por padrão: liga com a variável de ambiente PAINEL_PROFILING=1 ou
+pela seção de administração (app.py?admin=1). Ligada, cada etapa medida
+(funções de carga, geradores de gráfico e a seção da execução) registra:
+tempo de parede, tempo de CPU da thread, pico e saldo de memória alocada
+(tracemalloc), acerto ou falha do cache e o tamanho das mensagens enviadas ao
+navegador durante a etapa. Os registros ficam num buffer do processo e podem
+ser exportados em JSON ou no formato de texto do Prometheus.
+
+O tracemalloc é global ao processo: com várias sessões simultâneas, a
+memória de uma etapa inclui a alocada pelas outras threads no mesmo período.
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+ENV_VAR = "PAINEL_PROFILING"
+MAX_RECORDS = 5000
+METRIC_PREFIX = "painel"
+
+
+class _Frame:
+    """Uma etapa em andamento na thread atual."""
+
+    def __init__(self, name, run_id):
+        self.name = name
+        self.run_id = run_id
+        self.cache = None
+        self.payload_bytes = 0
+        self.memory_start = 0
+        self.memory_peak = 0
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+
+
+class Profiler:
+    def __init__(self, enabled=False, max_records=MAX_RECORDS):
+        self.enabled = False
+        self.records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if enabled:
+            self.enable()
+
+    # --- Liga/desliga --- #
+
+    def enable(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+    # --- Etapas --- #
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def begin_run(self):
+        """
+        Início de uma execução do script: abre a etapa "execução" e passa a
+        contar os bytes das mensagens enviadas à sessão.
+        """
+        stack = self._stack()
+        # Uma execução interrompida (st.stop, rerun) deixa etapas abertas
+        stack.clear()
+        self._local.run_id = uuid.uuid4().hex[:12]
+        if not self.enabled:
+            return None
+        ctx = get_script_run_ctx()
+        if ctx is not None and not getattr(ctx._enqueue, "_counts_payload", False):
+            ctx._enqueue = self._counting(ctx._enqueue)
+        return self.enter("execução")
+
+    def end_run(self):
+        stack = self._stack()
+        if stack:
+            self.exit(stack[0])
+
+    def _counting(self, enqueue):
+        def counting_enqueue(msg):
+            if self.enabled:
+                size = msg.ByteSize()
+                for frame in self._stack():
+                    frame.payload_bytes += size
+            enqueue(msg)
+
+        counting_enqueue._counts_payload = True
+        return counting_enqueue
+
+    def enter(self, name):
+        """Abre uma etapa (use `exit` com o objeto retornado) ou None se desligado."""
+        if not self.enabled:
+            return None
+        stack = self._stack()
+        frame = _Frame(name, getattr(self._local, "run_id", None))
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # O pico é zerado para a etapa nova; a etapa de fora guarda o que já viu
+            for outer in stack:
+                outer.memory_peak = max(outer.memory_peak, peak)
+            tracemalloc.reset_peak()
+            frame.memory_start = frame.memory_peak = current
+        stack.append(frame)
+        return frame
+
+    def exit(self, frame):
+        if frame is None:
+            return
+        stack = self._stack()
+        if frame not in stack:
+            return
+        # Fecha também etapas internas que ficaram abertas por uma exceção
+        while stack and stack[-1] is not frame:
+            self.exit(stack[-1])
+        stack.pop()
+
+        wall = time.perf_counter() - frame.wall_start
+        cpu = time.thread_time() - frame.cpu_start
+        memory_peak = memory_net = None
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            memory_peak = max(peak, frame.memory_peak) - frame.memory_start
+            memory_net = current - frame.memory_start
+            for outer in stack:
+                outer.memory_peak = max(outer.memory_peak, peak)
+        record = {
+            "run_id": frame.run_id,
+            "timestamp": time.time(),
+            "stage": frame.name,
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "memory_peak_bytes": memory_peak,
+            "memory_net_bytes": memory_net,
+            "cache": frame.cache,
+            "payload_bytes": frame.payload_bytes,
+        }
+        with self._lock:
+            self.records.append(record)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Mede o bloco `with` como uma etapa."""
+        frame = self.enter(name)
+        try:
+            yield frame
+        finally:
+            self.exit(frame)
+
+    def cache_resource(self, name=None, **cache_kwargs):
+        """
+        Substitui `@st.cache_resource`: mesmo cache do Streamlit, com a chamada
+        medida como etapa. A etapa é marcada "miss" quando a função original
+        executa e "hit" quando o valor vem do cache (o tempo de um acerto é,
+        basicamente, o hash dos argumentos).
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def on_miss(*args, **kwargs):
+                stack = self._stack()
+                if self.enabled and stack and stack[-1].cache == "hit":
+                    stack[-1].cache = "miss"
+                return function(*args, **kwargs)
+
+            cached = st.cache_resource(**cache_kwargs)(on_miss)
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return cached(*args, **kwargs)
+                frame = self.enter(name or function.__name__)
+                frame.cache = "hit"
+                try:
+                    return cached(*args, **kwargs)
+                finally:
+                    self.exit(frame)
+
+            wrapper.clear = cached.clear
+            return wrapper
+        return decorator
+
+    # --- Relatórios --- #
+
+    def frame(self):
+        """Registros como DataFrame (uma linha por etapa medida)."""
+        with self._lock:
+            return pd.DataFrame(list(self.records), columns=[
+                "run_id", "timestamp", "stage", "wall_s", "cpu_s", "memory_peak_bytes",
+                "memory_net_bytes", "cache", "payload_bytes",
+            ])
+
+    def summary(self):
+        """Agregados por etapa: chamadas, tempos (média, p50, p95), memória, cache e payload."""
+        records = self.frame()
+        if records.empty:
+            return pd.DataFrame()
+        grouped = records.groupby("stage")
+        summary = pd.DataFrame({
+            "calls": grouped.size(),
+            "wall_mean_s": grouped["wall_s"].mean(),
+            "wall_p50_s": grouped["wall_s"].median(),
+            "wall_p95_s": grouped["wall_s"].quantile(0.95),
+            "cpu_mean_s": grouped["cpu_s"].mean(),
+            "memory_peak_max_bytes": grouped["memory_peak_bytes"].max(),
+            "cache_hits": grouped["cache"].apply(lambda c: int((c == "hit").sum())),
+            "cache_misses": grouped["cache"].apply(lambda c: int((c == "miss").sum())),
+            "payload_mean_bytes": grouped["payload_bytes"].mean(),
+        })
+        return summary.sort_values("wall_mean_s", ascending=False)
+
+    def to_json(self):
+        summary = self.summary()
+        return json.dumps({
+            "summary": summary.reset_index().to_dict("records") if not summary.empty else [],
+            "records": self.frame().to_dict("records"),
+        }, indent=2, ensure_ascii=False, default=str)
+
+    def to_prometheus(self):
+        """Métricas acumuladas no formato de texto do Prometheus."""
+        records = self.frame()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels.items())
+                lines.append(f"{METRIC_PREFIX}_{name}{suffix}{{{label_text}}} {value:.6g}")
+
+        grouped = records.groupby("stage")
+        for name, column, help_text in (
+            ("stage_wall_seconds", "wall_s", "Tempo de parede por etapa."),
+            ("stage_cpu_seconds", "cpu_s", "Tempo de CPU da thread por etapa."),
+            ("stage_payload_bytes", "payload_bytes", "Bytes enviados ao navegador durante a etapa."),
+        ):
+            samples = []
+            for stage, values in grouped[column]:
+                samples.append(("_sum", {"stage": stage}, float(values.sum())))
+                samples.append(("_count", {"stage": stage}, float(values.count())))
+            metric(name, "summary", help_text, samples)
+        metric("stage_memory_peak_bytes", "gauge", "Maior pico de memória alocada observado na etapa.", [
+            ("", {"stage": stage}, float(values.max()))
+            for stage, values in grouped["memory_peak_bytes"] if values.notna().any()
+        ])
+        cache = records.dropna(subset=["cache"]).groupby(["stage", "cache"]).size()
+        metric("cache_requests_total", "counter", "Chamadas a funções em cache por resultado.", [
+            ("", {"stage": stage, "result": result}, float(count)) for (stage, result), count in cache.items()
+        ])
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+PROFILER = Profiler(enabled=os.environ.get(ENV_VAR) == "1")
+
+# Atalhos no nível do módulo
+begin_run = PROFILER.begin_run
+end_run = PROFILER.end_run
+enter_stage = PROFILER.enter
+exit_stage = PROFILER.exit
+stage = PROFILER.stage
+cache_resource = PROFILER.cache_resource
@@ -0,0 +1,76 @@
+"""
+Metodologias (protocolos) dos projetos.
+
+A coluna `protocol` de projects.csv é interpretada uma vez na carga
+(data_loader.explode_protocols) em pares (project_key, protocolo). O
+`ProtocolIndex` ordena esses pares por protocolo: os pares de cada protocolo
+ficam contíguos, e os offsets formam um índice invertido protocolo ->
+projetos. Os totais por metodologia são somas ponderadas (np.bincount) sobre
+os pares, sem reler nem reinterpretar a coluna de texto.
+
+Um projeto com mais de uma metodologia entra nos totais de cada uma.
+"""
+import numpy as np
+import pandas as pd
+
+# Rótulos dos tipos de transação nos totais de crédito
+TRANSACTION_LABELS = {"issuance": "Emissão", "retirement": "Aposentadoria"}
+
+
+class ProtocolIndex:
+    """Índice invertido protocolo -> project_key sobre os pares de explode_protocols."""
+
+    def __init__(self, pairs, size):
+        self.size = size
+        self.protocols = list(pairs["protocol"].cat.categories)
+        codes = pairs["protocol"].cat.codes.to_numpy()
+        order = np.argsort(codes, kind="stable")
+        # Protocolo de cada par e a chave do projeto, agrupados por protocolo
+        self.pair_protocols = codes[order]
+        self.project_keys = pairs["project_key"].to_numpy()[order]
+        self.offsets = np.searchsorted(self.pair_protocols, np.arange(len(self.protocols) + 1))
+        self._positions = {protocol: i for i, protocol in enumerate(self.protocols)}
+
+    def projects(self, protocol):
+        """Chaves dos projetos que usam a metodologia (vazio se desconhecida)."""
+        i = self._positions.get(protocol)
+        if i is None:
+            return self.project_keys[:0]
+        return self.project_keys[self.offsets[i]:self.offsets[i + 1]]
+
+    def mask(self, protocols):
+        """Máscara sobre project_key dos projetos que usam alguma das metodologias."""
+        mask = np.zeros(self.size, dtype=bool)
+        for protocol in protocols:
+            mask[self.projects(protocol)] = True
+        return mask
+
+    def totals(self, values, project_mask=None):
+        """
+        Soma por protocolo de valores por projeto (arrays indexados por
+        project_key), só com os projetos de `project_mask`, se dada. Inclui o
+        número de projetos de cada protocolo (project_count).
+        """
+        weights = np.ones(len(self.project_keys)) if project_mask is None else project_mask[self.project_keys]
+        n = len(self.protocols)
+        table = {"project_count": np.bincount(self.pair_protocols, weights=weights, minlength=n).astype("int64")}
+        for name, column in values.items():
+            table[name] = np.bincount(self.pair_protocols, weights=column[self.project_keys] * weights, minlength=n)
+        return pd.DataFrame(table, index=pd.Index(self.protocols, name="protocol"))
+
+
+def methodology_totals(index, projects, credit_volumes=None, project_mask=None):
+    """
+    Totais por metodologia: projetos, créditos emitidos e aposentados
+    declarados nos projetos (issued, retired) e, com `credit_volumes`
+    (credit_summary por project_key e transaction_type), o volume das
+    transações de cada tipo. Só metodologias com projetos na seleção.
+    """
+    values = {column: projects[column].fillna(0).to_numpy(dtype="float64") for column in ("issued", "retired")}
+    if credit_volumes is not None:
+        for transaction_type, rows in credit_volumes.groupby("transaction_type", observed=True):
+            volume = np.zeros(index.size)
+            volume[rows["project_key"].to_numpy()] = rows["volume"].to_numpy()
+            values[f"{transaction_type}_volume"] = volume
+    table = index.totals(values, project_mask).round().astype("int64")
+    return table[table["project_count"] > 0].sort_values("issued", ascending=False)
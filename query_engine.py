@@ -0,0 +1,426 @@
+"""
+Motor de consultas do painel: agregações com filtros executadas perto dos dados.
+
+Há duas implementações com a mesma interface:
+
+- `DuckDBEngine`: DuckDB embutido (no próprio processo, sem servidor) sobre os
+  arquivos Parquet gravados pelo data_loader. Os filtros (ano, tipo, país,
+  intervalo de datas) e as agregações são executados na varredura dos
+  arquivos, e só o resultado, pequeno, vira DataFrame. A tabela de créditos
+  nunca é carregada inteira na memória; o DuckDB grava em disco o que não
+  couber durante uma consulta.
+- `PandasEngine`: o caminho em memória sobre o modelo estrela
+  (dataset.CarbonDataset), com o cache Arrow das tabelas; é o padrão.
+
+Os métodos aceitam `project_mask`, uma máscara booleana sobre project_key
+(ex.: a seleção dos filtros globais, filters.FacetIndex), que restringe as
+consultas aos créditos dos projetos selecionados.
+
+A implementação é escolhida pela variável de ambiente PAINEL_MOTOR:
+"pandas" (padrão), "duckdb" ou "auto" (DuckDB se estiver instalado). O
+DuckDB só é usado quando escolhido: com o duckdb no requirements.txt,
+"auto" seria sempre o DuckDB.
+"""
+import importlib.util
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import data_loader
+import dataset
+
+ENV_VAR = "PAINEL_MOTOR"
+BACKENDS = ("auto", "duckdb", "pandas")
+DEFAULT_BACKEND = "pandas"
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+class PandasEngine:
+    """Consultas sobre o modelo estrela em memória."""
+
+    name = "pandas"
+
+    def __init__(self, carbon_data, projects_path=data_loader.PROJECTS_CSV, credits_path=data_loader.CREDITS_CSV,
+                 cache_dir=data_loader.CACHE_DIR):
+        self.carbon_data = carbon_data
+        self.paths = {"projects_path": projects_path, "credits_path": credits_path, "cache_dir": cache_dir}
+
+    def refresh(self):
+        """
+        Incorpora as linhas acrescentadas aos CSVs e retorna o data_loader.Delta
+        (None se nada mudou). Lança data_loader.FullReloadRequired se os CSVs
+        não só cresceram.
+        """
+        frames, delta = data_loader.update_frames((self.carbon_data.projects, self.carbon_data.credits), **self.paths)
+        if delta is not None:
+            self.carbon_data = dataset.CarbonDataset(*frames)
+        return delta
+
+    @property
+    def credit_columns(self):
+        return set(self.carbon_data.credits.columns)
+
+    def memory_frames(self):
+        """Tabelas mantidas na memória do processo (para data_loader.memory_report)."""
+        return {"projects": self.carbon_data.projects, "credits": self.carbon_data.credits}
+
+    def projects(self):
+        return self.carbon_data.projects
+
+    def _credit_mask(self, years=None, project_types=None, countries=None, start=None, end=None, project_mask=None):
+        projects = self.carbon_data.projects
+        project_mask = np.ones(len(projects), dtype=bool) if project_mask is None else np.array(project_mask, dtype=bool)
+        for column, values in (("implementation_year", years), ("project_type", project_types), ("country", countries)):
+            if values is not None:
+                project_mask &= projects[column].isin(_as_list(values)).to_numpy()
+        mask = self.carbon_data.credit_mask(project_mask)
+        if start is not None or end is not None:
+            dates = self.carbon_data.credits["transaction_date"]
+            if start is not None:
+                mask &= (dates >= pd.Timestamp(start, tz="UTC")).to_numpy()
+            if end is not None:
+                mask &= (dates < pd.Timestamp(end, tz="UTC") + pd.Timedelta(days=1)).to_numpy()
+        return mask
+
+    def credit_summary(self, group_by=(), **filters):
+        """
+        Créditos filtrados, agregados por `group_by` (colunas do fato ou da
+        dimensão): número de créditos, projetos distintos, volume, soma e média
+        do preço e soma de co2_reduced.
+        """
+        group_by = list(group_by)
+        rows = self.carbon_data.credit_view(
+            list(dict.fromkeys([*group_by, "project_key", "volume", "price", "co2_reduced"])),
+            rows=self._credit_mask(**filters),
+        )
+        rows["price"] = rows["price"].astype("float64")
+        aggregations = {
+            "credit_count": ("price", "size"),
+            "project_count": ("project_key", "nunique"),
+            "volume": ("volume", "sum"),
+            "price_sum": ("price", "sum"),
+            "price_mean": ("price", "mean"),
+            "co2_sum": ("co2_reduced", "sum"),
+        }
+        if group_by:
+            return rows.groupby(group_by, sort=True, observed=True).agg(**aggregations).reset_index()
+        return pd.DataFrame([{name: rows[column].agg(function) for name, (column, function) in aggregations.items()}])
+
+    def year_type_cube(self, years=None, project_mask=None):
+        """Cubo ano/tipo; com `years`, só as células e posições desses anos."""
+        return aggregates.build_year_type_cube(self.carbon_data, years=years, project_mask=project_mask)
+
+    def time_series(self, project_mask=None):
+        return aggregates.build_time_series(self.carbon_data, project_mask=project_mask)
+
+    def project_metrics(self):
+        """Métricas de atividade de crédito por projeto (aggregates.ProjectMetrics)."""
+        return aggregates.build_project_metrics(self.carbon_data)
+
+    def project_credits(self, project_key):
+        """Histórico de créditos de um projeto (colunas do fato), em ordem de data."""
+        columns = [column for column in self.carbon_data.credits.columns if column != "project_key"]
+        history = self.carbon_data.credit_view(columns, rows=self.carbon_data.project_rows(project_key))
+        if "transaction_date" in history.columns:
+            history = history.sort_values("transaction_date", kind="stable")
+        return history.reset_index(drop=True)
+
+    def credit_sample(self, columns, size=1000):
+        """As primeiras `size` linhas de créditos com as colunas pedidas (ex.: para estimar bytes por linha)."""
+        rows = np.arange(min(size, len(self.carbon_data.credits)))
+        return self.carbon_data.credit_view(columns, rows=rows).reset_index(drop=True)
+
+    def credit_chunks(self, columns, chunksize, **filters):
+        """
+        Créditos filtrados (mesmos filtros de credit_summary) com as colunas
+        pedidas, em blocos de até `chunksize` linhas, na ordem da tabela de
+        créditos. Retorna (número de linhas, iterador dos blocos).
+        """
+        mask = self._credit_mask(**filters)
+
+        def chunks():
+            # A máscara é percorrida em janelas de `chunksize` posições; as
+            # posições selecionadas se acumulam até formar um bloco cheio
+            pending = np.empty(0, dtype="int64")
+            for start in range(0, len(mask), chunksize):
+                pending = np.concatenate([pending, start + np.flatnonzero(mask[start:start + chunksize])])
+                last_window = start + chunksize >= len(mask)
+                while len(pending) >= chunksize or (last_window and len(pending)):
+                    rows, pending = pending[:chunksize], pending[chunksize:]
+                    yield self.carbon_data.credit_view(columns, rows=rows).reset_index(drop=True)
+
+        return int(mask.sum()), chunks()
+
+    def year_points(self, year, columns, cube=None, project_mask=None):
+        """Colunas pedidas para os créditos de um ano, com índice 0..n-1."""
+        cube = cube if cube is not None else self.year_type_cube()
+        rows = cube.rows[year]
+        if project_mask is not None:
+            rows = rows[np.asarray(project_mask)[self.carbon_data.credits["project_key"].to_numpy()[rows]]]
+        return self.carbon_data.credit_view(columns, rows=rows).reset_index(drop=True)
+
+
+class DuckDBEngine:
+    """
+    Consultas SQL do DuckDB sobre projects.parquet e as partes de créditos
+    (credits/part-*.parquet).
+
+    Uma única conexão em memória é compartilhada; cada consulta usa um cursor
+    próprio, então as sessões do servidor podem consultar em paralelo. As
+    views leem os arquivos a cada consulta, então uma parte nova gravada por
+    `refresh` já entra na consulta seguinte.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, parquet_dir=data_loader.PARQUET_DIR, memory_limit=None,
+                 projects_path=data_loader.PROJECTS_CSV, credits_path=data_loader.CREDITS_CSV):
+        import duckdb
+
+        self.parquet_dir = parquet_dir
+        self.paths = {"projects_path": projects_path, "credits_path": credits_path, "parquet_dir": parquet_dir}
+        self._connection = duckdb.connect()
+        self._connection.execute("SET TimeZone = 'UTC'")
+        # Resultados intermediários que não cabem na memória vão para o disco
+        self._connection.execute("SET temp_directory = ?", [os.path.join(parquet_dir, "tmp")])
+        if memory_limit:
+            self._connection.execute("SET memory_limit = ?", [memory_limit])
+        projects = data_loader.parquet_path(parquet_dir, "projects")
+        credits = data_loader.credit_parts_glob(parquet_dir)
+        # (filename, file_row_number) é a posição do crédito, para uma ordem estável dos resultados
+        self._connection.execute(f"CREATE VIEW projects AS SELECT * FROM read_parquet('{_sql_path(projects)}')")
+        self._connection.execute(
+            f"CREATE VIEW credits AS SELECT * FROM read_parquet('{_sql_path(credits)}', "
+            "filename = true, file_row_number = true)"
+        )
+        self.credit_columns = set(self._query("SELECT * FROM credits LIMIT 0").columns)
+        self._projects = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Mesmo contrato de PandasEngine.refresh, sobre as tabelas Parquet."""
+        delta = data_loader.update_parquet_tables(**self.paths)
+        if delta is not None and len(delta.projects):
+            with self._lock:
+                self._projects = None
+        return delta
+
+    def _execute(self, sql, parameters=None, project_mask=None):
+        """
+        Executa a consulta num cursor próprio e o retorna. Com `project_mask`,
+        as chaves selecionadas ficam disponíveis na consulta como a tabela
+        `selected_projects` (ver `_where`).
+        """
+        cursor = self._connection.cursor()
+        if project_mask is not None:
+            keys = np.flatnonzero(project_mask).astype("int32")
+            cursor.register("selected_projects", pd.DataFrame({"project_key": keys}))
+        return cursor.execute(sql, parameters or [])
+
+    def _query(self, sql, parameters=None, project_mask=None):
+        """Resultado de `_execute` como DataFrame."""
+        return self._execute(sql, parameters, project_mask).df()
+
+    def _column(self, column):
+        return f'c."{column}"' if column in self.credit_columns else f'p."{column}"'
+
+    def _where(self, years=None, project_types=None, countries=None, start=None, end=None, project_mask=None):
+        """
+        Cláusula WHERE e parâmetros dos filtros (None = sem filtro). Com
+        `project_mask`, a consulta precisa ser executada com a mesma máscara
+        (`_query(..., project_mask=...)`).
+        """
+        clauses, parameters = [], []
+        for column, values in (("implementation_year", years), ("project_type", project_types), ("country", countries)):
+            if values is not None:
+                values = _as_list(values)
+                clauses.append(f"p.{column} IN ({', '.join('?' * len(values))})" if values else "FALSE")
+                parameters.extend(values)
+        if start is not None:
+            clauses.append("c.transaction_date >= ?")
+            parameters.append(pd.Timestamp(start, tz="UTC"))
+        if end is not None:
+            clauses.append("c.transaction_date < ?")
+            parameters.append(pd.Timestamp(end, tz="UTC") + pd.Timedelta(days=1))
+        if project_mask is not None:
+            clauses.append("c.project_key IN (SELECT project_key FROM selected_projects)")
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", parameters
+
+    def projects(self):
+        """Dimensão de projetos (pequena), lida uma vez do Parquet."""
+        with self._lock:
+            if self._projects is None:
+                projects = self._query("SELECT * FROM projects ORDER BY project_key")
+                for column in ("first_issuance_at", "first_retirement_at"):
+                    projects[column] = projects[column].astype("datetime64[ns, UTC]")
+                # O Parquet guarda os textos categóricos como strings
+                self._projects = data_loader.apply_schema(projects, data_loader.PROJECTS_SCHEMA)
+        return self._projects.copy(deep=False)
+
+    def memory_frames(self):
+        """Só a dimensão de projetos fica na memória; os créditos ficam nos arquivos Parquet."""
+        return {"projects": self.projects()}
+
+    def credit_summary(self, group_by=(), **filters):
+        """Mesmo resultado de PandasEngine.credit_summary, agregado na varredura."""
+        where, parameters = self._where(**filters)
+        keys = "".join(f'{self._column(column)} AS "{column}", ' for column in group_by)
+        positions = ", ".join(str(i + 1) for i in range(len(group_by)))
+        group = f"GROUP BY {positions} ORDER BY {positions}" if group_by else ""
+        summary = self._query(f"""
+            SELECT {keys}
+                   count(*) AS credit_count,
+                   count(DISTINCT c.project_key) AS project_count,
+                   coalesce(sum(c.volume), 0)::BIGINT AS volume,
+                   coalesce(sum(c.price::DOUBLE), 0) AS price_sum,
+                   avg(c.price::DOUBLE) AS price_mean,
+                   coalesce(sum(p.co2_reduced), 0)::BIGINT AS co2_sum
+            FROM credits c JOIN projects p USING (project_key)
+            {where} {group}
+        """, parameters, filters.get("project_mask"))
+        if group_by:
+            summary = summary.dropna(subset=list(group_by)).reset_index(drop=True)
+        return summary
+
+    def year_type_cube(self, years=None, project_mask=None):
+        """
+        YearTypeCube com as células agregadas pelo DuckDB (sem as posições por
+        ano); com `years`, só as células desses anos. As estatísticas do preço
+        ficam em float32, como no pandas.
+        """
+        where, parameters = self._where(years=years, project_mask=project_mask)
+        cells = self._query(f"""
+            SELECT p.implementation_year, p.project_type,
+                   count(*) AS credit_count,
+                   sum(c.price::DOUBLE) AS price_sum,
+                   avg(c.price)::FLOAT AS price_mean,
+                   median(c.price) AS price_median,
+                   min(c.price) AS price_min,
+                   max(c.price) AS price_max,
+                   count(DISTINCT c.project_key) AS project_count,
+                   sum(p.co2_reduced)::BIGINT AS co2_sum
+            FROM credits c JOIN projects p USING (project_key)
+            {where or "WHERE TRUE"} AND p.implementation_year IS NOT NULL AND p.project_type IS NOT NULL
+            GROUP BY 1, 2 ORDER BY 1, 2
+        """, parameters, project_mask)
+        return aggregates.YearTypeCube(cells.set_index(["implementation_year", "project_type"]), rows=None)
+
+    def time_series(self, project_mask=None):
+        """TimeSeriesStore a partir do rollup diário agregado pelo DuckDB."""
+        if "transaction_date" not in self.credit_columns:
+            return None
+        where, parameters = self._where(project_mask=project_mask)
+        dimensions = ", ".join(f"p.{dim}" for dim in aggregates.TimeSeriesStore.DIMENSIONS)
+        daily = self._query(f"""
+            SELECT date_trunc('day', c.transaction_date) AS transaction_date, {dimensions},
+                   sum(c.volume)::BIGINT AS volume,
+                   sum(c.price::DOUBLE) AS price_sum,
+                   sum(c.price::DOUBLE * c.volume) AS value,
+                   count(*) AS trades
+            FROM credits c JOIN projects p USING (project_key)
+            WHERE c.transaction_date IS NOT NULL
+              AND {' AND '.join(f'p.{dim} IS NOT NULL' for dim in aggregates.TimeSeriesStore.DIMENSIONS)}
+              {where.replace("WHERE", "AND", 1)}
+            GROUP BY ALL ORDER BY ALL
+        """, parameters, project_mask)
+        daily["transaction_date"] = daily["transaction_date"].astype("datetime64[ns, UTC]")
+        return aggregates.TimeSeriesStore.from_daily(daily)
+
+    def project_metrics(self):
+        """Mesmo resultado de PandasEngine.project_metrics, agregado numa varredura dos créditos."""
+        columns = self.credit_columns
+        selects = []
+        if "transaction_type" in columns:
+            selects += [f"coalesce(sum(volume::DOUBLE) FILTER (WHERE transaction_type = '{label}'), 0) AS {column}"
+                        for column, label in (("issued_volume", "issuance"), ("retired_volume", "retirement"))]
+        if "transaction_date" in columns:
+            selects += ["min(transaction_date) AS first_transaction", "max(transaction_date) AS last_transaction"]
+        stats = self._query(f"""
+            SELECT project_key, count(*) AS transaction_count,
+                   coalesce(sum(volume::DOUBLE), 0) AS volume,
+                   coalesce(sum(price::DOUBLE), 0) AS price_sum,
+                   coalesce(sum(price::DOUBLE * price::DOUBLE), 0) AS price_sq_sum
+                   {"".join(f", {select}" for select in selects)}
+            FROM credits GROUP BY project_key
+        """)
+        index = pd.RangeIndex(len(self.projects()), name="project_key")
+        stats = stats.set_index("project_key").reindex(index)
+        sums = [column for column in aggregates.ProjectMetrics.SUMS if column in stats.columns]
+        stats[sums] = stats[sums].fillna(0)
+        return aggregates.ProjectMetrics.from_stats(stats)
+
+    def project_credits(self, project_key):
+        """Mesmo resultado de PandasEngine.project_credits."""
+        order = "transaction_date, " if "transaction_date" in self.credit_columns else ""
+        history = self._query(f"""
+            SELECT * EXCLUDE (project_key, filename, file_row_number) FROM credits WHERE project_key = ?
+            ORDER BY {order}filename, file_row_number
+        """, [int(project_key)])
+        if "transaction_date" in history.columns:
+            history["transaction_date"] = history["transaction_date"].astype("datetime64[ns, UTC]")
+        return history
+
+    def credit_sample(self, columns, size=1000):
+        select = ", ".join(f"{self._column(column)} AS \"{column}\"" for column in columns)
+        return self._query(f"SELECT {select} FROM credits c JOIN projects p USING (project_key) LIMIT ?", [size])
+
+    def credit_chunks(self, columns, chunksize, **filters):
+        """
+        Mesmo contrato de PandasEngine.credit_chunks: os blocos saem do
+        resultado da consulta em lotes de `chunksize` linhas (RecordBatchReader),
+        sem materializar o resultado inteiro.
+        """
+        where, parameters = self._where(**filters)
+        project_mask = filters.get("project_mask")
+        count = self._query(f"SELECT count(*) AS n FROM credits c JOIN projects p USING (project_key) {where}",
+                            parameters, project_mask)
+        select = ", ".join(f"{self._column(column)} AS \"{column}\"" for column in columns)
+
+        def chunks():
+            reader = self._execute(f"""
+                SELECT {select} FROM credits c JOIN projects p USING (project_key)
+                {where} ORDER BY c.filename, c.file_row_number
+            """, parameters, project_mask).fetch_record_batch(chunksize)
+            for batch in reader:
+                chunk = batch.to_pandas()
+                if "transaction_date" in chunk.columns:
+                    chunk["transaction_date"] = chunk["transaction_date"].astype("datetime64[ns, UTC]")
+                yield chunk
+
+        return int(count["n"].iat[0]), chunks()
+
+    def year_points(self, year, columns, cube=None, project_mask=None):
+        """Colunas pedidas para os créditos de um ano, na ordem da tabela de créditos."""
+        select = ", ".join(f"{self._column(column)} AS \"{column}\"" for column in columns)
+        where, parameters = self._where(years=[int(year)], project_mask=project_mask)
+        points = self._query(f"""
+            SELECT {select} FROM credits c JOIN projects p USING (project_key)
+            {where} ORDER BY c.filename, c.file_row_number
+        """, parameters, project_mask)
+        return points
+
+
+def _sql_path(path):
+    return path.replace("'", "''")
+
+
+def open_engine(backend=None, projects_path=data_loader.PROJECTS_CSV, credits_path=data_loader.CREDITS_CSV):
+    """
+    Abre o motor de consultas. `backend` (ou PAINEL_MOTOR) escolhe entre
+    "pandas" (padrão, DEFAULT_BACKEND), "duckdb" e "auto"; com "auto", o
+    DuckDB é usado se estiver instalado, e o pandas caso contrário. Lança
+    FileNotFoundError se faltar algum CSV.
+    """
+    paths = {"projects_path": projects_path, "credits_path": credits_path}
+    backend = backend or os.environ.get(ENV_VAR, DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"{ENV_VAR} deve ser um de {BACKENDS}, não {backend!r}")
+    if backend == "duckdb" or (backend == "auto" and importlib.util.find_spec("duckdb") is not None):
+        return DuckDBEngine(data_loader.load_parquet_tables(**paths), **paths)
+    return PandasEngine(dataset.load_dataset(**paths), **paths)
@@ -0,0 +1,390 @@
+"""
+Recursos compartilhados do painel, calculados uma vez por processo.
+
+O `st.cache_resource` só grava valores calculados na thread de um script do
+Streamlit; aqui os recursos ficam num memo do processo, protegido por uma
+trava por chave, para que possam ser calculados de qualquer thread (o
+pré-aquecimento do warmup.py) e reaproveitados pelas sessões. As funções de
+carga do app.py chamam estas e só acrescentam a interface (spinner e
+mensagens de erro).
+
+Linhas acrescentadas aos CSVs entram por `refresh`, que atualiza os recursos
+já calculados com só as linhas novas e incrementa a versão das tabelas e
+anos afetados: as figuras em cache que dependem de outras partes dos dados
+continuam válidas.
+
+Os recursos filtrados pela seleção dos filtros globais (filters.py) ficam
+num LRU limitado por função, com a versão dos dados na chave.
+"""
+import collections
+import functools
+import threading
+import time
+
+import aggregates
+import data_loader
+import dataset
+import figure_cache
+import query_engine
+
+# Colunas dos créditos no gráfico de dispersão (eixos, cor e hover)
+SCATTER_COLUMNS = ["name", "project_type", "co2_reduced", "price"]
+
+# Colunas dos créditos exportados (as que existirem nos dados), na ordem do arquivo
+EXPORT_COLUMNS = [
+    "project_id", "name", "project_type", "country", "registry", "implementation_year", "co2_reduced",
+    "transaction_date", "transaction_type", "vintage", "volume", "price",
+]
+
+_values = {}
+_locks = {}
+_registry_lock = threading.Lock()
+# Intervalo mínimo entre duas verificações dos CSVs
+REFRESH_INTERVAL = 10.0
+
+# Muda sempre que os dados são recarregados por completo
+_data_version = 0
+# Versões por parte dos dados ("projects", "credits", ("year", ano)), que
+# mudam a cada acréscimo; entram nas chaves das figuras que dependem delas
+_versions = collections.Counter()
+_refresh_lock = threading.Lock()
+_last_refresh = 0.0
+
+# Seleções guardadas por recurso filtrado
+SELECTION_CACHE_SIZE = 32
+
+
+def memoized(function):
+    """Memoiza `function` por (nome, argumentos), com uma trava por chave."""
+    @functools.wraps(function)
+    def wrapper(*args):
+        key = (function.__name__, *args)
+        try:
+            return _values[key]
+        except KeyError:
+            pass
+        with _registry_lock:
+            lock = _locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in _values:
+                _values[key] = function(*args)
+            return _values[key]
+
+    wrapper.is_ready = lambda *args: (function.__name__, *args) in _values
+    return wrapper
+
+
+def by_selection(function):
+    """
+    Memoiza um recurso filtrado por uma seleção de facetas num LRU de
+    SELECTION_CACHE_SIZE entradas. A chave inclui a versão dos projetos e dos
+    créditos: depois de um acréscimo, as seleções antigas saem por desuso.
+    """
+    @functools.lru_cache(maxsize=SELECTION_CACHE_SIZE)
+    def cached(version, *args):
+        return function(*args)
+
+    @functools.wraps(function)
+    def wrapper(*args):
+        return cached(data_version("projects", "credits"), *args)
+
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+
+def clear():
+    """Descarta todos os recursos (ex.: depois de trocar os arquivos de dados)."""
+    global _data_version
+    with _registry_lock:
+        _values.clear()
+        _locks.clear()
+        _data_version += 1
+
+
+def data_version(*parts):
+    """Versão dos dados: a da última recarga completa e a de cada parte pedida."""
+    return (_data_version, *(_versions[part] for part in parts))
+
+
+def figure(section, chart, filters, build, depends=("projects", "credits"), selection=()):
+    """
+    Figura serializada (figure_cache.CachedFigure) de um gráfico, com chave
+    (seção, gráfico, versão das partes dos dados em `depends`, *filtros).
+    Com uma `selection` dos filtros globais, ela entra na chave junto com a
+    versão dos projetos. `build` só roda numa falta.
+    """
+    if selection:
+        depends, filters = (*depends, "projects"), (*filters, selection)
+    return figure_cache.FIGURES.get_or_build((section, chart, data_version(*depends), *filters), build)
+
+
+def _forget(function, *args):
+    """Descarta um valor memoizado (é recalculado no próximo pedido)."""
+    with _registry_lock:
+        _values.pop((function.__name__, *args), None)
+
+
+def refresh(force=False):
+    """
+    Verifica se os CSVs receberam linhas novas (no máximo uma vez a cada
+    REFRESH_INTERVAL segundos, a menos que `force`) e as incorpora.
+
+    Retorna None se nada mudou, "incremental" se as linhas novas foram
+    somadas aos recursos já calculados, ou "completa" se os CSVs mudaram de
+    outra forma e todos os recursos foram descartados. Só age depois que o
+    motor de consultas foi carregado.
+    """
+    global _last_refresh
+    now = time.monotonic()
+    if not engine.is_ready() or (not force and now - _last_refresh < REFRESH_INTERVAL):
+        return None
+    if not _refresh_lock.acquire(blocking=False):
+        # Outra sessão já está atualizando
+        return None
+    try:
+        _last_refresh = now
+        try:
+            delta = engine().refresh()
+        except data_loader.FullReloadRequired:
+            clear()
+            return "completa"
+        if delta is None:
+            return None
+        _apply_delta(delta)
+        return "incremental"
+    finally:
+        _refresh_lock.release()
+
+
+def _apply_delta(delta):
+    """Atualiza os recursos já calculados com as linhas novas de `delta`."""
+    projects = engine().projects()
+    if project_metrics.is_ready():
+        project_metrics().merge(aggregates.ProjectMetrics.from_credits(delta.credits, len(projects)))
+    if len(delta.credits):
+        keys = delta.credits["project_key"].to_numpy()
+        years = {int(year) for year in projects["implementation_year"].iloc[keys].dropna().unique()}
+        if year_cube.is_ready():
+            year_cube().merge(engine().year_type_cube(years=years))
+        if time_series.is_ready() and time_series() is not None:
+            time_series().append(aggregates.credit_rows(dataset.CarbonDataset(projects, delta.credits)))
+        # O modelo de preços é reajustado pelas métricas por projeto (sem
+        # varrer os créditos): a duração de projetos antigos pode mudar
+        _forget(pricing)
+        _forget(monthly_series)
+        for year in years:
+            _forget(year_scatter, year)
+            _versions["year", year] += 1
+        _versions["credits"] += 1
+    _forget(protocol_totals)
+    # Os atributos de crédito dos projetos mudam com créditos novos
+    if segmentation_engine.is_ready():
+        segmentation_engine().update_projects(project_features())
+    if geo_layer_cache.is_ready():
+        import geo_layers
+
+        geo_layer_cache().update_metrics(geo_layers.country_metrics(project_features()))
+    if len(delta.projects):
+        _forget(facet_index)
+        _forget(protocol_index)
+        _forget(project_search)
+        _versions["projects"] += 1
+
+
+def memory_report():
+    """Bytes por coluna das tabelas em memória do motor (data_loader.memory_report)."""
+    return data_loader.memory_report(engine().memory_frames())
+
+
+# --- Recursos --- #
+
+@memoized
+def engine():
+    """
+    Motor de consultas (query_engine): DuckDB sobre Parquet ou o modelo estrela
+    em memória. Lança FileNotFoundError se faltar algum CSV.
+    """
+    return query_engine.open_engine()
+
+
+@memoized
+def year_cube():
+    return engine().year_type_cube()
+
+
+@memoized
+def time_series():
+    return engine().time_series()
+
+
+@memoized
+def monthly_series():
+    """Série mensal do período completo (o intervalo padrão do painel)."""
+    store = time_series()
+    return store.series("M") if store is not None else None
+
+
+@memoized
+def project_metrics():
+    """Métricas de atividade de crédito por projeto (aggregates.ProjectMetrics), agregadas uma vez."""
+    return engine().project_metrics()
+
+
+def project_features():
+    """Dimensão de projetos com as métricas de crédito de cada um (aggregates.project_features)."""
+    return aggregates.project_features(engine().projects(), project_metrics().table())
+
+
+@memoized
+def pricing():
+    import pricing_model
+
+    return pricing_model.fit_from_metrics(engine().projects(), project_metrics())
+
+
+@memoized
+def segmentation_engine():
+    import segmentation
+
+    return segmentation.SegmentationEngine(project_features())
+
+
+@memoized
+def geo_layer_cache():
+    """Camadas do mapa. Lança FileNotFoundError se faltar o GeoJSON."""
+    import geo_layers
+
+    return geo_layers.GeoLayerCache(geo_layers.load_geojson(), geo_layers.country_metrics(project_features()))
+
+
+def year_histogram(year, selection=()):
+    """
+    Histograma de contagem por tipo de um ano, a partir do cubo (no cache de
+    figuras); com `selection`, do cubo da seleção.
+    """
+    def build():
+        import plotly.express as px
+
+        cube = selected_year_cube(selection) if selection else year_cube()
+        cells = cube.year_cells(year).reset_index()
+        return px.bar(cells, x="project_type", y="credit_count", labels={"credit_count": "count"},
+                      title="Contagem de Projetos por Tipo")
+
+    return figure("Exploração dos Dados", "histograma", (year,), build, depends=(("year", year),), selection=selection)
+
+
+def credit_export(selection=(), **filters):
+    """
+    Créditos da seleção dos filtros globais (e dos `filters` de
+    credit_summary) para exportação: (número de linhas, iterador de blocos),
+    com blocos de até export.BUFFER_BYTES, estimados por uma amostra.
+    """
+    import export
+
+    columns = [column for column in EXPORT_COLUMNS
+               if column in engine().credit_columns or column in engine().projects().columns]
+    chunksize = export.chunk_rows(engine().credit_sample(columns))
+    return engine().credit_chunks(columns, chunksize, project_mask=project_mask(selection), **filters)
+
+
+def _scatter(points):
+    import scatter_lod
+
+    return scatter_lod.ScatterLOD(points["co2_reduced"], points["price"], points["project_type"]), points
+
+
+@memoized
+def year_scatter(year):
+    """
+    Índice de LOD dos créditos de um ano e as colunas desses créditos usadas
+    no gráfico (com índice 0..n-1, o mesmo das posições do índice).
+    """
+    return _scatter(engine().year_points(year, SCATTER_COLUMNS, cube=year_cube()))
+
+
+@memoized
+def protocol_index():
+    """Índice invertido das metodologias (protocols.ProtocolIndex), montado uma vez."""
+    import protocols
+
+    projects = engine().projects()
+    return protocols.ProtocolIndex(data_loader.explode_protocols(projects), len(projects))
+
+
+def _protocol_totals(project_mask):
+    import protocols
+
+    volumes = None
+    if "transaction_type" in engine().credit_columns:
+        volumes = engine().credit_summary(["project_key", "transaction_type"], project_mask=project_mask)
+    return protocols.methodology_totals(protocol_index(), engine().projects(), volumes, project_mask)
+
+
+@memoized
+def protocol_totals():
+    """Totais de emissão e aposentadoria por metodologia."""
+    return _protocol_totals(None)
+
+
+@memoized
+def project_search():
+    """Índice de busca por nome, proponente e ID dos projetos (search.ProjectSearch)."""
+    import search
+
+    return search.ProjectSearch(engine().projects())
+
+
+# --- Recursos filtrados pelos filtros globais --- #
+
+@memoized
+def facet_index():
+    """Bitmaps das facetas sobre os projetos (filters.FacetIndex)."""
+    import filters
+
+    return filters.FacetIndex(engine().projects())
+
+
+def project_mask(selection):
+    """Máscara da seleção sobre project_key (None se a seleção estiver vazia)."""
+    return facet_index().mask(selection)
+
+
+@by_selection
+def selected_year_cube(selection):
+    return engine().year_type_cube(project_mask=project_mask(selection))
+
+
+@by_selection
+def selected_time_series(selection):
+    return engine().time_series(project_mask=project_mask(selection))
+
+
+@by_selection
+def selected_year_scatter(year, selection):
+    """Como year_scatter, só com os créditos dos projetos da seleção."""
+    return _scatter(engine().year_points(year, SCATTER_COLUMNS, cube=year_cube(), project_mask=project_mask(selection)))
+
+
+@by_selection
+def selected_protocol_totals(selection):
+    return _protocol_totals(project_mask(selection))
+
+
+@by_selection
+def overview(selection):
+    """Números da visão geral (ProjectMetrics.overview) dos projetos da seleção."""
+    return project_metrics().overview(engine().projects(), project_mask(selection))
+
+
+@by_selection
+def selected_country_metrics(selection):
+    """Métricas do mapa por país, só com os projetos da seleção."""
+    import geo_layers
+
+    return geo_layers.country_metrics(project_features()[project_mask(selection)])
+
+
+@by_selection
+def selected_map_html(selection, metric, detail):
+    """HTML do mapa com as métricas da seleção (ver GeoLayerCache.filtered_map_html)."""
+    return geo_layer_cache().filtered_map_html(selected_country_metrics(selection), metric, detail)
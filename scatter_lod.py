@@ -0,0 +1,137 @@
+"""
+Nível de detalhe (LOD) para gráficos de dispersão com muitos pontos.
+
+Em vez de enviar todos os pontos ao navegador (ou uma amostra uniforme, que
+esconde os extremos), cada visão combina:
+- um mapa de densidade 2D calculado no servidor sobre *todos* os pontos da
+  área visível, com tamanho fixo (bins × bins);
+- uma amostra estratificada por grupo (tipo de projeto, cluster...) que
+  sempre inclui os pontos extremos de cada grupo.
+Quando o usuário aproxima o zoom e restam poucos pontos na área visível, a
+visão passa a mostrar todos eles. O payload fica limitado em qualquer caso.
+"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+MAX_POINTS = 2000
+DENSITY_BINS = 80
+# Pontos extremos mantidos por grupo em cada eixo (os menores e os maiores)
+EXTREME_POINTS = 2
+
+
+class LODView:
+    """Resultado de uma visão: posições dos pontos a desenhar e a densidade."""
+
+    def __init__(self, positions, total, density, x_edges, y_edges):
+        self.positions = positions
+        self.total = total
+        self.density = density
+        self.x_edges = x_edges
+        self.y_edges = y_edges
+
+    @property
+    def sampled(self):
+        return len(self.positions) < self.total
+
+
+class ScatterLOD:
+    """
+    Índice de LOD sobre arrays x, y e um rótulo de grupo por ponto.
+    As posições retornadas se referem à ordem dos arrays de entrada.
+    """
+
+    def __init__(self, x, y, groups, max_points=MAX_POINTS, bins=DENSITY_BINS,
+                 extreme_points=EXTREME_POINTS, seed=42):
+        self.x = np.asarray(x, dtype="float64")
+        self.y = np.asarray(y, dtype="float64")
+        self.group_codes, self.group_names = pd.factorize(np.asarray(groups), sort=True)
+        self.max_points = max_points
+        self.bins = bins
+        self.extreme_points = extreme_points
+        self.seed = seed
+
+    def bounds(self):
+        """(x_min, x_max, y_min, y_max) dos pontos finitos."""
+        finite = np.isfinite(self.x) & np.isfinite(self.y)
+        if not finite.any():
+            return 0.0, 1.0, 0.0, 1.0
+        return (float(self.x[finite].min()), float(self.x[finite].max()),
+                float(self.y[finite].min()), float(self.y[finite].max()))
+
+    def view(self, x_range=None, y_range=None):
+        """Densidade e amostra dos pontos dentro da área (x_range, y_range)."""
+        x_min, x_max, y_min, y_max = self.bounds()
+        x_range = x_range or (x_min, x_max)
+        y_range = y_range or (y_min, y_max)
+
+        visible = np.flatnonzero(
+            (self.x >= x_range[0]) & (self.x <= x_range[1]) &
+            (self.y >= y_range[0]) & (self.y <= y_range[1])
+        )
+        density, x_edges, y_edges = np.histogram2d(
+            self.x[visible], self.y[visible], bins=self.bins,
+            range=[_non_degenerate(x_range), _non_degenerate(y_range)]
+        )
+        if len(visible) <= self.max_points:
+            positions = visible
+        else:
+            positions = self._stratified_sample(visible)
+        return LODView(positions, len(visible), density, x_edges, y_edges)
+
+    def _stratified_sample(self, candidates):
+        """
+        Amostra `max_points` posições de `candidates`, com cota proporcional
+        ao tamanho de cada grupo (mínimo de uma) e sempre incluindo os
+        extremos de x e y de cada grupo.
+        """
+        rng = np.random.default_rng(self.seed)
+        codes = self.group_codes[candidates]
+        order = np.argsort(codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+
+        selected = []
+        for members in np.split(candidates[order], boundaries):
+            quota = max(1, int(round(self.max_points * len(members) / len(candidates))))
+            keep = set()
+            for values in (self.x[members], self.y[members]):
+                ranked = np.argsort(values, kind="stable")
+                keep.update(members[ranked[:self.extreme_points]])
+                keep.update(members[ranked[-self.extreme_points:]])
+            rest = np.setdiff1d(members, np.fromiter(keep, dtype=members.dtype), assume_unique=True)
+            fill = max(0, quota - len(keep))
+            if fill and len(rest):
+                keep.update(rng.choice(rest, size=min(fill, len(rest)), replace=False))
+            selected.append(np.fromiter(keep, dtype=members.dtype))
+        return np.sort(np.concatenate(selected))
+
+
+def _non_degenerate(value_range):
+    low, high = value_range
+    return (low, high) if high > low else (low - 0.5, high + 0.5)
+
+
+def lod_figure(view, points_df, x, y, color, hover_data, title, labels=None, category_orders=None,
+               show_density=True):
+    """
+    Figura com a densidade (heatmap) ao fundo e os pontos amostrados por cima.
+    `points_df` traz as colunas dos pontos em `view.positions`, na mesma ordem.
+    """
+    scatter = px.scatter(points_df, x=x, y=y, color=color, hover_data=hover_data, labels=labels,
+                         category_orders=category_orders, title=title)
+    if not show_density:
+        return scatter
+
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(
+        z=np.log1p(view.density.T),
+        x=(view.x_edges[:-1] + view.x_edges[1:]) / 2,
+        y=(view.y_edges[:-1] + view.y_edges[1:]) / 2,
+        customdata=view.density.T,
+        hovertemplate="Pontos na célula: %{customdata:,.0f}<extra></extra>",
+        colorscale="Greys", showscale=False, opacity=0.5, name="Densidade",
+    ))
+    fig.add_traces(scatter.data)
+    fig.update_layout(scatter.layout)
+    return fig
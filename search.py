@@ -0,0 +1,111 @@
+"""
+Busca de projetos por nome, proponente e identificador do registro.
+
+O `ProjectSearch` monta, uma vez, um índice invertido de tokens: os textos
+são normalizados (minúsculas, sem acentos) e quebrados em palavras; palavras
+que misturam letras e números (ex.: "vcs5565") entram também em partes
+("vcs", "5565"). O vocabulário fica ordenado e as ocorrências, agrupadas por
+token na mesma ordem: os tokens que começam com um prefixo formam um
+intervalo contíguo do vocabulário e, portanto, das ocorrências. Uma consulta
+é, por termo, uma busca binária e uma fatia de arrays, sem percorrer os
+textos dos projetos.
+"""
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Campos indexados e o peso de cada um no ranking
+FIELDS = {"project_id": 3.0, "name": 2.0, "proponent": 1.0}
+
+# Multiplicador do peso quando o termo é um token inteiro (e não só prefixo)
+EXACT_BONUS = 2.0
+
+MAX_RESULTS = 50
+
+_WORD = re.compile(r"[a-z0-9]+")
+_ALNUM_PARTS = re.compile(r"[a-z]+|[0-9]+")
+
+
+def normalize(text):
+    """Texto em minúsculas, sem acentos."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    return text.lower()
+
+
+def tokenize(text):
+    """Palavras do texto normalizado e as partes de letras/números de cada uma."""
+    tokens = []
+    for word in _WORD.findall(normalize(text)):
+        tokens.append(word)
+        parts = _ALNUM_PARTS.findall(word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class ProjectSearch:
+    """Índice invertido de prefixos sobre os projetos (na ordem de project_key)."""
+
+    def __init__(self, projects, fields=FIELDS):
+        self.size = len(projects)
+        tokens, keys, weights = [], [], []
+        for field, weight in fields.items():
+            # Cada texto distinto (ex.: proponentes repetidos) é quebrado uma vez
+            codes, texts = pd.factorize(projects[field])
+            text_tokens = [list(dict.fromkeys(tokenize(text))) for text in texts]
+            for key, code in enumerate(codes):
+                if code < 0:
+                    continue
+                tokens.extend(text_tokens[code])
+                keys.extend([key] * len(text_tokens[code]))
+            weights.extend([weight] * (len(keys) - len(weights)))
+        token_ids, vocabulary = pd.factorize(pd.Series(tokens, dtype=object), sort=True)
+        self.vocabulary = vocabulary.to_numpy()
+        order = np.argsort(token_ids, kind="stable")
+        self.offsets = np.searchsorted(token_ids[order], np.arange(len(self.vocabulary) + 1))
+        self.keys = np.asarray(keys, dtype="int32")[order]
+        self.weights = np.asarray(weights, dtype="float64")[order]
+
+    def _term_scores(self, term):
+        """Pontuação de cada projeto para um termo (0 = sem ocorrência)."""
+        # Tokens que começam com o termo: intervalo [lo, hi) do vocabulário
+        # ordenado (os tokens só têm [a-z0-9], todos antes de "\x7f")
+        lo = np.searchsorted(self.vocabulary, term, side="left")
+        hi = np.searchsorted(self.vocabulary, term + "\x7f", side="left")
+        start, end = self.offsets[lo], self.offsets[hi]
+        weights = self.weights[start:end].copy()
+        exact_end = self.offsets[lo + 1] if lo < hi and self.vocabulary[lo] == term else start
+        weights[:exact_end - start] *= EXACT_BONUS
+        scores = np.zeros(self.size)
+        np.maximum.at(scores, self.keys[start:end], weights)
+        return scores
+
+    def scores(self, query):
+        """
+        Pontuação de cada projeto para a consulta: todos os termos precisam
+        aparecer (como token ou prefixo de token) em algum campo; a
+        pontuação soma, por termo, o maior peso entre os campos.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return np.zeros(self.size)
+        total = np.zeros(self.size)
+        found = np.ones(self.size, dtype=bool)
+        for term in terms:
+            term_scores = self._term_scores(term)
+            found &= term_scores > 0
+            total += term_scores
+        return np.where(found, total, 0.0)
+
+    def search(self, query, limit=MAX_RESULTS):
+        """
+        Projetos encontrados, do mais para o menos relevante: arrays
+        (project_key, pontuação) com no máximo `limit` itens.
+        """
+        scores = self.scores(query)
+        hits = np.flatnonzero(scores)
+        # Pontuação decrescente; empates na ordem de project_key
+        hits = hits[np.lexsort((hits, -scores[hits]))][:limit]
+        return hits, scores[hits]
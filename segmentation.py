@@ -0,0 +1,155 @@
+"""
+Segmentação de projetos com modelos em cache e atualização incremental.
+
+Cada combinação (atributos, escala, k) gera um `SegmentationModel` que é
+ajustado uma única vez por processo. Os modelos usam `MiniBatchKMeans`, então
+o ajuste inicial escala para listas de projetos muito maiores, e novos
+projetos atualizam o modelo com `partial_fit` sem reajuste completo.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+
+# Atributos numéricos disponíveis para a segmentação: os da dimensão de
+# projetos e os da atividade de crédito (aggregates.project_features)
+SEGMENTATION_FEATURES = {
+    "co2_reduced": "CO₂ Reduzido",
+    "project_duration": "Duração do Projeto",
+    "issued": "Créditos Emitidos",
+    "retired": "Créditos Aposentados",
+    "transaction_count": "Transações",
+    "volume": "Volume Transacionado",
+    "price_mean": "Preço Médio",
+    "retirement_ratio": "Taxa de Aposentadoria",
+}
+DEFAULT_FEATURES = ("co2_reduced", "project_duration")
+
+SCALINGS = {
+    "standard": "Padronização (z-score)",
+    "log": "Log + padronização",
+    "none": "Sem escala",
+}
+DEFAULT_SCALING = "standard"
+DEFAULT_K = 2
+
+BATCH_SIZE = 4096
+
+
+class SegmentationModel:
+    """
+    Um MiniBatchKMeans ajustado sobre um conjunto de atributos.
+
+    A transformação de escala é definida no ajuste inicial e fica congelada,
+    de modo que pontos novos (em `partial_fit` ou `predict`) caem no mesmo
+    espaço dos centróides existentes. Os rótulos são renumerados pela ordem
+    do centróide no primeiro atributo: o "Cluster 0" é sempre o de menor valor.
+    """
+
+    def __init__(self, features, scaling, k, random_state=42):
+        self.features = tuple(features)
+        self.scaling = scaling
+        self.k = k
+        self.scaler = StandardScaler() if scaling != "none" else None
+        self.kmeans = MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init=3, batch_size=BATCH_SIZE)
+        self._rank = None
+
+    def _matrix(self, frame):
+        X = frame[list(self.features)].fillna(0).to_numpy(dtype="float64")
+        if self.scaling == "log":
+            X = np.log1p(np.clip(X, 0, None))
+        return X
+
+    def _transform(self, frame):
+        X = self._matrix(frame)
+        return self.scaler.transform(X) if self.scaler is not None else X
+
+    def _update_rank(self):
+        centers = self.centers()
+        self._rank = np.argsort(np.argsort(centers[:, 0], kind="stable"), kind="stable")
+
+    def fit(self, frame):
+        """Ajuste inicial (em mini-lotes) sobre todos os projetos de `frame`."""
+        X = self._matrix(frame)
+        if self.scaler is not None:
+            X = self.scaler.fit_transform(X)
+        self.kmeans.fit(X)
+        self._update_rank()
+        return self
+
+    def partial_fit(self, frame):
+        """Atualiza os centróides com novos projetos, sem reajuste completo."""
+        self.kmeans.partial_fit(self._transform(frame))
+        self._update_rank()
+        return self
+
+    def predict(self, frame):
+        """Atribui clusters (0 a k-1, ordenados) a qualquer número de pontos de uma vez."""
+        return self._rank[self.kmeans.predict(self._transform(frame))]
+
+    def centers(self):
+        """Centróides na escala original dos atributos, na ordem interna do KMeans."""
+        centers = self.kmeans.cluster_centers_
+        if self.scaler is not None:
+            centers = self.scaler.inverse_transform(centers)
+        if self.scaling == "log":
+            centers = np.expm1(centers)
+        return centers
+
+    def profiles(self, frame, labels):
+        """Tamanho e média dos atributos de cada cluster."""
+        profile = frame[list(self.features)].fillna(0).groupby(labels).mean()
+        profile.insert(0, "projects", pd.Series(labels).value_counts().sort_index().to_numpy())
+        profile.index.name = "cluster"
+        return profile
+
+
+class SegmentationEngine:
+    """
+    Cache de modelos de segmentação sobre a dimensão de projetos, com as
+    métricas de crédito de cada projeto (aggregates.project_features).
+
+    `segment()` ajusta o modelo só na primeira vez que uma chave
+    (atributos, escala, k) é pedida e guarda também os rótulos dos projetos
+    usados no ajuste; as chamadas seguintes são consultas ao cache.
+    """
+
+    def __init__(self, projects):
+        self.projects = projects
+        self._models = {}
+        self._labels = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(features, scaling, k):
+        return tuple(features), scaling, int(k)
+
+    def model(self, features=DEFAULT_FEATURES, scaling=DEFAULT_SCALING, k=DEFAULT_K):
+        return self.segment(features, scaling, k)[0]
+
+    def segment(self, features=DEFAULT_FEATURES, scaling=DEFAULT_SCALING, k=DEFAULT_K):
+        """Retorna (modelo, rótulos dos projetos) para a chave pedida."""
+        key = self.key(features, scaling, k)
+        with self._lock:
+            if key not in self._models:
+                model = SegmentationModel(key[0], scaling, key[2]).fit(self.projects)
+                self._models[key] = model
+                self._labels[key] = model.predict(self.projects)
+            return self._models[key], self._labels[key]
+
+    def update_projects(self, projects):
+        """
+        Troca a tabela de projetos por uma atualizada (atributos de créditos
+        novos e projetos novos no fim): cada modelo em cache é atualizado com
+        `partial_fit` só com os projetos novos, e todos os projetos são
+        rotulados de novo, em lote.
+        """
+        with self._lock:
+            new_projects = projects.iloc[len(self.projects):]
+            self.projects = projects
+            for key, model in self._models.items():
+                if len(new_projects):
+                    model.partial_fit(new_projects)
+                self._labels[key] = model.predict(self.projects)
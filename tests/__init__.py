@@ -0,0 +1,7 @@
+"""
+Testes automatizados do painel, sem interface.
+
+Uso (a partir da raiz do repositório):
+
+    python -m pytest tests
+"""
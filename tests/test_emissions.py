@@ -0,0 +1,63 @@
+"""Cálculo em lote da calculadora de emissões, da leitura em blocos à exportação."""
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import emissions
+import export
+
+FACTORS = emissions.load_factors()
+ACTIVITY = FACTORS["activity"][0]
+
+# Colunas repassadas cujo tipo inferido muda entre blocos de 3 linhas: um
+# código numérico no primeiro bloco e com letras depois, uma coluna vazia no
+# primeiro bloco e com texto depois
+CONSUMPTION_CSV = "atividade,quantidade,code,notes\n" + "".join(
+    f"{ACTIVITY},{row},{row if row < 3 else 'x'},{'' if row < 3 else 'obs'}\n" for row in range(7)
+)
+
+
+def consumption_file(file_name):
+    if file_name.endswith(".parquet"):
+        file = io.BytesIO()
+        table = pd.read_csv(io.StringIO(CONSUMPTION_CSV), dtype={"code": "string"})
+        pq.write_table(pa.Table.from_pandas(table), file, row_group_size=3)
+        file.seek(0)
+        return file
+    return io.BytesIO(CONSUMPTION_CSV.encode())
+
+
+@pytest.mark.parametrize("file_name", ["consumo.csv", "consumo.parquet"])
+@pytest.mark.parametrize("file_format", list(export.FORMATS))
+def test_column_type_changing_between_chunks(file_name, file_format):
+    summary = emissions.BatchSummary()
+    chunks = emissions.read_chunks(consumption_file(file_name), file_name, chunksize=3)
+    file, rows = export.spool(emissions.iter_results(chunks, FACTORS, summary), file_format)
+    with file:
+        if file_format == "CSV":
+            result = pd.read_csv(file, dtype={"code": "string", "notes": "string"})
+        else:
+            result = pd.read_parquet(file)
+    assert rows == summary.rows == 7
+    assert result["code"].tolist() == ["0", "1", "2", "x", "x", "x", "x"]
+    assert result["notes"].isna().sum() == 3
+    assert result["quantity"].tolist() == list(map(float, range(7)))
+    assert summary.co2e_kg == pytest.approx(21 * FACTORS["factor"][0])
+
+
+def test_invalid_quantity():
+    csv = f"activity,quantity\n{ACTIVITY},1\n{ACTIVITY},\"1,000\"\n{ACTIVITY},\n"
+    summary = emissions.BatchSummary()
+    results = pd.concat(emissions.iter_results(
+        emissions.read_chunks(io.BytesIO(csv.encode()), "consumo.csv"), FACTORS, summary
+    ))
+    assert results["quantity"].isna().tolist() == [False, True, True]
+    assert summary.invalid_quantity_rows == 2
+
+
+def test_missing_column():
+    with pytest.raises(ValueError, match="quantity"):
+        next(emissions.read_chunks(io.BytesIO(b"activity,amount\nx,1\n"), "consumo.csv"))
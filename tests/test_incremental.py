@@ -0,0 +1,130 @@
+"""
+Atualização incremental (linhas acrescentadas aos CSVs) contra a carga
+completa dos mesmos arquivos, nos dois motores de consultas.
+"""
+import importlib.util
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import aggregates
+import data_loader
+import geo_layers
+import pricing_model
+import query_engine
+import resources
+from benchmarks import generate_data
+
+# Projetos e créditos da carga inicial; o restante é acrescentado depois
+INITIAL_PROJECTS = 600
+INITIAL_CREDITS = 12_000
+
+BACKENDS = [
+    "pandas",
+    pytest.param("duckdb", marks=pytest.mark.skipif(importlib.util.find_spec("duckdb") is None,
+                                                   reason="duckdb não instalado")),
+]
+
+
+@pytest.fixture(scope="module")
+def source_dir(tmp_path_factory):
+    """Dados sintéticos completos (benchmarks.generate_data)."""
+    out_dir = tmp_path_factory.mktemp("completo")
+    generate_data.generate(20_000, str(out_dir), n_projects=1_000)
+    return out_dir
+
+
+@pytest.fixture
+def workspace(source_dir, tmp_path, monkeypatch):
+    """
+    Diretório de trabalho com só o começo dos CSVs de `source_dir` (os
+    créditos dos primeiros projetos) e os recursos do painel vazios.
+    """
+    projects = pd.read_csv(source_dir / data_loader.PROJECTS_CSV)
+    credits = pd.read_csv(source_dir / data_loader.CREDITS_CSV)
+    initial_credits = credits[credits["project_id"].isin(projects["project_id"].iloc[:INITIAL_PROJECTS])]
+    initial_credits = initial_credits.iloc[:INITIAL_CREDITS]
+    projects.iloc[:INITIAL_PROJECTS].to_csv(tmp_path / data_loader.PROJECTS_CSV, index=False)
+    initial_credits.to_csv(tmp_path / data_loader.CREDITS_CSV, index=False)
+    shutil.copyfile(source_dir / geo_layers.GEOJSON_PATH, tmp_path / geo_layers.GEOJSON_PATH)
+
+    monkeypatch.chdir(tmp_path)
+    resources.clear()
+    yield {
+        "dir": tmp_path,
+        "new_projects": projects.iloc[INITIAL_PROJECTS:],
+        "new_credits": credits.drop(initial_credits.index),
+    }
+    resources.clear()
+
+
+def append_rows(workspace):
+    """Acrescenta aos CSVs os projetos e créditos que ficaram de fora."""
+    for name, rows in ((data_loader.PROJECTS_CSV, workspace["new_projects"]),
+                       (data_loader.CREDITS_CSV, workspace["new_credits"])):
+        rows.to_csv(workspace["dir"] / name, index=False, header=False, mode="a")
+
+
+def full_reload(workspace, tmp_path_factory, backend):
+    """Motor aberto do zero, em outro diretório, sobre os CSVs já acrescentados."""
+    reference_dir = tmp_path_factory.mktemp("referencia")
+    for name in (data_loader.PROJECTS_CSV, data_loader.CREDITS_CSV):
+        shutil.copyfile(workspace["dir"] / name, reference_dir / name)
+    return query_engine.open_engine(backend, projects_path=str(reference_dir / data_loader.PROJECTS_CSV),
+                                    credits_path=str(reference_dir / data_loader.CREDITS_CSV))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_incremental_refresh_matches_full_reload(workspace, tmp_path_factory, monkeypatch, backend):
+    monkeypatch.setenv(query_engine.ENV_VAR, backend)
+    # Recursos calculados antes do acréscimo, atualizados pelo refresh
+    engine = resources.engine()
+    cube = resources.year_cube()
+    series = resources.time_series()
+    resources.pricing()
+    segmentation = resources.segmentation_engine()
+    geo_cache = resources.geo_layer_cache()
+
+    append_rows(workspace)
+    assert resources.refresh(force=True) == "incremental"
+    assert resources.refresh(force=True) is None
+
+    reference = full_reload(workspace, tmp_path_factory, backend)
+    assert len(engine.projects()) == len(reference.projects())
+
+    reference_cube = reference.year_type_cube()
+    assert cube.cells.index.equals(reference_cube.cells.index)
+    assert np.allclose(cube.cells.to_numpy(dtype="float64"), reference_cube.cells.to_numpy(dtype="float64"),
+                       equal_nan=True)
+
+    reference_series = reference.time_series()
+    for rollup in ("daily", "monthly"):
+        refreshed = getattr(series, rollup).sort_values(
+            ["transaction_date", "project_type", "country", "registry"]
+        ).reset_index(drop=True)
+        expected = getattr(reference_series, rollup)
+        assert refreshed[["volume", "trades"]].to_numpy().tolist() == expected[["volume", "trades"]].to_numpy().tolist()
+        assert np.allclose(refreshed["value"], expected["value"])
+
+    reference_metrics = reference.project_metrics()
+    pd.testing.assert_frame_equal(resources.project_metrics().table(), reference_metrics.table())
+    assert resources.overview(()) == reference_metrics.overview(reference.projects())
+
+    reference_features = aggregates.project_features(reference.projects(), reference_metrics.table())
+    pd.testing.assert_frame_equal(segmentation.projects, reference_features)
+    pd.testing.assert_frame_equal(geo_cache.metrics, geo_layers.country_metrics(reference_features))
+
+    coefficients = resources.pricing().fit()["coefficients"].sort_index()
+    reference_coefficients = pricing_model.fit_from_engine(reference).fit()["coefficients"].sort_index()
+    assert np.allclose(coefficients, reference_coefficients, equal_nan=True)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_rewritten_csv_requires_full_reload(workspace, monkeypatch, backend):
+    monkeypatch.setenv(query_engine.ENV_VAR, backend)
+    resources.engine()
+    credits_path = workspace["dir"] / data_loader.CREDITS_CSV
+    pd.read_csv(credits_path).iloc[:-5].to_csv(credits_path, index=False)
+    assert resources.refresh(force=True) == "completa"
@@ -0,0 +1,31 @@
+"""Predição de cenários enviados pelo usuário no modelo de precificação."""
+import numpy as np
+import pandas as pd
+
+import pricing_model
+
+
+def fitted_model():
+    projects = pd.DataFrame({
+        "co2_reduced": [100.0, 200.0, 300.0, 400.0],
+        "project_duration": [5, 10, 15, 20],
+        "project_type": ["Eólica", "Eólica", "Solar", "Solar"],
+    })
+    model = pricing_model.PricingModel(projects["project_type"].unique())
+    prices = np.array([10.0, 12.0, 20.0, 23.0])
+    return model.update(projects, np.full(4, 2), prices * 2, prices ** 2 * 2)
+
+
+def test_predict_scenarios_flags_invalid_rows():
+    model = fitted_model()
+    scenarios = pd.DataFrame({
+        "co2_reduced": ["150", "1,000", "250", "250", "250"],
+        "project_duration": [8, 8, None, 8, 8],
+        "project_type": ["Solar", "Solar", "Solar", "Typo", None],
+    })
+    result, invalid_number_rows, unknown_type_rows = model.predict_scenarios(scenarios)
+    assert invalid_number_rows == 2
+    assert unknown_type_rows == 2
+    assert result["predicted_price"].notna().tolist() == [True, False, False, False, False]
+    assert result["predicted_price"][0] == model.predict(result.iloc[[0]])[0]
+    assert result["co2_reduced"].dtype == "float64"
@@ -0,0 +1,161 @@
+"""
+Pré-aquecimento dos recursos compartilhados (resources.py) em segundo plano.
+
+Na primeira execução do app, um `CacheWarmer` enumera as chaves que as
+seções vão pedir (todos os anos do cubo, as métricas do mapa, a série
+mensal do período padrão, o modelo de segmentação padrão, o modelo de
+preços) e as calcula num pool de threads, em etapas: cada etapa só começa
+quando a anterior termina, porque depende dos dados que ela carrega. O
+progresso e o tempo de cada tarefa ficam disponíveis para o painel.
+"""
+import importlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import resources
+
+# Módulos pesados importados na primeira etapa
+HEAVY_MODULES = (
+    "plotly.express", "plotly.graph_objects", "plotly.subplots", "streamlit.components.v1",
+    "scatter_lod", "geo_layers", "pricing_model", "segmentation",
+)
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+
+class WarmupTask:
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+        self.state = "pendente"
+        self.seconds = None
+        self.error = None
+
+    def run(self):
+        self.state = "executando"
+        start = time.perf_counter()
+        try:
+            self.function()
+            self.state = "concluída"
+        except Exception as error:
+            # Uma tarefa com erro não derruba as demais
+            self.state = "falhou"
+            self.error = f"{type(error).__name__}: {error}"
+        finally:
+            self.seconds = time.perf_counter() - start
+
+
+class CacheWarmer:
+    """
+    Executa etapas (listas de WarmupTask, ou funções que geram a lista no
+    momento em que a etapa começa) num ThreadPoolExecutor, sem bloquear quem
+    chama `start()`. Uma tarefa com erro não interrompe as demais; as que
+    dependem dela falham também, e o erro fica registrado no relatório.
+    """
+
+    def __init__(self, stages, max_workers=MAX_WORKERS):
+        self.stages = stages
+        self.max_workers = max_workers
+        self.tasks = []
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="warmup") as pool:
+                for stage in self.stages:
+                    try:
+                        tasks = stage() if callable(stage) else stage
+                    except Exception:
+                        # Sem as chaves da etapa, encerra o aquecimento
+                        break
+                    self.tasks.extend(tasks)
+                    wait([pool.submit(task.run) for task in tasks])
+        finally:
+            self.finished_at = time.perf_counter()
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    def progress(self):
+        """(tarefas concluídas ou com erro, tarefas conhecidas até agora)."""
+        finished = sum(task.state in ("concluída", "falhou") for task in self.tasks)
+        return finished, len(self.tasks)
+
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    def report(self):
+        """Uma linha por tarefa: nome, estado, segundos e erro."""
+        return [
+            {"tarefa": task.name, "estado": task.state, "segundos": task.seconds, "erro": task.error}
+            for task in list(self.tasks)
+        ]
+
+
+# --- Plano padrão do painel --- #
+
+def _year_tasks():
+    tasks = []
+    for year in resources.year_cube().years:
+        tasks.append(WarmupTask(f"histograma {year}", lambda year=year: resources.year_histogram(year)))
+        tasks.append(WarmupTask(f"dispersão {year}", lambda year=year: resources.year_scatter(year)))
+    return tasks
+
+
+def _map_tasks():
+    import geo_layers
+
+    return [
+        WarmupTask(f"mapa: {metric}", lambda metric=metric: resources.geo_layer_cache().map_html(metric))
+        for metric in geo_layers.MAP_METRICS
+    ]
+
+
+def default_stages():
+    """Etapas do pré-aquecimento, na ordem de dependência."""
+    return [
+        [WarmupTask(f"import {module}", lambda module=module: importlib.import_module(module))
+         for module in HEAVY_MODULES]
+        + [WarmupTask("dados", resources.engine)],
+        [
+            WarmupTask("métricas por projeto", resources.project_metrics),
+            WarmupTask("cubo ano/tipo", resources.year_cube),
+            WarmupTask("série mensal (período padrão)", resources.monthly_series),
+            WarmupTask("modelo de preços", resources.pricing),
+            WarmupTask("segmentação padrão", lambda: resources.segmentation_engine().segment()),
+            WarmupTask("camadas do mapa", resources.geo_layer_cache),
+            WarmupTask("metodologias", resources.protocol_totals),
+            WarmupTask("índice de busca", resources.project_search),
+        ],
+        lambda: _year_tasks() + _map_tasks(),
+    ]
+
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+def finished():
+    """Se o pré-aquecimento do processo já terminou."""
+    return _warmer is not None and _warmer.done
+
+
+def start(stages=None):
+    """Inicia o pré-aquecimento uma única vez por processo e retorna o warmer."""
+    global _warmer
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = CacheWarmer(stages if stages is not None else default_stages()).start()
+        return _warmer